@@ -3,14 +3,32 @@ Subbrainarr Backend
 The brain that makes Subgen smart.
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+# First, so it can time every import after it
+from routers import diagnostics
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
+import asyncio
 import os
-from typing import List
 
-from routers import connection, hardware, logs, languages, settings, scanning, docker, github, community, tuning
+from routers import shared_state, workers
+from routers.hardware_sampler import sampler as hardware_sampler
+from routers.compression import CompressionMiddleware
+from routers import metrics
+from routers.loop_watchdog import RouteTrackingMiddleware, watchdog as loop_watchdog
+from routers.ws_hub import hub
+from routers import ws_topics
+# Routers are imported eagerly: FastAPI needs every route registered before the
+# first request (and for /docs), and together they cost ~150 ms of a ~1 s import
+# that is mostly FastAPI/pydantic itself. Only imports that are slow *and* not
+# needed to declare routes are deferred — the Docker SDK, imported on first use
+# in routers/docker.py and routers/logs.py. /api/diagnostics/startup shows where
+# the time goes.
+from routers import connection, hardware, logs, languages, settings, scanning, docker, github, community, tuning, hallucinations, postprocess, retiming, telemetry, storage_bench, health_monitor, profiling, frontend
+
+diagnostics.mark("imports")
 
 app = FastAPI(
     title="Subbrainarr API",
@@ -30,30 +48,67 @@ app.add_middleware(
     allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
+# brotli/gzip for large responses (log text, the language list)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(diagnostics.FirstRequestMiddleware)
+# Only does work while an admin profiling session runs
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(RouteTrackingMiddleware)
+# Outermost, so latency includes compression and the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
 
-# WebSocket connection manager for live updates
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Live updates over WebSocket.
+# Each uvicorn worker only holds its own sockets, so hub.broadcast() goes through
+# the shared event log and every worker relays it to its local clients.
+# General broadcasts reach every client; topic updates only reach subscribers.
+# Periodic samples are lossy: slow clients skip some rather than stall.
+def _relay_broadcasts(channel: str, payload: dict):
+    if channel == "broadcast":
+        hub.broadcast_local(payload)
+    elif channel == "telemetry":
+        telemetry.store.add(payload)
+        hub.publish("telemetry", {"type": "telemetry", "sample": payload}, lossy=True)
+        for note in payload.get("annotations", []):
+            if note["kind"] == "jobs":
+                metrics.record_jobs_annotation(note)
+                hub.publish("jobs", {"type": "jobs", **note})
+    elif channel == "health":
+        events = health_monitor.store.apply(payload)
+        hub.publish("health", {"type": "health", "probe": payload}, lossy=True)
+        for event in events:
+            hub.publish("health", {"type": "health_event", "event": event})
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+@app.on_event("startup")
+async def start_background_tasks():
+    loop_watchdog.start(asyncio.get_running_loop())
+    app.state.background_tasks = [
+        asyncio.create_task(shared_state.tail_events(_relay_broadcasts)),
+        asyncio.create_task(postprocess.watch_loop()),
+        asyncio.create_task(hardware_sampler.run()),
+        asyncio.create_task(telemetry.sampler.run()),
+        asyncio.create_task(health_monitor.run()),
+        asyncio.create_task(metrics.measure_loop_lag()),
+        asyncio.create_task(metrics.textfile_loop()),
+    ]
+    diagnostics.mark("startup")
+    diagnostics.print_startup_summary()
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
-
-manager = ConnectionManager()
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in app.state.background_tasks:
+        task.cancel()
+    loop_watchdog.stop()
+    workers.shutdown_process_pool()
 
 @app.get("/")
-async def root():
+async def root(request: Request):
+    """The dashboard when the frontend is built, else the API welcome"""
+    if frontend.available():
+        return await frontend.index(request)
+    return await api_root()
+
+@app.get("/api")
+async def api_root():
     """Welcome endpoint"""
     return {
         "message": "Subbrainarr API",
@@ -69,16 +124,18 @@ async def health_check():
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for live updates"""
-    await manager.connect(websocket)
+    """WebSocket endpoint for live updates; see routers/ws_topics.py for subscriptions"""
+    client = await hub.connect(websocket)
     try:
         while True:
-            # Keep connection alive, broadcast updates from other endpoints
             data = await websocket.receive_text()
-            # Echo back for now (will handle real updates later)
-            await websocket.send_json({"type": "pong", "message": "Brain is listening"})
+            hub.send(client, await ws_topics.handle_message(client, data))
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        # Any exit, not just a clean disconnect, or the client's writer and
+        # subscriptions (and the producers behind them) outlive the socket
+        hub.disconnect(client)
 
 # Include routers
 app.include_router(connection.router, prefix="/api/connection", tags=["connection"])
@@ -91,14 +148,30 @@ app.include_router(docker.router, prefix="/api/docker", tags=["docker"])
 app.include_router(github.router, prefix="/api/github", tags=["github"])
 app.include_router(community.router, prefix="/api/community", tags=["community"])
 app.include_router(tuning.router, prefix="/api/tuning", tags=["tuning"])
+app.include_router(hallucinations.router, prefix="/api/hallucinations", tags=["hallucinations"])
+app.include_router(postprocess.router, prefix="/api/postprocess", tags=["postprocess"])
+app.include_router(retiming.router, prefix="/api/retiming", tags=["retiming"])
+app.include_router(telemetry.router, prefix="/api/telemetry", tags=["telemetry"])
+app.include_router(storage_bench.router, prefix="/api/storage", tags=["storage"])
+app.include_router(health_monitor.router, prefix="/api/monitor", tags=["monitor"])
+app.include_router(diagnostics.router, prefix="/api/diagnostics", tags=["diagnostics"])
+app.include_router(profiling.router, prefix="/api/profiling", tags=["profiling"])
+app.include_router(metrics.router, tags=["metrics"])
+# Last: its catch-all route hands client-side routes to index.html
+app.include_router(frontend.router)
 
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 9001))
+    reload = os.getenv("DEBUG", "false").lower() == "true"
+    # Shared state lives in SQLite, so multiple workers stay consistent.
+    # uvicorn ignores workers when reload is on.
+    worker_count = 1 if reload else int(os.getenv("WORKERS", 1))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=os.getenv("DEBUG", "false").lower() == "true",
+        reload=reload,
+        workers=worker_count,
         log_level="info"
     )
\ No newline at end of file
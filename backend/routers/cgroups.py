@@ -0,0 +1,242 @@
+"""
+Container resource limits - what a container can actually use
+
+os.cpu_count() and /proc/meminfo report the host, not the container.
+A Subgen container limited to 4 CPUs on a 32-thread host that is told
+WHISPER_THREADS=32 spends its time being throttled. This reads the
+cgroup v1/v2 CPU quota, cpuset and memory limit of SubBrainArr's own
+container, and the same limits for Subgen's container from the Docker
+API (NanoCpus / CpuQuota / CpusetCpus / Memory).
+"""
+import math
+import os
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+# cgroup v1 reports "unlimited" memory as a huge page-aligned number
+_UNLIMITED_BYTES = 1 << 60
+
+_GB = 1024 ** 3
+
+
+class ContainerLimits(BaseModel):
+    source: str  # "cgroup v1", "cgroup v2", "docker" or "host"
+    host_cpus: int
+    cpuset_cpus: Optional[int] = None  # CPUs the container may be scheduled on
+    cpu_quota: Optional[float] = None  # CPUs worth of time per period
+    effective_cpus: float  # min of the above
+    memory_limit_gb: Optional[float] = None
+    memory_usage_gb: Optional[float] = None
+    host_memory_gb: Optional[float] = None
+
+
+def parse_cpuset(spec: str) -> Optional[int]:
+    """Count CPUs in a cpuset list like "0-3,8,10-11"."""
+    count = 0
+    for part in spec.strip().split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                low, high = part.split("-", 1)
+                count += int(high) - int(low) + 1
+            else:
+                int(part)
+                count += 1
+        except ValueError:
+            return None
+    return count or None
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _own_cgroup_paths() -> Dict[str, str]:
+    """controller -> cgroup path from /proc/self/cgroup ("" key for v2)."""
+    paths = {}
+    content = _read("/proc/self/cgroup") or ""
+    for line in content.splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+        for controller in parts[1].split(",") if parts[1] else [""]:
+            paths[controller] = parts[2]
+    return paths
+
+
+def _read_cgroup_file(directory: str, relative: str, name: str) -> Optional[str]:
+    """Read name from the process's own cgroup, falling back to the mount root.
+
+    Containers usually see their cgroup as the root of a namespaced mount;
+    without a cgroup namespace the full path is needed.
+    """
+    relative = relative.lstrip("/")
+    candidates = [os.path.join(directory, relative, name)] if relative else []
+    candidates.append(os.path.join(directory, name))
+    for path in candidates:
+        value = _read(path)
+        if value is not None:
+            return value
+    return None
+
+
+def _host_memory_gb() -> Optional[float]:
+    for line in (_read("/proc/meminfo") or "").splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) / (1024 * 1024)
+    return None
+
+
+def _v2_limits(path: str) -> Tuple[Optional[float], Optional[int], Optional[int], Optional[int]]:
+    """(cpu quota, cpuset count, memory limit bytes, memory usage bytes) for cgroup v2."""
+    quota = None
+    cpu_max = _read_cgroup_file(_CGROUP_ROOT, path, "cpu.max")
+    if cpu_max:
+        value, _, period = cpu_max.partition(" ")
+        if value != "max":
+            quota = int(value) / int(period or 100000)
+
+    cpuset = _read_cgroup_file(_CGROUP_ROOT, path, "cpuset.cpus.effective")
+    memory_max = _read_cgroup_file(_CGROUP_ROOT, path, "memory.max")
+    memory_current = _read_cgroup_file(_CGROUP_ROOT, path, "memory.current")
+    return (
+        quota,
+        parse_cpuset(cpuset) if cpuset else None,
+        int(memory_max) if memory_max and memory_max != "max" else None,
+        int(memory_current) if memory_current else None,
+    )
+
+
+def _v1_limits(paths: Dict[str, str]) -> Tuple[Optional[float], Optional[int], Optional[int], Optional[int]]:
+    """Same as _v2_limits for cgroup v1's per-controller hierarchies."""
+    quota = None
+    for directory in ("cpu,cpuacct", "cpu"):
+        root = os.path.join(_CGROUP_ROOT, directory)
+        cfs_quota = _read_cgroup_file(root, paths.get("cpu", ""), "cpu.cfs_quota_us")
+        if cfs_quota is None:
+            continue
+        cfs_period = _read_cgroup_file(root, paths.get("cpu", ""), "cpu.cfs_period_us")
+        if int(cfs_quota) > 0 and cfs_period:
+            quota = int(cfs_quota) / int(cfs_period)
+        break
+
+    cpuset_root = os.path.join(_CGROUP_ROOT, "cpuset")
+    cpuset = (
+        _read_cgroup_file(cpuset_root, paths.get("cpuset", ""), "cpuset.effective_cpus")
+        or _read_cgroup_file(cpuset_root, paths.get("cpuset", ""), "cpuset.cpus")
+    )
+
+    memory_root = os.path.join(_CGROUP_ROOT, "memory")
+    limit = _read_cgroup_file(memory_root, paths.get("memory", ""), "memory.limit_in_bytes")
+    usage = _read_cgroup_file(memory_root, paths.get("memory", ""), "memory.usage_in_bytes")
+    limit_bytes = int(limit) if limit else None
+    return (
+        quota,
+        parse_cpuset(cpuset) if cpuset else None,
+        limit_bytes if limit_bytes and limit_bytes < _UNLIMITED_BYTES else None,
+        int(usage) if usage else None,
+    )
+
+
+def _effective(host_cpus: int, cpuset: Optional[int], quota: Optional[float]) -> float:
+    candidates = [float(host_cpus)]
+    if cpuset:
+        candidates.append(float(cpuset))
+    if quota:
+        candidates.append(quota)
+    return round(min(candidates), 2)
+
+
+def own_limits() -> ContainerLimits:
+    """Limits of the container (or host) SubBrainArr runs in."""
+    host_cpus = os.cpu_count() or 1
+    host_memory = _host_memory_gb()
+    quota = cpuset = limit = usage = None
+    source = "host"
+
+    if os.path.exists(os.path.join(_CGROUP_ROOT, "cgroup.controllers")):
+        source = "cgroup v2"
+        quota, cpuset, limit, usage = _v2_limits(_own_cgroup_paths().get("", "/"))
+    elif os.path.isdir(os.path.join(_CGROUP_ROOT, "memory")) or os.path.isdir(os.path.join(_CGROUP_ROOT, "cpu")):
+        source = "cgroup v1"
+        quota, cpuset, limit, usage = _v1_limits(_own_cgroup_paths())
+
+    # The scheduler's view already accounts for cpusets and taskset
+    if hasattr(os, "sched_getaffinity"):
+        affinity = len(os.sched_getaffinity(0))
+        cpuset = min(cpuset, affinity) if cpuset else affinity
+
+    return ContainerLimits(
+        source=source,
+        host_cpus=host_cpus,
+        cpuset_cpus=cpuset,
+        cpu_quota=round(quota, 2) if quota else None,
+        effective_cpus=_effective(host_cpus, cpuset, quota),
+        memory_limit_gb=round(limit / _GB, 2) if limit else None,
+        memory_usage_gb=round(usage / _GB, 2) if usage else None,
+        host_memory_gb=round(host_memory, 2) if host_memory else None,
+    )
+
+
+def effective_cpu_count() -> int:
+    """Whole CPUs this process can keep busy (at least 1)."""
+    try:
+        return max(1, math.floor(own_limits().effective_cpus))
+    except Exception:
+        return max(1, os.cpu_count() or 1)
+
+
+def limits_from_docker(attrs: Dict, host_cpus: Optional[int] = None, host_memory_gb: Optional[float] = None) -> ContainerLimits:
+    """Limits from a `docker inspect` payload (container.attrs)."""
+    host_config = attrs.get("HostConfig") or {}
+    host_cpus = host_cpus or os.cpu_count() or 1
+
+    quota = None
+    if host_config.get("NanoCpus"):
+        quota = host_config["NanoCpus"] / 1e9
+    elif (host_config.get("CpuQuota") or 0) > 0:
+        quota = host_config["CpuQuota"] / (host_config.get("CpuPeriod") or 100000)
+
+    cpuset = parse_cpuset(host_config["CpusetCpus"]) if host_config.get("CpusetCpus") else None
+    memory = host_config.get("Memory") or None
+
+    return ContainerLimits(
+        source="docker",
+        host_cpus=host_cpus,
+        cpuset_cpus=cpuset,
+        cpu_quota=round(quota, 2) if quota else None,
+        effective_cpus=_effective(host_cpus, cpuset, quota),
+        memory_limit_gb=round(memory / _GB, 2) if memory else None,
+        host_memory_gb=round(host_memory_gb, 2) if host_memory_gb else None,
+    )
+
+
+def subgen_limits() -> Optional[ContainerLimits]:
+    """Limits of the Subgen container via the Docker socket, if reachable."""
+    from .logs import _get_docker_client, _SUBGEN_CONTAINER_NAMES
+
+    client = _get_docker_client()
+    if client is None:
+        return None
+    try:
+        info = client.info()
+        host_cpus = info.get("NCPU")
+        host_memory = info.get("MemTotal", 0) / _GB or None
+    except Exception:
+        host_cpus, host_memory = None, None
+
+    for name in _SUBGEN_CONTAINER_NAMES:
+        try:
+            container = client.containers.get(name)
+        except Exception:
+            continue
+        return limits_from_docker(container.attrs, host_cpus, host_memory)
+    return None
@@ -0,0 +1,126 @@
+"""
+Response compression - negotiated brotli/gzip for large API responses
+
+Log fetches are hundreds of KB of text and the language list is a large
+JSON array; over a VPN that is noticeably slow uncompressed. This ASGI
+middleware compresses complete responses above MIN_SIZE with the best
+encoding the client accepts: brotli (in requirements.txt; optional when
+running from a bare checkout), gzip otherwise.
+
+Left alone:
+  - responses that already carry a Content-Encoding (the precompressed
+    frontend files)
+  - streaming responses (NDJSON discovery, anything sent in several
+    body chunks) — buffering them would defeat the streaming
+  - content types that don't compress (images, audio, archives)
+"""
+import gzip
+import os
+from typing import List, Optional, Sequence, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5  # Higher levels cost far more CPU for a few percent
+
+_COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Encodings named in an Accept-Encoding header, minus those refused with q=0."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, offered: Optional[Sequence[str]] = None) -> Optional[str]:
+    """First of `offered` (preference order) the client accepts.
+
+    Defaults to what compress() can produce; the frontend passes the
+    precompressed variants it has on disk instead.
+    """
+    if offered is None:
+        offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    accepted = accepted_encodings(accept_encoding)
+    return next((encoding for encoding in offered if encoding in accepted), None)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def _send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            response_headers: List[Tuple[bytes, bytes]] = list(start.get("headers") or [])
+            names = {k.lower(): v for k, v in response_headers}
+            content_type = names.get(b"content-type", b"").decode("latin-1")
+            if (
+                message.get("more_body")
+                or b"content-encoding" in names
+                or len(body) < self.minimum_size
+                or not content_type.startswith(_COMPRESSIBLE)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            response_headers = [(k, v) for k, v in response_headers if k.lower() != b"content-length"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            vary = names.get(b"vary")
+            if vary is None:
+                response_headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                response_headers = [(k, v) for k, v in response_headers if k.lower() != b"vary"]
+                response_headers.append((b"vary", vary + b", Accept-Encoding"))
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, _send)
@@ -2,11 +2,16 @@
 Connection router - handles Subgen instance detection and connection
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
 import httpx
 import asyncio
+import json
+import re
+import time
 
-from .url_validation import validate_subgen_url
+from .url_validation import validate_subgen_url_async
+from .metrics import subgen_client
 
 router = APIRouter()
 
@@ -23,17 +28,26 @@ class ConnectionResult(BaseModel):
     device: str = None
     error: str = None
 
-async def test_subgen_connection(url: str) -> ConnectionResult:
+def version_from_text(text: str) -> str:
+    """Subgen version from its root page, or "Unknown"."""
+    text = text.lower()
+    if 'subgen' in text:
+        version_match = re.search(r'v?(\d{4}\.\d{2}\.\d+)', text)
+        if version_match:
+            return version_match.group(1)
+    return "Unknown"
+
+async def test_subgen_connection(url: str, timeout: float = 10.0) -> ConnectionResult:
     """Test connection to a Subgen instance and get version info"""
     # Validate URL to prevent SSRF
-    valid, result = validate_subgen_url(url)
+    valid, result = await validate_subgen_url_async(url)
     if not valid:
         return ConnectionResult(success=False, url=url, error=result)
 
     url = result  # Use the cleaned URL
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with subgen_client(timeout=timeout) as client:
             # Test basic connection
             response = await client.get(url)
             response.raise_for_status()
@@ -43,7 +57,7 @@ async def test_subgen_connection(url: str) -> ConnectionResult:
 
             # Method 1: Check if there's a version endpoint
             try:
-                version_response = await client.get(f"{url}/version", timeout=3.0)
+                version_response = await client.get(f"{url}/version", timeout=min(3.0, timeout))
                 if version_response.status_code == 200:
                     version_data = version_response.json()
                     if isinstance(version_data, dict) and 'version' in version_data:
@@ -54,12 +68,7 @@ async def test_subgen_connection(url: str) -> ConnectionResult:
             # Method 2: Check common version patterns in response
             if version == "Unknown":
                 try:
-                    response_text = response.text.lower()
-                    if 'subgen' in response_text:
-                        import re
-                        version_match = re.search(r'v?(\d{4}\.\d{2}\.\d+)', response_text)
-                        if version_match:
-                            version = version_match.group(1)
+                    version = version_from_text(response.text)
                 except Exception:
                     pass
 
@@ -114,28 +123,53 @@ async def test_connection(conn: ConnectionTest):
     return result
 
 @router.get("/auto-detect")
-async def auto_detect():
+async def auto_detect(refresh: bool = False):
     """
-    Auto-detect Subgen instances on common ports
+    Auto-detect Subgen instances on common ports plus configured hosts/subnets.
+    Waits for the whole sweep; /discover streams results as they arrive.
     """
-    common_urls = [
-    "http://subgen:9000",                      # Docker same network
-    "http://host.docker.internal:9000",        # Host Docker default
-    "http://host.docker.internal:9007",        # Host production Subgen
-    "http://host.docker.internal:9919",        # Host test Subgen
-    "http://172.17.0.1:9000",                  # Docker bridge default
-    "http://172.17.0.1:9007",                  # Docker bridge production
-    "http://172.17.0.1:9919",                  # Docker bridge test
-]
+    from .discovery import DEFAULT_HOSTS, discover, discovery_candidates
 
+    default_prefixes = tuple(f"http://{host}:" for host in DEFAULT_HOSTS)
     results = []
+    async for url, result in discover(discovery_candidates(), refresh):
+        if result is not None and result.success:
+            results.append(result)
+        elif url.startswith(default_prefixes):
+            # Keep reporting the well-known addresses like before; failures
+            # across a whole subnet would just be noise
+            results.append(result or ConnectionResult(success=False, url=url, error="Could not connect. Is Subgen running?"))
 
-    # Test all URLs concurrently
-    tasks = [test_subgen_connection(url) for url in common_urls]
-    results = await asyncio.gather(*tasks)
-
-    # Return all results
     return {
         "found": [r for r in results if r.success],
         "tested": results
     }
+
+@router.get("/discover")
+async def discover_instances(refresh: bool = False):
+    """
+    Stream discovery as NDJSON: a "start" line, one "result" line per
+    Subgen instance as soon as it answers, then a "done" summary.
+    """
+    from .discovery import discover, discovery_candidates
+
+    urls = discovery_candidates()
+
+    async def _lines():
+        started = time.monotonic()
+        found = checked = 0
+        yield json.dumps({"type": "start", "candidates": len(urls)}) + "\n"
+        async for url, result in discover(urls, refresh):
+            checked += 1
+            if result is None or not result.success:
+                continue
+            found += 1
+            yield json.dumps({"type": "result", **result.dict()}) + "\n"
+        yield json.dumps({
+            "type": "done",
+            "checked": checked,
+            "found": found,
+            "elapsed_seconds": round(time.monotonic() - started, 2),
+        }) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
@@ -0,0 +1,142 @@
+"""
+Diagnostics router - where does startup time go?
+
+The container restarts on every config change and the Docker healthcheck
+starts probing 5 s in, so cold start matters. Imported first thing in
+main.py, this module times the import of every routers.* module and of
+the heavy third-party packages (inclusive of whatever they import), then
+records when the app finished startup and when the first request came
+in, measured from process start.
+"""
+import importlib.abc
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+# Top-level packages worth timing besides our own routers
+_TIMED_PACKAGES = {"fastapi", "starlette", "pydantic", "httpx", "uvicorn", "docker", "orjson", "yaml"}
+
+_imported_at = time.time()
+_import_ms: Dict[str, float] = {}
+_marks: Dict[str, float] = {}
+_first_request: Dict[str, Any] = {}
+
+
+def process_start_time() -> float:
+    """Unix time the process started (Linux), else when this module loaded."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, counted after the parenthesised command name
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _imported_at
+
+
+_process_started = process_start_time()
+
+
+class _TimedLoader:
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _import_ms[self._name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Wraps the loader of timed modules; finding is left to the normal finders."""
+
+    def find_spec(self, fullname, path, target=None):
+        if not (fullname.startswith("routers.") or fullname in _TIMED_PACKAGES):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, fullname)
+                return spec
+        return None
+
+
+if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+    sys.meta_path.insert(0, _ImportTimer())
+
+# Imported after the timer is installed so FastAPI's own import is measured
+from fastapi import APIRouter  # noqa: E402
+
+router = APIRouter()
+
+
+def mark(name: str):
+    """Record a startup milestone; the first call for a name wins."""
+    _marks.setdefault(name, time.time())
+
+
+class FirstRequestMiddleware:
+    """Notes the first HTTP request, then only costs one dict check."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not _first_request:
+            _first_request.update({"t": time.time(), "path": scope.get("path")})
+        await self.app(scope, receive, send)
+
+
+def _since_start(t: Optional[float]) -> Optional[float]:
+    return round((t - _process_started) * 1000, 1) if t else None
+
+
+def startup_report() -> Dict[str, Any]:
+    routers_ms = {k: v for k, v in _import_ms.items() if k.startswith("routers.")}
+    return {
+        "process_started": _process_started,
+        "imports_done_ms": _since_start(_marks.get("imports")),
+        "startup_complete_ms": _since_start(_marks.get("startup")),
+        "first_request_ms": _since_start(_first_request.get("t")),
+        "first_request_path": _first_request.get("path"),
+        # Inclusive times: a router that imports httpx first pays for it
+        "router_imports_ms": dict(sorted(routers_ms.items(), key=lambda item: item[1], reverse=True)),
+        "package_imports_ms": {k: v for k, v in _import_ms.items() if k in _TIMED_PACKAGES},
+    }
+
+
+def print_startup_summary():
+    report = startup_report()
+    slowest = ", ".join(f"{k.removeprefix('routers.')} {v} ms" for k, v in list(report["router_imports_ms"].items())[:3])
+    print(
+        f"Startup: imports done {report['imports_done_ms']} ms, "
+        f"ready {report['startup_complete_ms']} ms after process start (slowest routers: {slowest})"
+    )
+
+
+@router.get("/startup")
+async def get_startup_report():
+    """Import times and time to startup/first request since process start."""
+    return startup_report()
+
+
+@router.get("/loop-stalls")
+async def get_loop_stalls(limit: int = 20):
+    """Times the event loop was blocked, where, and on behalf of which route."""
+    from .loop_watchdog import watchdog
+
+    return watchdog.report(limit)
@@ -0,0 +1,159 @@
+"""
+Subgen discovery - find instances on the network quickly
+
+Candidates are host × port pairs from the well-known Docker addresses,
+the hosts/CIDRs in settings.discovery_hosts and (optionally) the
+container's own local subnets, so a macvlan or custom bridge network is
+covered without typing every address.
+
+Each candidate first gets a plain TCP connect with a short timeout —
+closed ports on a /24 fail in milliseconds instead of tying up an HTTP
+client for 10 s. Only open ports get the full Subgen probe. Probes run
+with bounded concurrency and results are yielded as they complete, so
+the UI can show instances while the rest of the sweep is still running.
+Results are cached for a short TTL, negative ones included.
+"""
+import asyncio
+import ipaddress
+import socket
+import struct
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .url_validation import validate_subgen_url_async
+
+DEFAULT_HOSTS = ["subgen", "host.docker.internal", "172.17.0.1"]
+DEFAULT_PORTS = [9000, 9007, 9919]
+
+CONNECT_TIMEOUT_SECONDS = 0.5
+PROBE_TIMEOUT_SECONDS = 3.0
+MAX_CONCURRENCY = 128
+CACHE_TTL_SECONDS = 60
+
+# Refuse to sweep more than a /22 per CIDR entry
+_MAX_HOSTS_PER_NETWORK = 1024
+
+# url -> (checked at, ConnectionResult or None if the port was closed)
+_cache: Dict[str, Tuple[float, Optional[object]]] = {}
+
+
+def local_subnets() -> List[str]:
+    """Directly connected IPv4 subnets from /proc/net/route (Linux only)."""
+    subnets = []
+    try:
+        with open("/proc/net/route") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                destination, gateway, mask = fields[1], fields[2], fields[7]
+                # Connected routes have no gateway; skip the default route
+                if gateway != "00000000" or destination == "00000000":
+                    continue
+                network = ipaddress.IPv4Network(
+                    (socket.inet_ntoa(struct.pack("<L", int(destination, 16))),
+                     bin(int(mask, 16)).count("1")),
+                    strict=False,
+                )
+                if network.prefixlen >= 22:
+                    subnets.append(str(network))
+    except (OSError, ValueError, StopIteration):
+        pass
+    return subnets
+
+
+def expand_hosts(entries: List[str]) -> List[str]:
+    """Hostnames pass through; CIDRs become their host addresses."""
+    hosts: List[str] = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "/" in entry:
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+            if network.num_addresses > _MAX_HOSTS_PER_NETWORK + 2:
+                print(f"Discovery: skipping {entry}, larger than /22")
+                continue
+            hosts.extend(str(ip) for ip in network.hosts())
+        else:
+            hosts.append(entry)
+    return list(dict.fromkeys(hosts))
+
+
+def candidate_urls(extra_hosts: List[str], ports: List[int], include_local: bool) -> List[str]:
+    hosts = list(DEFAULT_HOSTS) + list(extra_hosts)
+    if include_local:
+        hosts += local_subnets()
+    urls = []
+    for host in expand_hosts(hosts):
+        display = f"[{host}]" if ":" in host else host
+        for port in ports or DEFAULT_PORTS:
+            urls.append(f"http://{display}:{port}")
+    return urls
+
+
+async def port_open(host: str, port: int, timeout: float = CONNECT_TIMEOUT_SECONDS) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def _probe(url: str, semaphore: asyncio.Semaphore):
+    """(url, ConnectionResult or None when nothing listens)."""
+    from urllib.parse import urlparse
+    from .connection import test_subgen_connection
+
+    cached = _cache.get(url)
+    if cached and time.monotonic() - cached[0] < CACHE_TTL_SECONDS:
+        return url, cached[1]
+
+    parsed = urlparse(url)
+    async with semaphore:
+        if await port_open(parsed.hostname, parsed.port):
+            result = await test_subgen_connection(url, timeout=PROBE_TIMEOUT_SECONDS)
+        else:
+            result = None
+    _cache[url] = (time.monotonic(), result)
+    return url, result
+
+
+async def discover(urls: List[str], refresh: bool = False) -> AsyncIterator[Tuple[str, Optional[object]]]:
+    """Yield (url, ConnectionResult or None) as each candidate finishes."""
+    if refresh:
+        for url in urls:
+            _cache.pop(url, None)
+
+    valid_urls = []
+    for url in urls:
+        valid, cleaned = await validate_subgen_url_async(url)
+        if valid:
+            valid_urls.append(cleaned)
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    tasks = [asyncio.create_task(_probe(url, semaphore)) for url in valid_urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def discovery_candidates() -> List[str]:
+    from .settings import load_settings
+
+    settings = load_settings()
+    return candidate_urls(
+        settings.discovery_hosts,
+        settings.discovery_ports,
+        settings.discovery_scan_local_subnets,
+    )
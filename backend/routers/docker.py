@@ -4,7 +4,6 @@ Docker integration - read volumes and suggest path mappings
 from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import List, Optional
-import docker
 import os
 
 router = APIRouter()
@@ -24,6 +23,10 @@ def get_subgen_volumes() -> List[VolumeMapping]:
     """
     volumes = []
 
+    # Imported on first use: the SDK (and requests under it) is a large
+    # share of startup time and most page loads never touch Docker
+    import docker
+
     try:
         # Connect to Docker and get the subgen container
         client = docker.from_env()
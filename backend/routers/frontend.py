@@ -0,0 +1,109 @@
+"""
+Frontend - serve the built dashboard from the API process
+
+The Docker image already contains frontend/dist; serving it here means
+no separate web server container. Vite content-hashes everything under
+/assets, so those files are cached forever (immutable). index.html
+changes with every build, so it is revalidated on each visit with an
+ETag and usually answered with an empty 304.
+
+The Docker build stores .br and .gz siblings next to each text asset;
+the smallest variant the browser accepts is sent as-is, so nothing is
+compressed per request. Files go out through FileResponse, which reads
+them in chunks on a worker thread: uvicorn has no sendfile path, so this
+is not zero-copy, but the precompressed variants keep the reads small.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from .compression import choose_encoding
+
+router = APIRouter()
+
+DIST_DIR = os.path.realpath(os.getenv(
+    "FRONTEND_DIST",
+    os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "dist"),
+))
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+
+# Preference order when the browser accepts several
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# path -> (mtime, size, etag)
+_etags: Dict[str, Tuple[float, int, str]] = {}
+
+
+def available() -> bool:
+    return os.path.isfile(os.path.join(DIST_DIR, "index.html"))
+
+
+def _resolve(relative: str) -> Optional[str]:
+    """Absolute path of a file inside DIST_DIR, or None (also for ../ tricks)."""
+    path = os.path.realpath(os.path.join(DIST_DIR, relative))
+    if not path.startswith(DIST_DIR + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def _etag(path: str) -> str:
+    """Content hash of path, recomputed only when it changes. Blocking: call via to_thread."""
+    stat = os.stat(path)
+    cached = _etags.get(path)
+    if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        etag = '"' + hashlib.sha1(f.read()).hexdigest()[:20] + '"'
+    _etags[path] = (stat.st_mtime, stat.st_size, etag)
+    return etag
+
+
+async def serve_file(request: Request, path: str, cache_control: str) -> Response:
+    """Send path (or a precompressed sibling) with caching headers."""
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    sent = path
+    offered = [encoding for encoding, suffix in _ENCODINGS if os.path.isfile(path + suffix)]
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""), offered)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        sent = path + dict(_ENCODINGS)[encoding]
+
+    if cache_control == _REVALIDATE:
+        # Per variant: a cached gzip body must not satisfy a br request
+        etag = await asyncio.to_thread(_etag, sent)
+        headers["ETag"] = etag
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+
+    # media_type from the original name, not .br/.gz
+    return FileResponse(sent, headers=headers, media_type=mimetypes.guess_type(path)[0])
+
+
+async def index(request: Request) -> Response:
+    return await serve_file(request, os.path.join(DIST_DIR, "index.html"), _REVALIDATE)
+
+
+@router.get("/assets/{asset_path:path}", include_in_schema=False)
+async def asset(asset_path: str, request: Request):
+    path = _resolve(os.path.join("assets", asset_path))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return await serve_file(request, path, _IMMUTABLE)
+
+
+@router.get("/{spa_path:path}", include_in_schema=False)
+async def spa(spa_path: str, request: Request):
+    """Top-level files from dist (icons, manifest), else index.html for client-side routes."""
+    if spa_path.startswith("api/") or spa_path == "ws" or not available():
+        raise HTTPException(status_code=404, detail="Not found")
+    path = _resolve(spa_path) if spa_path else None
+    if path is None:
+        return await index(request)
+    return await serve_file(request, path, _REVALIDATE)
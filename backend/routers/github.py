@@ -4,6 +4,7 @@ GitHub integration - fetch repo stats for social proof
 from fastapi import APIRouter
 import httpx
 from typing import Optional
+from .route_cache import cached_route
 
 router = APIRouter()
 
@@ -11,6 +12,8 @@ GITHUB_REPO = "coaxk/subbrainarr"
 GITHUB_API_URL = f"https://api.github.com/repos/{GITHUB_REPO}"
 
 @router.get("/stars")
+# Unauthenticated GitHub API calls are limited to 60 an hour
+@cached_route(ttl=600, stale=3600, cache_if=lambda r: "error" not in r)
 async def get_github_stars():
     """
     Fetch current GitHub star count
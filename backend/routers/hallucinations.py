@@ -0,0 +1,503 @@
+"""
+Hallucination scanner - find Whisper's "Thank you for watching" cues
+
+Whisper fills silence with phrases it saw in training data: YouTube
+outros, subtitle credits, music notes. This router scans every subtitle
+file under the media mount and flags cues that:
+
+  phrase   — contain a known hallucination phrase for the language
+             (matched with an Aho-Corasick automaton, all phrases in one pass)
+  silence  — sit alone in a long gap with no dialogue on either side
+  repeat   — repeat the previous cue verbatim (Whisper's decoding loops)
+  noise    — consist only of symbols ("...", "♪ ♪")
+
+Phrases are picked by the language of the subtitle text, not the audio:
+translated output of Japanese audio gets the English list. Only Subgen's
+own output is scanned by default; human-made subs aren't hallucinations.
+
+Scans run across all cores and are incremental: files whose mtime and
+size are unchanged since the last scan reuse their cached result, as
+long as the phrase list and gap setting they were scanned with are too.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import deque
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from . import shared_state
+from .language_routing import subtitle_text_language
+from .subtitles import Cue, find_subtitle_files, is_subgen_output, iter_cues
+
+router = APIRouter()
+
+# Known Whisper hallucinations per language. "*" applies to every file.
+# User additions come from settings.hallucination_phrases. Post-processing
+# deletes cues from this list, so it only holds phrases that are never
+# ordinary dialogue — no "good night", "to be continued" or "translated by".
+DEFAULT_PHRASES: Dict[str, List[str]] = {
+    "*": [
+        "amara org",
+        "www mooji org",
+    ],
+    "en": [
+        "thank you for watching",
+        "thanks for watching",
+        "thank you so much for watching",
+        "subscribe to our channel",
+        "please subscribe",
+        "like and subscribe",
+        "don't forget to subscribe",
+        "see you in the next video",
+        "subtitles by",
+        "transcribed by",
+        "captions by",
+    ],
+    "de": [
+        "untertitel im auftrag des zdf",
+        "untertitelung im auftrag des zdf",
+        "untertitel der amara org community",
+        "vielen dank fürs zuschauen",
+        "danke fürs zuschauen",
+    ],
+    "fr": [
+        "sous titres réalisés par",
+        "sous titrage st 501",
+        "merci d'avoir regardé",
+        "abonnez vous",
+    ],
+    "es": [
+        "gracias por ver",
+        "subtítulos realizados por la comunidad de amara org",
+        "suscríbete",
+    ],
+    "it": [
+        "grazie per la visione",
+        "sottotitoli creati dalla comunità amara org",
+        "iscriviti al canale",
+    ],
+    "nl": [
+        "bedankt voor het kijken",
+        "ondertiteling tv",
+    ],
+    "pt": [
+        "obrigado por assistir",
+        "legendas pela comunidade amara org",
+        "inscreva se no canal",
+    ],
+    "ru": [
+        "спасибо за просмотр",
+        "субтитры сделал",
+        "редактор субтитров",
+    ],
+    "ja": [
+        "ご視聴ありがとうございました",
+        "チャンネル登録",
+    ],
+    "ko": [
+        "시청해주셔서 감사합니다",
+        "구독과 좋아요",
+    ],
+    "zh": [
+        "谢谢观看",
+        "字幕由",
+        "请不吝点赞 订阅 转发",
+        "明镜与点点栏目",
+    ],
+}
+
+# Cache namespace in shared_state.file_cache
+CACHE_NAMESPACE = "hallucinations"
+
+# Flagged cues kept per file in reports — enough to eyeball, not the whole file
+_SAMPLES_PER_FILE = 20
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, drop punctuation and collapse whitespace for matching."""
+    text = unicodedata.normalize("NFKC", text).casefold().replace("'", "").replace("’", "")
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def _is_spaced_script(char: str) -> bool:
+    """True for scripts that separate words with spaces (so boundaries matter)."""
+    return ord(char) < 0x2E80
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over normalized phrases.
+
+    Finds every phrase occurring in a text in a single pass, regardless of
+    how many phrases are configured. For spaced scripts a match must sit on
+    word boundaries, so "subtitles by" doesn't fire inside other words.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for phrase in sorted(set(filter(None, (normalize_text(p) for p in phrases)))):
+            self._insert(phrase, len(self.phrases))
+            self.phrases.append(phrase)
+        self._build_failure_links()
+
+    def _insert(self, phrase: str, index: int):
+        node = 0
+        for char in phrase:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, normalized: str) -> Set[str]:
+        """Return the phrases found in already-normalized text."""
+        found: Set[str] = set()
+        node = 0
+        for position, char in enumerate(normalized):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._out[node]:
+                phrase = self.phrases[index]
+                start = position - len(phrase) + 1
+                if _is_spaced_script(phrase[0]) and start > 0 and normalized[start - 1] != " ":
+                    continue
+                end = position + 1
+                if _is_spaced_script(phrase[-1]) and end < len(normalized) and normalized[end] != " ":
+                    continue
+                found.add(phrase)
+        return found
+
+
+def phrases_for(language: Optional[str], extra: Dict[str, List[str]]) -> List[str]:
+    """Phrase list for a language: defaults + user additions + universal ones.
+
+    Files of unknown language are matched against every language's list.
+    """
+    sources = [DEFAULT_PHRASES, extra]
+    phrases: List[str] = []
+    for source in sources:
+        phrases.extend(source.get("*", []))
+        if language is None:
+            for code, items in source.items():
+                if code != "*":
+                    phrases.extend(items)
+        else:
+            phrases.extend(source.get(language, []))
+    return phrases
+
+
+def flag_cues(cues: List[Cue], matcher: PhraseMatcher, gap_seconds: float) -> List[Tuple[int, List[str], List[str]]]:
+    """Flag hallucinated cues. Returns (cue index, reasons, matched phrases)."""
+    flagged = []
+    normalized = [normalize_text(cue.text) for cue in cues]
+    for index, cue in enumerate(cues):
+        reasons: List[str] = []
+        text = normalized[index]
+
+        matches = matcher.find(text) if text else set()
+        if matches:
+            reasons.append("phrase")
+
+        if not text and cue.lines:
+            reasons.append("noise")
+
+        if index > 0 and text and text == normalized[index - 1]:
+            reasons.append("repeat")
+
+        gap_before = cue.start - cues[index - 1].end if index > 0 else cue.start
+        gap_after = cues[index + 1].start - cue.end if index + 1 < len(cues) else gap_seconds
+        if gap_before >= gap_seconds and gap_after >= gap_seconds:
+            reasons.append("silence")
+
+        # Isolated cues alone are normal (a single line after a pause);
+        # they only count when something else about them is off
+        if reasons and reasons != ["silence"]:
+            flagged.append((index, reasons, sorted(matches)))
+    return flagged
+
+
+_matcher_cache: Dict[Tuple[Optional[str], int], PhraseMatcher] = {}
+
+
+def matcher_for(language: Optional[str], extra: Dict[str, List[str]]) -> PhraseMatcher:
+    # Built once per language per worker process, not per file
+    key = (language, hash(tuple(sorted((k, tuple(v)) for k, v in extra.items()))))
+    if key not in _matcher_cache:
+        _matcher_cache[key] = PhraseMatcher(phrases_for(language, extra))
+    return _matcher_cache[key]
+
+
+def scan_fingerprint(language: Optional[str], extra: Dict[str, List[str]], gap_seconds: float) -> str:
+    """Hash of the effective phrase list and gap; cached results must match it."""
+    phrases = matcher_for(language, extra).phrases
+    return hashlib.sha1(json.dumps([phrases, gap_seconds]).encode()).hexdigest()[:16]
+
+
+def scan_file(path: str, language: Optional[str], extra: Dict[str, List[str]], gap_seconds: float) -> Dict:
+    """Scan one subtitle file. Returns a JSON-able per-file result."""
+    cues = list(iter_cues(path))
+    flagged = flag_cues(cues, matcher_for(language, extra), gap_seconds)
+    return {
+        "language": language,
+        "fingerprint": scan_fingerprint(language, extra, gap_seconds),
+        "cues": len(cues),
+        "flagged": len(flagged),
+        "samples": [
+            {
+                "index": index,
+                "start": round(cues[index].start, 2),
+                "text": cues[index].text[:120],
+                "reasons": reasons,
+                "phrases": phrases,
+            }
+            for index, reasons, phrases in flagged[:_SAMPLES_PER_FILE]
+        ],
+    }
+
+
+def scan_files(items: List[Tuple[str, Optional[str], float, int]], extra: Dict[str, List[str]], gap_seconds: float) -> List[Tuple]:
+    """Pool worker: scan (path, language, mtime, size) items."""
+    results = []
+    for path, language, mtime, size in items:
+        try:
+            results.append((path, mtime, size, scan_file(path, language, extra, gap_seconds)))
+        except (OSError, UnicodeError, ValueError) as e:
+            results.append((path, mtime, size, {"language": language, "error": str(e), "cues": 0, "flagged": 0, "samples": []}))
+    return results
+
+
+def build_report(results: Dict[str, Dict], top: int = 50) -> Dict:
+    """Aggregate per-file results into per-language rates and worst files."""
+    per_language: Dict[str, Dict] = {}
+    files = []
+    for path, result in results.items():
+        if result.get("error"):
+            continue
+        lang = result.get("language") or "unknown"
+        entry = per_language.setdefault(lang, {"files": 0, "files_affected": 0, "cues": 0, "flagged": 0})
+        entry["files"] += 1
+        entry["cues"] += result["cues"]
+        entry["flagged"] += result["flagged"]
+        if result["flagged"]:
+            entry["files_affected"] += 1
+            files.append({
+                "path": path,
+                "language": lang,
+                "cues": result["cues"],
+                "flagged": result["flagged"],
+                "rate": round(result["flagged"] / result["cues"], 4) if result["cues"] else 0.0,
+                "samples": result["samples"],
+            })
+
+    for entry in per_language.values():
+        entry["rate"] = round(entry["flagged"] / entry["cues"], 4) if entry["cues"] else 0.0
+
+    files.sort(key=lambda f: (f["flagged"], f["rate"]), reverse=True)
+    return {"languages": per_language, "worst_files": files[:top]}
+
+
+class ScanRequest(BaseModel):
+    directory: str = "/media"
+    force: bool = False  # Ignore the mtime cache and rescan everything
+    only_subgen_files: bool = True  # Skip human-made and downloaded subs
+
+class ScanStatus(BaseModel):
+    state: str  # idle, running, done, error
+    directory: Optional[str] = None
+    files_total: int = 0
+    files_done: int = 0
+    files_cached: int = 0
+    started: Optional[float] = None
+    updated: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+
+_STATUS_KEY = "hallucination_scan_status"
+# One scan per deployment; renewed per chunk, so a dead worker's lease lapses
+_LEASE_NAME = "hallucination_scan"
+_LEASE_SECONDS = 600
+_scan_task: Optional[asyncio.Task] = None
+
+
+async def _save_status(status: ScanStatus):
+    status.updated = time.time()
+    await shared_state.set_value_async(_STATUS_KEY, status.dict())
+
+
+def _list_files(directory: str, folder_languages: Dict[str, str], settings,
+                only_subgen: bool = True) -> List[Tuple[str, Optional[str], float, int]]:
+    items = []
+    for path in find_subtitle_files(directory):
+        if only_subgen and not is_subgen_output(path):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        items.append((path, subtitle_text_language(path, folder_languages, settings), st.st_mtime, st.st_size))
+    return items
+
+
+async def _renew_lease(owner: str) -> bool:
+    return await asyncio.to_thread(shared_state.try_acquire_lease, _LEASE_NAME, owner, _LEASE_SECONDS)
+
+
+async def run_scan(directory: str, force: bool = False, only_subgen: bool = True) -> Optional[Dict]:
+    """Scan a library, reusing cached results for unchanged files.
+
+    Returns None without touching the cache, report or status if another
+    worker took the scan lease meanwhile (e.g. this one stalled past it).
+    """
+    from .language_routing import cached_folder_languages
+    from .settings import load_settings
+    from .workers import iter_chunk_results
+
+    settings = load_settings()
+    status = ScanStatus(state="running", directory=directory, started=time.time())
+
+    folder_languages = await asyncio.to_thread(cached_folder_languages)
+    items = await asyncio.to_thread(_list_files, directory, folder_languages, settings, only_subgen)
+    cache = {} if force else await asyncio.to_thread(shared_state.get_file_cache, CACHE_NAMESPACE)
+
+    fingerprints: Dict[Optional[str], str] = {}
+    results: Dict[str, Dict] = {}
+    todo = []
+    for item in items:
+        path, language, mtime, size = item
+        if language not in fingerprints:
+            fingerprints[language] = scan_fingerprint(language, settings.hallucination_phrases, settings.hallucination_gap_seconds)
+        cached = cache.get(path)
+        if (
+            cached and cached[0] == mtime and cached[1] == size
+            and cached[2].get("language") == language
+            and cached[2].get("fingerprint") == fingerprints[language]
+        ):
+            results[path] = cached[2]
+        else:
+            todo.append(item)
+
+    status.files_total = len(items)
+    status.files_cached = len(results)
+    status.files_done = len(results)
+    await _save_status(status)
+
+    owner = shared_state.worker_id()
+    worker = partial(scan_files, extra=settings.hallucination_phrases, gap_seconds=settings.hallucination_gap_seconds)
+    chunks = iter_chunk_results(worker, todo, chunk_size=128)
+    try:
+        async for chunk in chunks:
+            if not await _renew_lease(owner):
+                print(f"Hallucination scan of {directory} stopped: another worker holds the scan lease")
+                return None
+            await asyncio.to_thread(shared_state.put_file_cache, CACHE_NAMESPACE, chunk)
+            for path, _, _, result in chunk:
+                results[path] = result
+            status.files_done += len(chunk)
+            await _save_status(status)
+    finally:
+        await chunks.aclose()
+    if not await _renew_lease(owner):
+        print(f"Hallucination scan of {directory} stopped: another worker holds the scan lease")
+        return None
+
+    # Drop cache rows for files that no longer exist under this directory
+    prefix = directory.rstrip("/") + "/"
+    gone = [path for path in cache if path.startswith(prefix) and path not in results]
+    if gone:
+        await asyncio.to_thread(shared_state.delete_file_cache, CACHE_NAMESPACE, gone)
+
+    report = build_report(results)
+    report["directory"] = directory
+    report["files_scanned"] = len(results)
+    await shared_state.set_value_async("hallucination_report", report)
+
+    status.state = "done"
+    status.finished = time.time()
+    await _save_status(status)
+    return report
+
+
+async def _run_scan_job(directory: str, force: bool, only_subgen: bool):
+    try:
+        await run_scan(directory, force, only_subgen)
+    except Exception as e:
+        print(f"Hallucination scan failed: {e}")
+        await _save_status(ScanStatus(state="error", directory=directory, error=str(e), finished=time.time()))
+    finally:
+        await asyncio.to_thread(shared_state.release_lease, _LEASE_NAME, shared_state.worker_id())
+
+
+@router.post("/scan", response_model=ScanStatus)
+async def start_scan(request: ScanRequest):
+    """Start a background scan of every subtitle under directory."""
+    global _scan_task
+    if not os.path.isdir(request.directory):
+        raise HTTPException(status_code=400, detail=f"Directory not found: {request.directory}")
+
+    if _scan_task and not _scan_task.done():
+        raise HTTPException(status_code=409, detail="A scan is already running")
+    # Check-and-set across workers; the status key alone lets two workers both start
+    acquired = await asyncio.to_thread(shared_state.try_acquire_lease, _LEASE_NAME, shared_state.worker_id(), _LEASE_SECONDS)
+    if not acquired:
+        raise HTTPException(status_code=409, detail="A scan is already running")
+
+    status = ScanStatus(state="running", directory=request.directory, started=time.time())
+    await _save_status(status)
+    _scan_task = asyncio.create_task(_run_scan_job(request.directory, request.force, request.only_subgen_files))
+    return status
+
+
+@router.get("/status", response_model=ScanStatus)
+async def scan_status():
+    """Progress of the current or last scan."""
+    return ScanStatus(**await shared_state.get_value_async(_STATUS_KEY, {"state": "idle"}))
+
+
+@router.get("/report")
+async def scan_report():
+    """Per-language hallucination rates and the worst files from the last scan."""
+    report = await shared_state.get_value_async("hallucination_report")
+    if report is None:
+        return {"languages": {}, "worst_files": [], "message": "No scan has run yet"}
+    return report
+
+
+@router.get("/phrases")
+async def list_phrases(language: Optional[str] = None):
+    """Phrases checked for a language (defaults plus settings.hallucination_phrases)."""
+    from .settings import load_settings
+
+    extra = load_settings().hallucination_phrases
+    return {"language": language, "phrases": sorted(set(phrases_for(language, extra)))}
@@ -7,8 +7,10 @@ import subprocess
 import os
 import platform
 import shutil
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from .languages import DEFAULT_LANGUAGES
+from .cgroups import ContainerLimits, own_limits
+from .route_cache import cached_route
 
 router = APIRouter()
 
@@ -18,53 +20,142 @@ class StorageInfo(BaseModel):
     free: float   # GB
     type: Optional[str] = None  # "SSD" or "HDD"
 
+class GpuInfo(BaseModel):
+    index: int
+    name: str
+    total_memory: float  # GB
+    available_memory: float  # GB
+    utilization: Optional[float] = None  # %
+
 class HardwareInfo(BaseModel):
     device_type: str  # "cuda", "cpu", "mps"
     device_name: Optional[str] = None
-    total_memory: Optional[float] = None  # GPU VRAM in GB
-    available_memory: Optional[float] = None  # GPU VRAM free in GB
+    total_memory: Optional[float] = None  # GPU VRAM in GB (largest card - a model can't span GPUs)
+    available_memory: Optional[float] = None  # GPU VRAM free in GB (same card)
+    gpus: List[GpuInfo] = []  # Every detected GPU
     cpu_cores: Optional[int] = None
-    cpu_threads: Optional[int] = None
+    cpu_threads: Optional[int] = None  # Usable by this container (cgroup quota/cpuset)
+    host_cpu_threads: Optional[int] = None
     ram_total: Optional[float] = None  # System RAM in GB
     ram_available: Optional[float] = None  # System RAM free in GB
     platform: str
     platform_version: Optional[str] = None
     storage: Optional[StorageInfo] = None
+    container_limits: Optional[ContainerLimits] = None  # SubBrainArr's own container
+    subgen_limits: Optional[ContainerLimits] = None  # Subgen's container, via Docker
     recommendation: Optional[str] = None
 
-def detect_gpu() -> Dict[str, Any]:
-    """Detect NVIDIA GPU using nvidia-smi"""
+GPU_QUERY = ['nvidia-smi', '--query-gpu=index,name,memory.total,memory.free,utilization.gpu', '--format=csv,noheader,nounits']
+
+def _parse_float(value: str) -> Optional[float]:
     try:
-        result = subprocess.run(
-            ['nvidia-smi', '--query-gpu=name,memory.total,memory.free', '--format=csv,noheader,nounits'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode == 0:
-            line = result.stdout.strip().split('\n')[0]
-            name, total, free = [x.strip() for x in line.split(',')]
-            
-            total_gb = float(total) / 1024
-            free_gb = float(free) / 1024
-            
-            return {
-                "device_type": "cuda",
-                "device_name": name,
-                "total_memory": round(total_gb, 1),
-                "available_memory": round(free_gb, 1),
-                "recommendation": get_gpu_recommendation(total_gb)
-            }
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-        pass
-    
-    return None
+        return float(value)
+    except ValueError:
+        return None  # "[N/A]" on some cards
+
+def parse_gpu_output(stdout: str) -> Optional[Dict[str, Any]]:
+    """Turn nvidia-smi CSV output (one line per GPU) into HardwareInfo GPU fields"""
+    gpus = []
+    for line in stdout.strip().split('\n'):
+        try:
+            index, name, total, free, util = [x.strip() for x in line.split(',')[:5]]
+            gpus.append(GpuInfo(
+                index=int(index),
+                name=name,
+                total_memory=round(float(total) / 1024, 1),
+                available_memory=round(float(free) / 1024, 1),
+                utilization=_parse_float(util),
+            ))
+        except (ValueError, IndexError):
+            continue
+    if not gpus:
+        return None
+
+    largest = max(gpus, key=lambda g: g.total_memory)
+    names = [g.name for g in gpus]
+    if len(gpus) == 1:
+        device_name = names[0]
+    elif len(set(names)) == 1:
+        device_name = f"{len(gpus)}x {names[0]}"
+    else:
+        device_name = " + ".join(names)
+
+    return {
+        "device_type": "cuda",
+        "device_name": device_name,
+        "total_memory": largest.total_memory,
+        "available_memory": largest.available_memory,
+        "gpus": gpus,
+        "recommendation": get_gpu_recommendation(largest.total_memory)
+    }
+
+def plan_gpu_placement(gpus: List[GpuInfo], whisper_model: str, compute_type: str, beam_size: int = 5) -> List[Dict[str, Any]]:
+    """One Subgen instance per GPU, pinned with CUDA_VISIBLE_DEVICES"""
+    from .vram_model import max_concurrency
+
+    return [
+        {
+            "gpu_index": gpu.index,
+            "gpu_name": gpu.name,
+            "vram_gb": gpu.total_memory,
+            "cuda_visible_devices": str(gpu.index),
+            "concurrent_transcriptions": max_concurrency(gpu.total_memory, whisper_model, compute_type, beam_size),
+        }
+        for gpu in gpus
+    ]
+
+def subgen_capacity(hw: HardwareInfo) -> Dict[str, Any]:
+    """CPUs and RAM Subgen can actually use.
+
+    Subgen does the transcribing, so its container's limits matter more
+    than ours; fall back to our own when the Docker socket isn't mounted.
+    """
+    cpu_threads = hw.cpu_threads or os.cpu_count() or 4
+    ram_gb = hw.ram_available or hw.ram_total
+    source = "subbrainarr"
+    if hw.subgen_limits:
+        cpu_threads = max(1, int(hw.subgen_limits.effective_cpus))
+        if hw.subgen_limits.memory_limit_gb:
+            ram_gb = min(ram_gb, hw.subgen_limits.memory_limit_gb) if ram_gb else hw.subgen_limits.memory_limit_gb
+        source = "subgen"
+    return {"cpu_threads": cpu_threads, "ram_gb": ram_gb, "source": source}
+
+def tuned_defaults(hw: HardwareInfo) -> Dict[str, Any]:
+    """Model, compute type and VRAM/RAM-budgeted concurrency for this hardware"""
+    from .vram_model import auto_tune
+
+    is_cuda = hw.device_type == "cuda"
+    model = "large-v3" if is_cuda and hw.total_memory and hw.total_memory >= 10 else "medium"
+    compute_type = "float16" if is_cuda else "int8"
+    beam_size = 5 if is_cuda else 3
+    capacity = subgen_capacity(hw)
+    tuning = auto_tune(
+        hw.device_type,
+        hw.total_memory,
+        capacity["ram_gb"],
+        capacity["cpu_threads"],
+        model,
+        compute_type,
+        beam_size,
+    )
+    tuning["capacity"] = capacity
+    return {
+        "transcribe_device": "cuda" if is_cuda else "cpu",
+        "whisper_model": model,
+        "compute_type": compute_type,
+        "beam_size": beam_size,
+        "tuning": tuning,
+    }
 
 def detect_cpu() -> Dict[str, Any]:
     """Detect CPU info with detailed parsing"""
     try:
-        cpu_count = os.cpu_count() or 1
+        host_count = os.cpu_count() or 1
+        # A container limited to 4 CPUs can't use the host's 32 threads
+        try:
+            cpu_count = max(1, int(own_limits().effective_cpus))
+        except Exception:
+            cpu_count = host_count
         cpu_name = "Unknown CPU"
         
         # Detect CPU name based on platform
@@ -96,6 +187,7 @@ def detect_cpu() -> Dict[str, Any]:
             "device_name": cpu_name,
             "cpu_cores": cpu_count,
             "cpu_threads": cpu_count,
+            "host_cpu_threads": host_count,
             "recommendation": get_cpu_recommendation(cpu_count, cpu_name)
         }
     except Exception as e:
@@ -121,66 +213,56 @@ def detect_ram() -> Dict[str, Any]:
                     elif 'MemAvailable' in line:
                         mem_available = int(line.split()[1]) / (1024 * 1024)
                 
+                # Inside a container the cgroup memory limit is the real ceiling
+                try:
+                    limits = own_limits()
+                    if limits.memory_limit_gb:
+                        mem_total = min(mem_total, limits.memory_limit_gb)
+                        mem_available = min(mem_available, limits.memory_limit_gb - (limits.memory_usage_gb or 0))
+                except Exception:
+                    pass
+                
                 return {
                     "ram_total": round(mem_total, 1),
-                    "ram_available": round(mem_available, 1)
+                    "ram_available": round(max(mem_available, 0), 1)
                 }
     except:
         pass
     
     return {"ram_total": None, "ram_available": None}
 
-def detect_storage() -> Optional[StorageInfo]:
-    """Detect storage info for /subgen/models path"""
+def storage_path() -> str:
+    """Path whose disk we report - the Whisper models directory if mounted"""
+    return "/subgen/models" if os.path.exists("/subgen/models") else "/app"
+
+def disk_usage_info(path: str, storage_type: Optional[str] = None) -> Optional[StorageInfo]:
     try:
-        # Check the models directory (where Whisper models are stored)
-        path = "/subgen/models" if os.path.exists("/subgen/models") else "/app"
-        
         stat = shutil.disk_usage(path)
-        total_gb = stat.total / (1024**3)
-        used_gb = stat.used / (1024**3)
-        free_gb = stat.free / (1024**3)
-        
-        # Try to detect if SSD or HDD (Linux only)
-        storage_type = detect_storage_type(path)
-        
         return StorageInfo(
-            total=round(total_gb, 1),
-            used=round(used_gb, 1),
-            free=round(free_gb, 1),
+            total=round(stat.total / (1024**3), 1),
+            used=round(stat.used / (1024**3), 1),
+            free=round(stat.free / (1024**3), 1),
             type=storage_type
         )
-    except:
+    except OSError:
         return None
 
-def detect_storage_type(path: str) -> Optional[str]:
-    """Detect if storage is SSD or HDD (Linux only)"""
-    try:
-        if platform.system() != "Linux":
-            return None
-        
-        # Get the device for this path
-        result = subprocess.run(['df', path], capture_output=True, text=True, timeout=2)
-        if result.returncode != 0:
-            return None
-        
-        lines = result.stdout.strip().split('\n')
-        if len(lines) < 2:
-            return None
-        
-        device = lines[1].split()[0]
-        # Extract device name (e.g., /dev/sda1 -> sda)
-        device_name = device.split('/')[-1].rstrip('0123456789')
-        
-        # Check rotational flag (0 = SSD, 1 = HDD)
-        rotational_path = f"/sys/block/{device_name}/queue/rotational"
-        if os.path.exists(rotational_path):
-            with open(rotational_path, 'r') as f:
-                rotational = f.read().strip()
-                return "SSD" if rotational == "0" else "HDD"
-    except:
-        pass
-    
+def storage_type_from_df(df_output: str) -> Optional[str]:
+    """SSD/HDD from `df <path>` output via the device's rotational flag"""
+    lines = df_output.strip().split('\n')
+    if len(lines) < 2:
+        return None
+
+    device = lines[1].split()[0]
+    # Extract device name (e.g., /dev/sda1 -> sda)
+    device_name = device.split('/')[-1].rstrip('0123456789')
+
+    # Check rotational flag (0 = SSD, 1 = HDD)
+    rotational_path = f"/sys/block/{device_name}/queue/rotational"
+    if os.path.exists(rotational_path):
+        with open(rotational_path, 'r') as f:
+            rotational = f.read().strip()
+            return "SSD" if rotational == "0" else "HDD"
     return None
 
 def get_gpu_recommendation(vram_gb: float) -> str:
@@ -204,7 +286,9 @@ def get_cpu_recommendation(threads: int, cpu_name: str) -> str:
     high_end_markers = ["Ryzen 9", "Ryzen 7", "i9", "i7", "Threadripper", "EPYC", "Xeon"]
     is_high_end = any(marker in cpu_name for marker in high_end_markers)
     
-    if threads >= 16 or is_high_end:
+    # threads is the container's usable count - a high-end model name
+    # doesn't help a container capped at two CPUs
+    if threads >= 16 or (is_high_end and threads >= 8):
         return "💪 High-end CPU - Can handle medium model efficiently (12-20min per file)"
     elif threads >= 12:
         return "✅ Strong CPU - Good for medium model (20-25min per file)"
@@ -239,33 +323,14 @@ def get_platform_details() -> Dict[str, str]:
 async def detect_hardware():
     """
     Detect available hardware (GPU/CPU/RAM/Storage)
+
+    Served from the background sampler's cached snapshot, so this never
+    waits on nvidia-smi or df. Not route-cached: that would add its own
+    age on top of the sampler interval.
     """
-    # Try GPU first
-    gpu_info = detect_gpu()
-    if gpu_info:
-        ram_info = detect_ram()
-        storage_info = detect_storage()
-        platform_info = get_platform_details()
-        
-        return HardwareInfo(
-            **gpu_info,
-            **ram_info,
-            **platform_info,
-            storage=storage_info
-        )
-    
-    # Fallback to CPU
-    cpu_info = detect_cpu()
-    ram_info = detect_ram()
-    storage_info = detect_storage()
-    platform_info = get_platform_details()
-    
-    return HardwareInfo(
-        **cpu_info,
-        **ram_info,
-        **platform_info,
-        storage=storage_info
-    )
+    from .hardware_sampler import sampler
+
+    return await sampler.snapshot()
 
 @router.get("/recommendations")
 async def get_recommendations():
@@ -273,20 +338,33 @@ async def get_recommendations():
     Get hardware-based recommendations for Subgen settings
     """
     hw = await detect_hardware()
+    defaults = tuned_defaults(hw)
     
     recommendations = {
         "detected": hw.device_type,
-        "model": "large-v3" if hw.device_type == "cuda" and hw.total_memory and hw.total_memory >= 10 else "medium",
-        "compute_type": "float16" if hw.device_type == "cuda" else "int8",
-        "beam_size": 5 if hw.device_type == "cuda" else 3,
-        "threads": hw.cpu_threads if hw.cpu_threads else 4,
-        "concurrent": 1 if not hw.total_memory or hw.total_memory < 16 else 2,
+        "model": defaults["whisper_model"],
+        "compute_type": defaults["compute_type"],
+        "beam_size": defaults["beam_size"],
+        "threads": defaults["tuning"]["whisper_threads"],
+        "concurrent": defaults["tuning"]["concurrent_transcriptions"],
+        "tuning": defaults["tuning"],
         "explanation": hw.recommendation
     }
 
+    if len(hw.gpus) > 1:
+        # A model can't span cards, so each GPU gets its own Subgen instance
+        recommendations["gpu_placement"] = plan_gpu_placement(
+            hw.gpus, recommendations["model"], recommendations["compute_type"], recommendations["beam_size"]
+        )
+
     return recommendations
 
+def _settings_version() -> int:
+    from .settings import settings_version
+    return settings_version()
+
 @router.get("/smart-recommendations")
+@cached_route(ttl=10, stale=60, version=_settings_version)  # Recommendations read settings.json
 async def get_smart_recommendations():
     """
     Generate smart recommendations based on hardware capabilities
@@ -295,6 +373,15 @@ async def get_smart_recommendations():
     recommendations = []
     
     # GPU-based recommendations
+    if len(hw.gpus) > 1:
+        recommendations.append({
+            "type": "performance",
+            "icon": "🎛️",
+            "title": f"{len(hw.gpus)} GPUs Detected",
+            "description": "Subgen uses one GPU per instance - run one instance per GPU to use them all",
+            "action": f"Generate a sharded compose file with {len(hw.gpus)} shards"
+        })
+
     if hw.device_type == "cuda" and hw.total_memory:
         vram = hw.total_memory
         
@@ -344,6 +431,21 @@ async def get_smart_recommendations():
                 "action": None
             })
     
+    # Oversubscribed threads: every concurrent job runs WHISPER_THREADS threads
+    from .settings import load_settings
+    current = load_settings()
+    capacity = subgen_capacity(hw)
+    wanted = current.whisper_threads * current.concurrent_transcriptions
+    if wanted > capacity["cpu_threads"] * 1.25:
+        recommendations.append({
+            "type": "warning",
+            "icon": "🧵",
+            "title": "CPU Oversubscribed",
+            "description": f"{current.concurrent_transcriptions} jobs × {current.whisper_threads} threads "
+                           f"on {capacity['cpu_threads']} usable CPUs - threads will fight for time slices",
+            "action": "Go to Settings → Performance"
+        })
+
     # RAM recommendations
     if hw.ram_available and hw.ram_available < 8:
         recommendations.append({
@@ -381,4 +483,54 @@ async def get_smart_recommendations():
             "vram": hw.total_memory,
             "ram": hw.ram_total
         }
-    }
\ No newline at end of file
+    }
+
+@router.get("/auto-tune")
+async def get_auto_tune():
+    """
+    Safe concurrent_transcriptions and whisper_threads for the configured
+    model on this hardware (calibrated from telemetry when available)
+    """
+    from .settings import load_settings
+    from .vram_model import auto_tune
+
+    settings = load_settings()
+    hw = await detect_hardware()
+    capacity = subgen_capacity(hw)
+    tuning = auto_tune(
+        hw.device_type if settings.transcribe_device == "cuda" else "cpu",
+        hw.total_memory,
+        capacity["ram_gb"],
+        capacity["cpu_threads"],
+        settings.whisper_model,
+        settings.compute_type,
+        settings.beam_size,
+    )
+    tuning["capacity"] = capacity
+    return tuning
+
+@router.post("/calibrate-vram")
+async def calibrate_vram(hours: float = 24):
+    """
+    Fit the VRAM model to peaks telemetry observed while Subgen ran the
+    configured model/compute_type/beam_size. Meant for one Subgen instance
+    per GPU - telemetry sums VRAM across cards.
+    """
+    from fastapi import HTTPException
+    from .settings import load_settings
+    from .telemetry import peak_vram_by_jobs
+    from .vram_model import calibrate_from_peaks, save_calibration
+
+    settings = load_settings()
+    observations = peak_vram_by_jobs(hours)
+    calibration = calibrate_from_peaks(
+        observations, settings.whisper_model, settings.compute_type, settings.beam_size
+    )
+    if calibration is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Not enough telemetry yet - let Subgen transcribe for a while with the GPU visible to SubBrainArr",
+        )
+    save_calibration(settings.whisper_model, settings.compute_type, settings.beam_size, calibration)
+    return {"model": settings.whisper_model, "compute_type": settings.compute_type,
+            "beam_size": settings.beam_size, "observations": observations, "calibration": calibration}
@@ -0,0 +1,145 @@
+"""
+Background hardware sampler - detect once, serve from memory
+
+/detect, /recommendations and /smart-recommendations used to run
+nvidia-smi and df and read /proc on every request, blocking the event
+loop for up to 5 s when nvidia-smi hangs. Facts that never change (CPU
+model, platform, storage type) are collected once; free VRAM/RAM/disk and
+container limits (ours and Subgen's) are refreshed on an interval with
+async subprocesses. Endpoints read the latest snapshot.
+
+Subgen's limits come through the Docker SDK, whose import alone takes a
+noticeable chunk of a second. They rarely change, so they are read on a
+slower cadence, starting a little after startup, instead of in the
+first sample while early requests are being served.
+"""
+import asyncio
+import os
+import platform
+import time
+from typing import Any, Dict, Optional
+
+from .cgroups import own_limits, subgen_limits
+from .hardware import (
+    GPU_QUERY,
+    HardwareInfo,
+    detect_cpu,
+    detect_ram,
+    disk_usage_info,
+    get_platform_details,
+    parse_gpu_output,
+    storage_path,
+    storage_type_from_df,
+)
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("HARDWARE_SAMPLE_INTERVAL", 10))
+
+# A hung nvidia-smi (driver reset, GPU fallen off the bus) is killed after this
+_COMMAND_TIMEOUT_SECONDS = 5.0
+
+_SUBGEN_LIMITS_DELAY_SECONDS = 30
+_SUBGEN_LIMITS_INTERVAL_SECONDS = 60
+
+
+async def run_command(cmd, timeout: float = _COMMAND_TIMEOUT_SECONDS) -> Optional[str]:
+    """Run a command without blocking the loop. None if missing, failed or hung."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except (FileNotFoundError, PermissionError):
+        return None
+
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None
+    if proc.returncode != 0:
+        return None
+    return stdout.decode(errors="replace")
+
+
+class HardwareSampler:
+    def __init__(self):
+        self.static: Optional[Dict[str, Any]] = None
+        self.dynamic: Dict[str, Any] = {}
+        self.updated: float = 0.0
+        self.has_nvidia_smi = True
+        self._lock = asyncio.Lock()
+        self._subgen_limits_due = time.monotonic() + _SUBGEN_LIMITS_DELAY_SECONDS
+
+    async def refresh_static(self):
+        cpu = await asyncio.to_thread(detect_cpu)
+        platform_info = await asyncio.to_thread(get_platform_details)
+        storage_type = None
+        if platform.system() == "Linux":
+            df = await run_command(["df", storage_path()], timeout=2)
+            if df:
+                storage_type = storage_type_from_df(df)
+        self.static = {"cpu": cpu, "platform": platform_info, "storage_type": storage_type}
+
+    async def sample_gpu(self) -> Optional[Dict[str, Any]]:
+        if not self.has_nvidia_smi:
+            return None
+        output = await run_command(GPU_QUERY)
+        if output is None:
+            # Don't keep spawning a binary that isn't installed
+            self.has_nvidia_smi = await run_command(["nvidia-smi", "-L"]) is not None
+            return None
+        return parse_gpu_output(output)
+
+    async def refresh_dynamic(self):
+        gpu = await self.sample_gpu()
+        ram = await asyncio.to_thread(detect_ram)
+        storage = await asyncio.to_thread(
+            disk_usage_info, storage_path(), (self.static or {}).get("storage_type")
+        )
+        limits = await asyncio.to_thread(own_limits)
+        subgen = self.dynamic.get("subgen_limits")
+        if time.monotonic() >= self._subgen_limits_due:
+            subgen = await asyncio.to_thread(subgen_limits)
+            self._subgen_limits_due = time.monotonic() + _SUBGEN_LIMITS_INTERVAL_SECONDS
+        self.dynamic = {"gpu": gpu, "ram": ram, "storage": storage, "limits": limits, "subgen_limits": subgen}
+        self.updated = time.time()
+
+    async def refresh(self):
+        async with self._lock:
+            if self.static is None:
+                await self.refresh_static()
+            await self.refresh_dynamic()
+
+    async def snapshot(self) -> HardwareInfo:
+        """Latest HardwareInfo; samples once if the loop hasn't run yet."""
+        if not self.updated:
+            async with self._lock:
+                if not self.updated:
+                    if self.static is None:
+                        await self.refresh_static()
+                    await self.refresh_dynamic()
+
+        # GPU fields win, CPU counts are kept for thread recommendations
+        device_info = {**self.static["cpu"], **(self.dynamic["gpu"] or {})}
+        return HardwareInfo(
+            **device_info,
+            **self.dynamic["ram"],
+            **self.static["platform"],
+            storage=self.dynamic["storage"],
+            container_limits=self.dynamic["limits"],
+            subgen_limits=self.dynamic["subgen_limits"],
+        )
+
+    async def run(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        """Background loop started from main.py."""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Hardware sampler error: {e}")
+            await asyncio.sleep(interval)
+
+
+sampler = HardwareSampler()
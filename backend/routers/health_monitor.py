@@ -0,0 +1,322 @@
+"""
+Subgen health monitor - is every instance up, and how fast does it answer?
+
+The connection screen's test is a one-shot check. This probes every
+registered instance (the default Subgen URL and each language route) on
+an interval and keeps:
+
+  - availability: up/down state, when it last changed, checks vs failures
+  - response-time histograms for GET /, /status and /batch (Subgen only
+    accepts POST on /batch; the 405 still measures how quickly it answers)
+  - the version Subgen reports, and restarts seen through a version
+    change or a drop in the uptime /status reports
+
+Latency on /status climbs as Subgen's queue fills, so a recent p95 well
+above the instance's usual median is reported as "degraded" before users
+notice stalled subtitles.
+
+One worker (the lease holder) probes; results go through the shared
+event log so every worker builds the same state and pushes changes to its
+own /ws clients.
+"""
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+from fastapi import APIRouter, HTTPException
+
+from . import shared_state
+from .metrics import subgen_client
+
+router = APIRouter()
+
+PROBE_INTERVAL_SECONDS = float(os.getenv("HEALTH_PROBE_INTERVAL", 15))
+
+ENDPOINTS = ("/", "/status", "/batch")
+
+# Histogram upper bounds in milliseconds; the last bucket is everything slower
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_LEASE_NAME = "health_monitor"
+_PROBE_TIMEOUT_SECONDS = 10.0
+_VERSION_CHECK_SECONDS = 300
+_RECENT_PROBES = 240  # An hour at the default interval
+_MAX_EVENTS = 500
+
+# Degraded when the last few /status probes are this much slower than usual
+_DEGRADED_WINDOW = 4
+_DEGRADED_FACTOR = 3.0
+_DEGRADED_MIN_MS = 250.0
+
+_UPTIME_KEYS = ("uptime", "uptime_seconds", "uptime_s")
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus the most recent raw samples."""
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.recent: Deque[float] = deque(maxlen=_RECENT_PROBES)
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.recent.append(ms)
+
+    def quantile(self, q: float, last: Optional[int] = None) -> Optional[float]:
+        samples = sorted(list(self.recent)[-last:] if last else self.recent)
+        if not samples:
+            return None
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))], 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 1) if self.total else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class InstanceHealth:
+    def __init__(self, url: str):
+        self.url = url
+        self.up: Optional[bool] = None
+        self.since: Optional[float] = None
+        self.checks = 0
+        self.failures = 0
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.version: Optional[str] = None
+        self.uptime: Optional[float] = None
+        self.restarts = 0
+        self.last_restart: Optional[float] = None
+        self.degraded = False
+        self.jobs: Optional[int] = None
+        self.latency = {endpoint: LatencyHistogram() for endpoint in ENDPOINTS}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=_RECENT_PROBES)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "up": self.up,
+            "since": self.since,
+            "availability_percent": round(100 * (self.checks - self.failures) / self.checks, 2) if self.checks else None,
+            "checks": self.checks,
+            "failures": self.failures,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "version": self.version,
+            "restarts": self.restarts,
+            "last_restart": self.last_restart,
+            "degraded": self.degraded,
+            "jobs": self.jobs,
+            "latency": {endpoint: h.to_dict() for endpoint, h in self.latency.items()},
+        }
+
+
+class HealthStore:
+    def __init__(self):
+        self.instances: Dict[str, InstanceHealth] = {}
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=_MAX_EVENTS)
+
+    def apply(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Fold one probe result into the instance's state; return new events."""
+        url = result["instance"]
+        state = self.instances.setdefault(url, InstanceHealth(url))
+        now = result["t"]
+        events: List[Dict[str, Any]] = []
+
+        def event(kind: str, **details):
+            events.append({"t": now, "kind": kind, "instance": url, **details})
+
+        up = result["up"]
+        if up != state.up:
+            if state.up is not None:
+                event("up" if up else "down", previous_since=state.since, error=result.get("error"))
+            state.up, state.since = up, now
+        state.checks += 1
+        state.failures += 0 if up else 1
+        state.last_checked = now
+        state.last_error = result.get("error")
+
+        for endpoint, ms in (result.get("latency_ms") or {}).items():
+            if ms is not None and endpoint in state.latency:
+                state.latency[endpoint].observe(ms)
+        state.history.append({"t": now, "up": up, "jobs": result.get("jobs"), **(result.get("latency_ms") or {})})
+        if up:
+            state.jobs = result.get("jobs")
+
+        restarted = False
+        version = result.get("version")
+        if version:
+            if state.version and version != state.version:
+                event("version", old=state.version, new=version)
+                restarted = True
+            state.version = version
+
+        uptime = result.get("uptime")
+        if uptime is not None:
+            if state.uptime is not None and uptime + 1 < state.uptime:
+                restarted = True
+            state.uptime = uptime
+
+        if restarted:
+            state.restarts += 1
+            state.last_restart = now
+            event("restart", version=state.version)
+
+        degraded = self._degraded(state)
+        if degraded != state.degraded:
+            event("degraded" if degraded else "latency_recovered", p95_ms=state.latency["/status"].quantile(0.95, _DEGRADED_WINDOW))
+            state.degraded = degraded
+
+        self.events.extend(events)
+        return events
+
+    @staticmethod
+    def _degraded(state: InstanceHealth) -> bool:
+        histogram = state.latency["/status"]
+        if len(histogram.recent) < _DEGRADED_WINDOW * 4:
+            return False
+        recent = list(histogram.recent)[-_DEGRADED_WINDOW:]
+        baseline = statistics.median(list(histogram.recent)[:-_DEGRADED_WINDOW])
+        return min(recent) > max(_DEGRADED_MIN_MS, baseline * _DEGRADED_FACTOR)
+
+
+store = HealthStore()
+
+
+def _uptime_from_status(data: Any) -> Optional[float]:
+    if not isinstance(data, dict):
+        return None
+    for key in _UPTIME_KEYS:
+        value = data.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+async def probe_instance(client: httpx.AsyncClient, url: str, check_version: bool) -> Dict[str, Any]:
+    """Time GET on each of ENDPOINTS; up means the root page answered."""
+    from .connection import version_from_text
+    from .telemetry import jobs_from_status
+
+    result: Dict[str, Any] = {"t": round(time.time(), 3), "instance": url, "latency_ms": {}}
+    root_text = None
+    for endpoint in ENDPOINTS:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url if endpoint == "/" else f"{url}{endpoint}")
+        except httpx.HTTPError as e:
+            result["latency_ms"][endpoint] = None
+            if endpoint == "/":
+                result["error"] = type(e).__name__
+                break  # Down; the other endpoints would just time out too
+            continue
+        result["latency_ms"][endpoint] = round((time.perf_counter() - started) * 1000, 1)
+
+        if endpoint == "/":
+            if response.status_code >= 500:
+                result["error"] = f"HTTP {response.status_code}"
+                break
+            root_text = response.text
+        elif endpoint == "/status" and response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError:
+                continue
+            result["jobs"], _ = jobs_from_status(data)
+            result["uptime"] = _uptime_from_status(data)
+
+    result["up"] = root_text is not None
+    if root_text is not None:
+        version = version_from_text(root_text)
+        if version == "Unknown" and check_version:
+            try:
+                response = await client.get(f"{url}/version")
+                if response.status_code == 200 and isinstance(response.json(), dict):
+                    version = response.json().get("version") or version
+            except (httpx.HTTPError, ValueError):
+                pass
+        if version != "Unknown":
+            result["version"] = str(version)
+    return result
+
+
+async def monitored_instances() -> List[str]:
+    """Validated URLs of the default Subgen instance and every language route."""
+    from .settings import load_settings
+    from .url_validation import validate_subgen_url_async
+
+    settings = await asyncio.to_thread(load_settings)
+    urls = []
+    for url in dict.fromkeys([settings.subgen_url, *settings.language_routes.values()]):
+        valid, clean_url = await validate_subgen_url_async(url)
+        if valid:
+            urls.append(clean_url)
+    return urls
+
+
+async def run(interval: float = PROBE_INTERVAL_SECONDS):
+    """Background loop started from main.py; only the lease holder probes."""
+    owner = shared_state.worker_id()
+    last_version_check = 0.0
+    while True:
+        try:
+            leader = await asyncio.to_thread(shared_state.try_acquire_lease, _LEASE_NAME, owner, interval * 3)
+            if leader:
+                now = time.monotonic()
+                check_version = now - last_version_check >= _VERSION_CHECK_SECONDS
+                if check_version:
+                    last_version_check = now
+                async with subgen_client(timeout=_PROBE_TIMEOUT_SECONDS) as client:
+                    results = await asyncio.gather(*[
+                        probe_instance(client, url, check_version) for url in await monitored_instances()
+                    ])
+                for result in results:
+                    await shared_state.publish_async("health", result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Health monitor error: {e}")
+        await asyncio.sleep(interval)
+
+
+@router.get("/instances")
+async def get_instances():
+    """Availability, version and latency histograms per Subgen instance."""
+    return {
+        "interval_seconds": PROBE_INTERVAL_SECONDS,
+        "instances": [state.summary() for state in store.instances.values()],
+    }
+
+
+@router.get("/history")
+async def get_history(instance: str):
+    """Recent probes of one instance: latency per endpoint and job count."""
+    state = store.instances.get(instance.rstrip("/"))
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Instance not monitored: {instance}")
+    return {"instance": state.url, "probes": list(state.history)}
+
+
+@router.get("/events")
+async def get_events(instance: Optional[str] = None, limit: int = 100):
+    """Up/down, restart, version and degraded-latency events, newest first."""
+    events = [e for e in store.events if instance is None or e["instance"] == instance.rstrip("/")]
+    return {"events": events[::-1][:limit]}
@@ -0,0 +1,267 @@
+"""
+Language routing - send each folder to the Subgen instance tuned for it
+
+A sharded deployment (see settings.plan_subgen_shards) runs one Subgen per
+language group. This module works out a folder's dominant audio language
+and picks the matching instance from settings.language_routes.
+
+Detection sources, strongest first:
+  metadata — audio stream language tags via ffprobe
+  sidecar  — language tags in existing subtitle filenames (Movie.ja.srt)
+  history  — previous detections for this folder, one shared-state row each
+  logs     — "Detected language" lines in Subgen's container logs
+
+Folders are resolved at the same path SubBrainArr sees them, so the media
+library must be mounted at the same container path as in Subgen.
+"""
+import asyncio
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from . import shared_state
+from .languages import normalize_language_code
+
+MEDIA_EXTENSIONS = {
+    ".mkv", ".mp4", ".m4v", ".avi", ".mov", ".wmv", ".ts", ".m2ts",
+    ".webm", ".flv", ".mpg", ".mpeg", ".mka", ".mp3", ".flac", ".m4a",
+}
+SUBTITLE_EXTENSIONS = {".srt", ".ass", ".ssa", ".vtt", ".sub"}
+
+# Filename tokens that sit between the language tag and the extension
+_SUBTITLE_FLAG_TOKENS = {"forced", "sdh", "cc", "hi", "default", "full"}
+
+# One file_cache row per folder, so concurrent detections don't rewrite a shared blob
+_HISTORY_NAMESPACE = "folder_languages"
+_FFPROBE_TIMEOUT = 10.0
+_MAX_WALK_FILES = 2000
+
+_DETECTED_LANGUAGE_RE = re.compile(
+    r"detected language\s*(?:is\b|:|=)?\s*['\"]?([a-z]{2,}(?:-[a-z]+)?)", re.IGNORECASE
+)
+
+
+class FolderLanguage(BaseModel):
+    folder: str
+    language: Optional[str] = None
+    source: str = "unknown"  # metadata, sidecar, history, logs, unknown
+    confidence: float = 0.0
+    votes: Dict[str, int] = {}
+
+
+def _scan_folder(folder: str) -> Tuple[List[str], List[str], float]:
+    """Collect media and subtitle files under folder. Returns (media, subs, mtime)."""
+    media, subtitles = [], []
+    seen = 0
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in MEDIA_EXTENSIONS:
+                media.append(os.path.join(root, name))
+            elif ext in SUBTITLE_EXTENSIONS:
+                subtitles.append(os.path.join(root, name))
+            seen += 1
+        if seen >= _MAX_WALK_FILES:
+            break
+    return media, subtitles, os.stat(folder).st_mtime
+
+
+def _sample(items: List[str], count: int) -> List[str]:
+    """Pick count items spread evenly across the list (episodes 1, 5, 10...)."""
+    if len(items) <= count:
+        return items
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+def subtitle_language_tag(path: str) -> Optional[str]:
+    """Language tag from a subtitle filename, e.g. "Show.S01E01.ja.forced.srt" -> "ja".
+
+    Subgen's own output (".subgen." in the name) is skipped — its tag is the
+    subtitle language it wrote, not the audio language.
+    """
+    tokens = os.path.basename(path).split(".")[:-1]
+    if len(tokens) < 2 or "subgen" in (t.lower() for t in tokens):
+        return None
+    while len(tokens) > 1 and tokens[-1].lower() in _SUBTITLE_FLAG_TOKENS:
+        tokens.pop()
+    return normalize_language_code(tokens[-1]) if len(tokens) > 1 else None
+
+
+async def probe_audio_language(path: str) -> Optional[str]:
+    """Read the default audio stream's language tag with ffprobe."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-select_streams", "a",
+            "-show_entries", "stream=index:stream_tags=language:stream_disposition=default",
+            "-of", "json", path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        return None
+
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=_FFPROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()  # Reap it, or every timeout leaves a zombie behind
+        return None
+
+    try:
+        streams = json.loads(stdout or b"{}").get("streams", [])
+    except ValueError:
+        return None
+
+    # Prefer the stream flagged default, then the first tagged one
+    streams.sort(key=lambda st: -st.get("disposition", {}).get("default", 0))
+    for stream in streams:
+        code = normalize_language_code(stream.get("tags", {}).get("language"))
+        if code:
+            return code
+    return None
+
+
+def languages_from_logs(folder: str, log_text: str) -> Counter:
+    """Count Subgen's language detections for files under folder.
+
+    A detection line is attributed to the most recent log line that
+    mentioned a path inside the folder.
+    """
+    votes: Counter = Counter()
+    prefix = folder.rstrip("/") + "/"
+    in_folder = False
+    for line in log_text.splitlines():
+        if "/" in line:
+            in_folder = prefix in line
+        if in_folder:
+            match = _DETECTED_LANGUAGE_RE.search(line)
+            if match:
+                code = normalize_language_code(match.group(1))
+                if code:
+                    votes[code] += 1
+    return votes
+
+
+def _fetch_subgen_logs() -> str:
+    from .logs import _get_docker_client, _fetch_container_logs, _SUBGEN_CONTAINER_NAMES
+
+    client = _get_docker_client()
+    if not client:
+        return ""
+    return _fetch_container_logs(client, _SUBGEN_CONTAINER_NAMES, 5000) or ""
+
+
+def _result(folder: str, votes: Counter, source: str) -> FolderLanguage:
+    language, top = votes.most_common(1)[0]
+    return FolderLanguage(
+        folder=folder,
+        language=language,
+        source=source,
+        confidence=round(top / sum(votes.values()), 2),
+        votes=dict(votes),
+    )
+
+
+async def detect_folder_language(folder: str, sample_size: int = 5, use_logs: bool = True) -> FolderLanguage:
+    """Work out the dominant audio language of a media folder."""
+    folder = folder.rstrip("/") or "/"
+    history = await asyncio.to_thread(shared_state.get_file_cache, _HISTORY_NAMESPACE, [folder])
+
+    try:
+        media, subtitles, mtime = await asyncio.to_thread(_scan_folder, folder)
+    except OSError:
+        media, subtitles, mtime = [], [], None
+
+    # Cached answer is good until the folder changes
+    cached = history[folder][2] if folder in history else None
+    if cached and (mtime is None or cached.get("mtime") == mtime):
+        return FolderLanguage(
+            folder=folder,
+            language=cached["language"],
+            source="history",
+            confidence=cached.get("confidence", 0.0),
+            votes=cached.get("votes", {}),
+        )
+
+    result = None
+
+    probed = await asyncio.gather(*(probe_audio_language(p) for p in _sample(media, sample_size)))
+    votes = Counter(code for code in probed if code)
+    if votes:
+        result = _result(folder, votes, "metadata")
+
+    if result is None:
+        votes = Counter(filter(None, (subtitle_language_tag(p) for p in subtitles)))
+        if votes:
+            result = _result(folder, votes, "sidecar")
+
+    if result is None and use_logs:
+        log_text = await asyncio.to_thread(_fetch_subgen_logs)
+        votes = languages_from_logs(folder, log_text)
+        if votes:
+            result = _result(folder, votes, "logs")
+
+    if result is None:
+        return FolderLanguage(folder=folder)
+
+    entry = {
+        "language": result.language,
+        "confidence": result.confidence,
+        "votes": result.votes,
+        "mtime": mtime,
+    }
+
+    await asyncio.to_thread(shared_state.put_file_cache, _HISTORY_NAMESPACE, [(folder, mtime or 0.0, 0, entry)])
+    return result
+
+
+def cached_folder_languages() -> Dict[str, str]:
+    """Folder -> language for every folder detected so far."""
+    history = shared_state.get_file_cache(_HISTORY_NAMESPACE)
+    return {folder: entry["language"] for folder, (_, _, entry) in history.items() if entry.get("language")}
+
+
+def subtitle_audio_language(path: str, folder_languages: Dict[str, str]) -> Optional[str]:
+    """Audio language for a subtitle file.
+
+    A cached folder detection wins over the filename tag — when Subgen
+    translates, Japanese audio ends up in a file tagged .eng.srt.
+    """
+    from .subtitles import file_language_tag
+
+    for folder in sorted(folder_languages, key=len, reverse=True):
+        if path.startswith(folder.rstrip("/") + "/"):
+            return folder_languages[folder]
+    return file_language_tag(path)
+
+
+def subtitle_text_language(path: str, folder_languages: Dict[str, str], settings=None) -> Optional[str]:
+    """Language a subtitle file's text is written in.
+
+    Reading profiles and hallucination phrases depend on the text, not the
+    audio — translated output of Japanese audio is English. Subgen tags its
+    files with the language it wrote, so the filename tag wins; an untagged
+    file is in settings.subtitle_language when Subgen translates, and in
+    the folder's audio language when it transcribes.
+    """
+    from .subtitles import file_language_tag
+
+    tag = file_language_tag(path)
+    if tag:
+        return tag
+    if settings is not None and settings.whisper_task == "translate":
+        return normalize_language_code(settings.subtitle_language)
+    return subtitle_audio_language(path, folder_languages)
+
+
+def resolve_route(language: Optional[str], routes: Dict[str, str], default_url: str) -> str:
+    """Pick the Subgen URL for a language, falling back to the default instance."""
+    if language and language in routes:
+        return routes[language]
+    return default_url
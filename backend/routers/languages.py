@@ -7,6 +7,7 @@ optimization_status tri-state:
   "custom"  — reserved for future manual edits outside wizard
 """
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, List
 
@@ -587,7 +588,70 @@ DEFAULT_LANGUAGES = {
     }
 }
 
-@router.get("/list", response_model=List[LanguageSettings])
+# ISO 639-2 (bibliographic and terminology) -> ISO 639-1, for container
+# metadata and subtitle filenames like "Movie.jpn.srt"
+ISO_639_2_TO_1 = {
+    "afr": "af", "ara": "ar", "arm": "hy", "hye": "hy", "aze": "az",
+    "bel": "be", "ben": "bn", "bos": "bs", "bul": "bg", "cat": "ca",
+    "chi": "zh", "zho": "zh", "hrv": "hr", "cze": "cs", "ces": "cs",
+    "dan": "da", "dut": "nl", "nld": "nl", "eng": "en", "est": "et",
+    "fin": "fi", "glg": "gl", "fre": "fr", "fra": "fr", "ger": "de",
+    "deu": "de", "gre": "el", "ell": "el", "heb": "he", "hin": "hi",
+    "hun": "hu", "ice": "is", "isl": "is", "ind": "id", "ita": "it",
+    "jpn": "ja", "kan": "kn", "kaz": "kk", "kor": "ko", "lav": "lv",
+    "lit": "lt", "may": "ms", "msa": "ms", "mac": "mk", "mkd": "mk",
+    "mao": "mi", "mri": "mi", "mar": "mr", "nep": "ne", "nor": "no",
+    "nob": "no", "nno": "no", "per": "fa", "fas": "fa", "pol": "pl",
+    "por": "pt", "rum": "ro", "ron": "ro", "srp": "sr", "rus": "ru",
+    "spa": "es", "slo": "sk", "slk": "sk", "slv": "sl", "swe": "sv",
+    "swa": "sw", "tgl": "tl", "fil": "tl", "tam": "ta", "tha": "th",
+    "tur": "tr", "ukr": "uk", "urd": "ur", "vie": "vi", "wel": "cy",
+    "cym": "cy",
+}
+
+
+def normalize_language_code(tag: Optional[str]) -> Optional[str]:
+    """Map a language tag ("jpn", "ja", "ja-JP", "Japanese") to our 2-letter code.
+
+    Returns None for anything we don't have a profile for.
+    """
+    if not tag:
+        return None
+    tag = tag.strip().lower().replace("_", "-").split("-")[0]
+    if tag in DEFAULT_LANGUAGES:
+        return tag
+    if tag in ISO_639_2_TO_1:
+        return ISO_639_2_TO_1[tag]
+    for code, lang_data in DEFAULT_LANGUAGES.items():
+        if lang_data["name"].lower() == tag:
+            return code
+    return None
+
+
+# Reading-speed targets for subtitle analysis and retiming. CJK scripts pack
+# far more meaning per character, so comfortable rates and lines are shorter.
+_READING_PROFILE_DEFAULT = {
+    "target_cps": 15.0,    # Comfortable characters per second
+    "max_cps": 17.0,       # Above this, viewers start missing lines
+    "min_cps": 8.0,        # Below this, subs linger or lines are padded
+    "max_line_length": 42,
+    "min_duration": 1.0,   # Seconds
+    "max_duration": 7.0,
+}
+_READING_PROFILE_OVERRIDES = {
+    "zh": {"target_cps": 7.0, "max_cps": 9.0, "min_cps": 3.5, "max_line_length": 16},
+    "ja": {"target_cps": 6.0, "max_cps": 8.0, "min_cps": 3.0, "max_line_length": 16},
+    "ko": {"target_cps": 10.0, "max_cps": 12.0, "min_cps": 5.0, "max_line_length": 20},
+    "th": {"target_cps": 12.0, "max_cps": 15.0, "min_cps": 6.0, "max_line_length": 35},
+}
+
+
+def get_reading_profile(language_code: str) -> Dict[str, float]:
+    """Reading-speed targets for a language (see _READING_PROFILE_DEFAULT)."""
+    return {**_READING_PROFILE_DEFAULT, **_READING_PROFILE_OVERRIDES.get(language_code, {})}
+
+
+@router.get("/list", response_model=List[LanguageSettings], response_class=ORJSONResponse)
 async def list_languages():
     """
     Get list of all configured languages with their settings.
@@ -631,7 +695,8 @@ async def list_languages():
         languages.append(LanguageSettings(**settings_data))
 
     languages.sort(key=lambda x: x.name)
-    return languages
+    # Already validated; skip FastAPI's re-validation and encoder pass
+    return ORJSONResponse([language.model_dump() for language in languages])
 
 @router.get("/{language_code}", response_model=LanguageSettings)
 async def get_language(language_code: str):
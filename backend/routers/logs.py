@@ -6,10 +6,11 @@ must be mounted (-v /var/run/docker.sock:/var/run/docker.sock)
 for container log access. Falls back to guidance text if unavailable.
 """
 from fastapi import APIRouter, Query
-import httpx
+from fastapi.responses import ORJSONResponse
 from typing import Optional
 
-from .url_validation import validate_subgen_url
+from .url_validation import validate_subgen_url_async
+from .metrics import subgen_client
 
 router = APIRouter()
 
@@ -52,7 +53,7 @@ def _fetch_container_logs(client, container_names: list, lines: int, level: str
     return None
 
 
-@router.get("/subgen")
+@router.get("/subgen", response_class=ORJSONResponse)
 async def get_subgen_logs(
     subgen_url: str = Query(..., description="Subgen instance URL"),
     lines: Optional[int] = Query(500, description="Number of lines to fetch"),
@@ -62,7 +63,7 @@ async def get_subgen_logs(
     Fetch logs from Subgen — tries Docker SDK first, then falls back to
     a connectivity check with guidance on manual log viewing.
     """
-    valid, clean_url = validate_subgen_url(subgen_url)
+    valid, clean_url = await validate_subgen_url_async(subgen_url)
     if not valid:
         return {"success": False, "error": clean_url, "logs": ""}
 
@@ -80,7 +81,7 @@ async def get_subgen_logs(
 
     # Attempt 2: Connectivity check + guidance
     try:
-        async with httpx.AsyncClient(timeout=5.0) as http:
+        async with subgen_client(timeout=5.0) as http:
             response = await http.get(clean_url)
 
             if response.status_code == 200:
@@ -113,7 +114,7 @@ async def get_subgen_logs(
         }
 
 
-@router.get("/local")
+@router.get("/local", response_class=ORJSONResponse)
 async def get_local_logs(
     lines: int = Query(500, description="Number of lines"),
     level: Optional[str] = Query(None, description="Filter by level: INFO, WARNING, ERROR"),
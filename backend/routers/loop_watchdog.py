@@ -0,0 +1,170 @@
+"""
+Event-loop watchdog - catch blocking calls in async handlers as they happen
+
+A blocking call inside `async def` (subprocess.run, a Docker SDK call,
+a DNS lookup, reading a big file) stalls every request in the worker.
+Loop lag shows that it happens; this shows where.
+
+A callback on the loop stamps a heartbeat every HEARTBEAT_SECONDS. A
+plain thread checks the stamp; when it is older than the threshold the
+loop is stuck, so the thread grabs the loop thread's current stack with
+sys._current_frames() and the task that is running. Tasks are mapped to
+the HTTP route they serve by RouteTrackingMiddleware; background tasks
+are named by their coroutine. When the loop catches up, the stall's
+full duration is recorded and counted in the metrics registry.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from . import metrics
+
+THRESHOLD_SECONDS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", 250)) / 1000
+HEARTBEAT_SECONDS = 0.05
+
+_MAX_STALLS = 200
+_STACK_LIMIT = 40
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+stalls_total = metrics.registry.register(metrics.Counter(
+    "subbrainarr_event_loop_stalls", "Event-loop stalls over the watchdog threshold, by route or task", ("route",)))
+stall_duration = metrics.registry.register(metrics.Histogram(
+    "subbrainarr_event_loop_stall_duration_seconds", "How long the event loop was blocked per stall", ("route",),
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+
+# task -> ASGI scope of the request it is serving
+_task_scopes: "weakref.WeakKeyDictionary[asyncio.Task, Dict]" = weakref.WeakKeyDictionary()
+
+
+class RouteTrackingMiddleware:
+    """Remembers which request each task serves, for attribution."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        task = asyncio.current_task()
+        if task is not None and scope["type"] in ("http", "websocket"):
+            _task_scopes[task] = scope
+        await self.app(scope, receive, send)
+
+
+def _current_task(loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Task]:
+    # Private but long-standing; reading a dict entry is safe across threads
+    current = getattr(asyncio.tasks, "_current_tasks", None)
+    return current.get(loop) if current is not None else None
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> Dict[str, Optional[str]]:
+    if task is None:
+        return {"route": "(no task)", "method": None, "path": None}
+    scope = _task_scopes.get(task)
+    if scope is not None:
+        route = getattr(scope.get("route"), "path", None) or scope.get("path")
+        return {"route": route, "method": scope.get("method"), "path": scope.get("path")}
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or task.get_name()
+    return {"route": f"task:{name}", "method": None, "path": None}
+
+
+def _format_stack(frame) -> List[Dict[str, Any]]:
+    return [
+        {"file": f.filename, "line": f.lineno, "function": f.name, "code": f.line}
+        for f in traceback.extract_stack(frame, limit=_STACK_LIMIT)
+    ]
+
+
+def _blocking_site(stack: List[Dict[str, Any]]) -> Optional[str]:
+    """Innermost frame in our own code — usually the call that blocks."""
+    for entry in reversed(stack):
+        if entry["file"].startswith(_BACKEND_DIR):
+            return f"{os.path.relpath(entry['file'], _BACKEND_DIR)}:{entry['line']} in {entry['function']}"
+    return f"{stack[-1]['file']}:{stack[-1]['line']} in {stack[-1]['function']}" if stack else None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = THRESHOLD_SECONDS):
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=_MAX_STALLS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat = time.monotonic()
+        self._current: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Call from the loop's thread (startup handler)."""
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        loop.call_soon(self._heartbeat)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+        if not self._stop.is_set():
+            self._loop.call_later(HEARTBEAT_SECONDS, self._heartbeat)
+
+    def _watch(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            behind = time.monotonic() - self._beat
+            if self._current is None and behind > self.threshold + HEARTBEAT_SECONDS:
+                self._capture(behind)
+            elif self._current is not None and behind < HEARTBEAT_SECONDS * 2:
+                self._finish()
+
+    def _capture(self, behind: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = _format_stack(frame) if frame is not None else []
+        self._current = {
+            "started": time.time() - behind,
+            **_describe_task(_current_task(self._loop)),
+            "site": _blocking_site(stack),
+            "stack": stack,
+            "_beat": self._beat,
+        }
+
+    def _finish(self):
+        stall = self._current
+        self._current = None
+        # The loop ran again right after the last beat we saw before the stall
+        duration = max(self.threshold, self._beat - stall.pop("_beat") - HEARTBEAT_SECONDS)
+        stall["duration_ms"] = round(duration * 1000, 1)
+        self.stalls.append(stall)
+        stalls_total.inc(route=stall["route"])
+        stall_duration.observe(duration, route=stall["route"])
+        print(f"Event loop blocked {stall['duration_ms']} ms in {stall['route']} at {stall['site']}")
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        by_site: Dict[str, Dict[str, Any]] = {}
+        for stall in self.stalls:
+            key = f"{stall['route']} @ {stall['site']}"
+            entry = by_site.setdefault(key, {"route": stall["route"], "site": stall["site"], "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + stall["duration_ms"], 1)
+            entry["max_ms"] = max(entry["max_ms"], stall["duration_ms"])
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "running": self._thread is not None,
+            "stalled_now": self._current is not None,
+            "by_site": sorted(by_site.values(), key=lambda e: e["total_ms"], reverse=True),
+            "recent": list(self.stalls)[::-1][:limit],
+        }
+
+
+watchdog = LoopWatchdog()
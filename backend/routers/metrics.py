@@ -0,0 +1,381 @@
+"""
+Metrics router - Prometheus/OpenMetrics exposition at /metrics
+
+A small in-process registry, no client library: counters, gauges and
+histograms with labels, rendered as OpenMetrics when the scraper asks
+for it and as the classic Prometheus text format otherwise.
+
+  - HTTP requests per route template and status, with latency histograms
+    (MetricsMiddleware)
+  - every call to a Subgen instance made through subgen_client(): latency
+    per endpoint and errors by kind (MeteredTransport)
+  - queue depth per instance and jobs completed per language, from the
+    health monitor's /status probes and the telemetry job annotations
+  - WebSocket clients, evictions and event-loop lag
+
+Each worker keeps its own registry, so with WORKERS > 1 a scrape sees
+one worker. Set METRICS_TEXTFILE to also write the metrics to a file for
+node_exporter's textfile collector. Only one worker (the lease holder)
+writes it, so counters don't jump between workers' values from one write
+to the next. Its HTTP, Subgen call and WebSocket series cover that
+worker's traffic only; queue depth and job counts reach every worker
+through the shared event log, so those are complete.
+"""
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from . import shared_state
+
+router = APIRouter()
+
+TEXTFILE_PATH = os.getenv("METRICS_TEXTFILE")
+TEXTFILE_INTERVAL_SECONDS = float(os.getenv("METRICS_TEXTFILE_INTERVAL", 15))
+_TEXTFILE_LEASE_NAME = "metrics_textfile"
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4"  # Response adds the charset
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Unbounded label values (odd paths from a misbehaving client) collapse into "other"
+_MAX_LABEL_VALUES = 100
+
+_LOOP_LAG_INTERVAL_SECONDS = 0.5
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # Computed at scrape time instead: returns {label values: value}
+        self.collect = collect
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self, openmetrics: bool) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def current(self) -> Dict[Tuple[str, ...], float]:
+        if self.collect is None:
+            return self.values
+        try:
+            return self.collect()
+        except Exception as e:
+            print(f"Metrics collector error for {self.name}: {e}")
+            return {}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self.values and len(self.values) >= _MAX_LABEL_VALUES:
+                key = tuple("other" for _ in key)
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def header(self, openmetrics: bool) -> List[str]:
+        if openmetrics:
+            return super().header(openmetrics)
+        # The classic format types the sample name itself
+        return [f"# HELP {self.name}_total {self.help}", f"# TYPE {self.name}_total counter"]
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(self.current().items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(self.current().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts incl. +Inf, sum]
+        self.values: Dict[Tuple[str, ...], List] = {}
+        self._bounds = [f'le="{b!r}"' for b in self.buckets] + ['le="+Inf"']
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self.values:
+                if len(self.values) >= _MAX_LABEL_VALUES:
+                    key = tuple("other" for _ in key)
+                self.values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            entry = self.values[key]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            snapshot = sorted((key, list(counts), total) for key, (counts, total) in self.values.items())
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self._bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, bound)} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {round(total, 6)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, openmetrics: bool = True) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.header(openmetrics))
+            lines.extend(metric.samples())
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "subbrainarr_http_requests", "HTTP requests handled, by route template and status", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "subbrainarr_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")))
+subgen_latency = registry.register(Histogram(
+    "subbrainarr_subgen_request_duration_seconds", "Latency of calls to Subgen instances by endpoint", ("endpoint",)))
+subgen_requests = registry.register(Counter(
+    "subbrainarr_subgen_requests", "Calls to Subgen instances by endpoint and status class", ("endpoint", "status")))
+subgen_errors = registry.register(Counter(
+    "subbrainarr_subgen_errors", "Failed calls to Subgen instances by endpoint and error", ("endpoint", "error")))
+loop_lag = registry.register(Gauge(
+    "subbrainarr_event_loop_lag_last_seconds", "How late the event loop last ran a timer"))
+loop_lag_histogram = registry.register(Histogram(
+    "subbrainarr_event_loop_lag_seconds", "How late the event loop ran timers",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)))
+
+# instance URL -> completed job count; mapped to languages at scrape time
+_completed_by_instance: Dict[str, float] = {}
+_last_jobs: Dict[str, Tuple[Optional[int], List[str]]] = {}
+_instance_languages: Dict[str, str] = {}
+
+
+def record_jobs_annotation(note: Dict):
+    """Count jobs that left an instance's queue since its previous report."""
+    instance = note["instance"]
+    previous = _last_jobs.get(instance)
+    _last_jobs[instance] = (note.get("jobs"), list(note.get("files") or []))
+    if previous is None or note.get("jobs") is None or previous[0] is None:
+        return
+    if previous[1]:
+        finished = len(set(previous[1]) - set(note.get("files") or []))
+    else:
+        finished = max(0, previous[0] - note["jobs"])
+    if finished:
+        _completed_by_instance[instance] = _completed_by_instance.get(instance, 0) + finished
+
+
+def _jobs_completed() -> Dict[Tuple[str, ...], float]:
+    values: Dict[Tuple[str, ...], float] = {}
+    for instance, count in _completed_by_instance.items():
+        key = (_instance_languages.get(instance, "default"), instance)
+        values[key] = values.get(key, 0) + count
+    return values
+
+
+def _queue_depth() -> Dict[Tuple[str, ...], float]:
+    from .health_monitor import store
+
+    return {(url,): state.jobs for url, state in store.instances.items() if state.jobs is not None}
+
+
+def _instances_up() -> Dict[Tuple[str, ...], float]:
+    from .health_monitor import store
+
+    return {(url,): 1 if state.up else 0 for url, state in store.instances.items() if state.up is not None}
+
+
+def _ws_clients() -> Dict[Tuple[str, ...], float]:
+    from .ws_hub import hub
+
+    return {(): len(hub.clients)}
+
+
+def _ws_evicted() -> Dict[Tuple[str, ...], float]:
+    from .ws_hub import hub
+
+    return {(): hub.evicted}
+
+
+registry.register(Gauge(
+    "subbrainarr_subgen_queue_depth", "Jobs queued or running per Subgen instance, from /status",
+    ("instance",), collect=_queue_depth))
+registry.register(Gauge(
+    "subbrainarr_subgen_up", "Whether the health monitor last reached the instance", ("instance",), collect=_instances_up))
+registry.register(Counter(
+    "subbrainarr_subgen_jobs_completed", "Jobs seen leaving each instance's queue since startup, by routed language",
+    ("language", "instance"), collect=_jobs_completed))
+registry.register(Gauge(
+    "subbrainarr_websocket_clients", "Connected /ws clients on this worker", collect=_ws_clients))
+registry.register(Counter(
+    "subbrainarr_websocket_evicted", "/ws clients dropped for falling behind since startup", collect=_ws_evicted))
+
+
+def _endpoint_label(path: str) -> str:
+    """/batch?directory=... and /status -> "/batch", "/status"; one segment keeps cardinality low."""
+    segments = [s for s in path.split("/") if s]
+    return "/" + segments[0] if segments else "/"
+
+
+class MeteredTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint_label(request.url.path)
+        started = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except httpx.HTTPError as e:
+            subgen_errors.inc(endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            subgen_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+        subgen_requests.inc(endpoint=endpoint, status=f"{response.status_code // 100}xx")
+        if response.status_code >= 500:
+            subgen_errors.inc(endpoint=endpoint, error=f"HTTP {response.status_code}")
+        return response
+
+
+def subgen_client(**kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient for talking to Subgen, with per-endpoint metrics."""
+    return httpx.AsyncClient(transport=MeteredTransport(), **kwargs)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            # Route templates, not raw paths, so /api/languages/{code} is one series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=route, status=str(status))
+            http_latency.observe(time.perf_counter() - started, method=method, route=route)
+
+
+async def _refresh_instance_languages():
+    from .settings import load_settings
+
+    settings = await asyncio.to_thread(load_settings)
+    _instance_languages.clear()
+    for code, url in settings.language_routes.items():
+        _instance_languages[url.rstrip("/")] = code
+
+
+async def measure_loop_lag():
+    """Background task started from main.py: how late does a timer fire?"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(_LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.perf_counter() - started - _LOOP_LAG_INTERVAL_SECONDS)
+        loop_lag.set(round(lag, 6))
+        loop_lag_histogram.observe(lag)
+
+
+def _write_textfile(text: str):
+    temp = f"{TEXTFILE_PATH}.{os.getpid()}.tmp"
+    with open(temp, "w") as f:
+        f.write(text)
+    os.replace(temp, TEXTFILE_PATH)
+
+
+async def textfile_loop():
+    """Write the registry to METRICS_TEXTFILE for node_exporter's textfile collector.
+
+    Runs in every worker, but only the lease holder writes.
+    """
+    if not TEXTFILE_PATH:
+        return
+    owner = shared_state.worker_id()
+    while True:
+        try:
+            leader = await asyncio.to_thread(
+                shared_state.try_acquire_lease, _TEXTFILE_LEASE_NAME, owner, TEXTFILE_INTERVAL_SECONDS * 3
+            )
+            if leader:
+                await _refresh_instance_languages()
+                await asyncio.to_thread(_write_textfile, registry.render(openmetrics=False))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Metrics textfile error: {e}")
+        await asyncio.sleep(TEXTFILE_INTERVAL_SECONDS)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """OpenMetrics if the scraper accepts it, else Prometheus text format 0.0.4."""
+    await _refresh_instance_languages()
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    return Response(
+        registry.render(openmetrics=openmetrics),
+        media_type=OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE,
+    )
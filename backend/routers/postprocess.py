@@ -0,0 +1,305 @@
+"""
+Subtitle post-processing - strip hallucinated cues from Subgen's output
+
+Same spirit as Subgen's SSA_FIX_ENCODING / SSA_FIX_NEWLINES, one step
+further. Re-transcribing a file to fix ten bad cues costs GPU-minutes;
+rewriting it costs milliseconds. For every subtitle Subgen produces:
+
+  - drop cues that are nothing but a known hallucination phrase and sit
+    next to a long silence or repeat a neighbour — a phrase inside real
+    dialogue ("じゃあ、おやすみなさい、お母さん。") is never enough
+  - drop pure symbol noise
+  - collapse verbatim repeats into one cue spanning the whole run
+  - drop short cues stranded in a long silence gap
+
+Phrases are picked by the language of the subtitle text, not the audio.
+Files are parsed and written as streams, replaced atomically (temp file +
+rename), and processed in the shared worker pool; the first time a file
+is changed its original is kept next to it as <name>.bak. A watcher picks
+up new files in the configured folders; POST /run handles a folder on
+demand, e.g. right after a scan completes.
+"""
+import asyncio
+import os
+import time
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from . import shared_state
+from .hallucinations import _is_spaced_script, matcher_for, normalize_text
+from .language_routing import subtitle_text_language
+from .subtitles import Cue, atomic_rewrite, find_subtitle_files, is_subgen_output, iter_cues, keep_original
+
+router = APIRouter()
+
+CACHE_NAMESPACE = "postprocess"
+
+# Files modified more recently than this may still be being written by Subgen
+_SETTLE_SECONDS = 15
+_WATCH_INTERVAL_SECONDS = 30
+_LEASE_NAME = "postprocess_watcher"
+
+# A phrase cue may carry this much other text (share of its characters)
+_PHRASE_RESIDUE_SHARE = 0.25
+
+
+class CleanOptions(BaseModel):
+    gap_seconds: float = 8.0         # Silence on both sides of a stranded cue
+    max_isolated_words: int = 4      # Stranded cues longer than this are kept
+    drop_phrases: bool = True
+    collapse_repeats: bool = True
+    drop_isolated: bool = True
+    extra_phrases: Dict[str, List[str]] = {}
+    keep_backup: bool = True
+
+
+def _is_whole_phrase(text: str, matches) -> bool:
+    """True when the matched phrases make up (nearly) all of the cue's text."""
+    residue = text
+    for phrase in sorted(matches, key=len, reverse=True):
+        residue = residue.replace(phrase, " ")
+    return len(residue.replace(" ", "")) <= _PHRASE_RESIDUE_SHARE * len(text.replace(" ", ""))
+
+
+def _word_count(text: str) -> int:
+    """Words in normalized text; unspaced scripts (CJK, Thai) count ~2 characters a word."""
+    if not text or _is_spaced_script(text[0]):
+        return len(text.split())
+    return (len(text.replace(" ", "")) + 1) // 2
+
+
+def clean_cues(cues: List[Cue], language: Optional[str], options: CleanOptions) -> Tuple[List[Cue], Dict[str, int]]:
+    """Return the cleaned cue list and counts of what was removed."""
+    matcher = matcher_for(language, options.extra_phrases)
+    removed = {"phrase": 0, "noise": 0, "repeat": 0, "isolated": 0}
+
+    # Pass 1: hallucination phrases and symbol-only noise. A phrase cue also
+    # needs corroboration: silence on one side, or the same text next to it
+    normalized = [normalize_text(cue.text) for cue in cues]
+    kept: List[Tuple[Cue, str]] = []
+    for index, cue in enumerate(cues):
+        text = normalized[index]
+        if options.drop_phrases and cue.lines and not text:
+            removed["noise"] += 1
+            continue
+        if options.drop_phrases and text:
+            matches = matcher.find(text)
+            if matches and _is_whole_phrase(text, matches):
+                gap_before = cue.start - cues[index - 1].end if index > 0 else cue.start
+                gap_after = cues[index + 1].start - cue.end if index + 1 < len(cues) else options.gap_seconds
+                silence = max(gap_before, gap_after) >= options.gap_seconds
+                repeated = (index > 0 and normalized[index - 1] == text) or (
+                    index + 1 < len(cues) and normalized[index + 1] == text
+                )
+                if silence or repeated:
+                    removed["phrase"] += 1
+                    continue
+        kept.append((cue, text))
+
+    # Pass 2: collapse runs of identical cues, and identical lines inside a cue
+    collapsed: List[Tuple[Cue, str]] = []
+    for cue, text in kept:
+        if options.collapse_repeats:
+            # ASS cues are rewritten from their raw line to keep styling,
+            # so only SRT gets duplicate lines removed
+            if cue.raw is None:
+                cue = cue._replace(lines=list(dict.fromkeys(cue.lines)))
+            if collapsed and text and collapsed[-1][1] == text:
+                previous = collapsed[-1][0]
+                collapsed[-1] = (previous._replace(end=max(previous.end, cue.end)), text)
+                removed["repeat"] += 1
+                continue
+        collapsed.append((cue, text))
+
+    # Pass 3: short cues stranded between long silences
+    result: List[Cue] = []
+    for index, (cue, text) in enumerate(collapsed):
+        if options.drop_isolated:
+            gap_before = cue.start - collapsed[index - 1][0].end if index > 0 else cue.start
+            gap_after = collapsed[index + 1][0].start - cue.end if index + 1 < len(collapsed) else options.gap_seconds
+            if (
+                gap_before >= options.gap_seconds
+                and gap_after >= options.gap_seconds
+                and _word_count(text) <= options.max_isolated_words
+            ):
+                removed["isolated"] += 1
+                continue
+        result.append(cue)
+
+    return result, removed
+
+
+def process_file(path: str, language: Optional[str], options: CleanOptions, dry_run: bool = False) -> Dict:
+    """Clean one file in place. Returns a JSON-able summary."""
+    cues = list(iter_cues(path))
+    cleaned, removed = clean_cues(cues, language, options)
+    changed = sum(removed.values()) > 0
+    if changed and not dry_run:
+        if options.keep_backup:
+            keep_original(path)
+        atomic_rewrite(path, cleaned)
+    return {"language": language, "cues_before": len(cues), "cues_after": len(cleaned), "removed": removed, "changed": changed}
+
+
+def process_files(items: List[Tuple[str, Optional[str]]], options: CleanOptions, dry_run: bool) -> List[Tuple]:
+    """Pool worker: returns (path, mtime, size, summary) after processing."""
+    results = []
+    for path, language in items:
+        try:
+            summary = process_file(path, language, options, dry_run)
+            st = os.stat(path)
+            results.append((path, st.st_mtime, st.st_size, summary))
+        except (OSError, UnicodeError, ValueError) as e:
+            results.append((path, 0.0, 0, {"language": language, "error": str(e), "changed": False}))
+    return results
+
+
+def _options_from_settings(settings) -> CleanOptions:
+    return CleanOptions(
+        gap_seconds=settings.hallucination_gap_seconds,
+        max_isolated_words=settings.postprocess_max_isolated_words,
+        extra_phrases=settings.hallucination_phrases,
+    )
+
+
+def _find_pending(folders: List[str], settings, force: bool) -> List[Tuple[str, Optional[str]]]:
+    """Subtitle files that are new or changed since they were last processed."""
+    from .language_routing import cached_folder_languages
+
+    only_subgen = settings.postprocess_only_subgen_files
+    cache = {} if force else shared_state.get_file_cache(CACHE_NAMESPACE)
+    folder_languages = cached_folder_languages()
+    now = time.time()
+    pending = []
+    for folder in folders:
+        for path in find_subtitle_files(folder):
+            if only_subgen and not is_subgen_output(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime < _SETTLE_SECONDS:
+                continue
+            cached = cache.get(path)
+            if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+                continue
+            pending.append((path, subtitle_text_language(path, folder_languages, settings)))
+    return pending
+
+
+async def run_postprocess(folders: List[str], dry_run: bool = False, force: bool = False) -> Dict:
+    """Clean every new/changed subtitle under folders. Returns totals."""
+    from .settings import load_settings
+    from .workers import iter_chunk_results
+
+    settings = load_settings()
+    pending = await asyncio.to_thread(_find_pending, folders, settings, force)
+
+    totals = {"files_checked": len(pending), "files_changed": 0, "files_failed": 0, "cues_removed": 0}
+    removed_by_reason: Dict[str, int] = {}
+    worker = partial(process_files, options=_options_from_settings(settings), dry_run=dry_run)
+
+    async for chunk in iter_chunk_results(worker, pending, chunk_size=32):
+        if not dry_run:
+            await asyncio.to_thread(
+                shared_state.put_file_cache, CACHE_NAMESPACE, [r for r in chunk if not r[3].get("error")]
+            )
+        for _, _, _, summary in chunk:
+            if summary.get("error"):
+                totals["files_failed"] += 1
+                continue
+            if summary["changed"]:
+                totals["files_changed"] += 1
+            for reason, count in summary["removed"].items():
+                removed_by_reason[reason] = removed_by_reason.get(reason, 0) + count
+                totals["cues_removed"] += count
+
+    result = {**totals, "removed_by_reason": removed_by_reason, "dry_run": dry_run, "finished": time.time()}
+    # Idle watcher passes shouldn't overwrite the last meaningful run
+    if not dry_run and pending:
+        await shared_state.set_value_async("postprocess_last_run", result)
+        if totals["files_changed"]:
+            await shared_state.publish_async("broadcast", {"type": "postprocess_completed", **totals})
+    return result
+
+
+def _watch_folders(settings) -> List[str]:
+    folders = settings.postprocess_folders or settings.transcribe_folders
+    return [f for f in folders if os.path.isdir(f)]
+
+
+async def watch_loop():
+    """Background watcher: post-process new Subgen output as it appears.
+
+    Runs in every worker, but only the lease holder does any work.
+    """
+    from .settings import load_settings
+
+    owner = shared_state.worker_id()
+    while True:
+        try:
+            settings = await asyncio.to_thread(load_settings)
+            if settings.postprocess_enabled:
+                leader = await asyncio.to_thread(
+                    shared_state.try_acquire_lease, _LEASE_NAME, owner, _WATCH_INTERVAL_SECONDS * 3
+                )
+                folders = _watch_folders(settings)
+                if leader and folders:
+                    await run_postprocess(folders)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Post-processing watcher error: {e}")
+        await asyncio.sleep(_WATCH_INTERVAL_SECONDS)
+
+
+class RunRequest(BaseModel):
+    directory: str
+    dry_run: bool = False  # Report what would be removed without rewriting
+    force: bool = False    # Reprocess files even if unchanged since last run
+
+class WatcherRequest(BaseModel):
+    enabled: bool
+    folders: Optional[List[str]] = None
+
+
+@router.post("/run")
+async def run(request: RunRequest):
+    """Post-process every Subgen subtitle under a directory now."""
+    if not os.path.isdir(request.directory):
+        raise HTTPException(status_code=400, detail=f"Directory not found: {request.directory}")
+    return await run_postprocess([request.directory], dry_run=request.dry_run, force=request.force)
+
+
+@router.post("/watcher")
+async def configure_watcher(request: WatcherRequest):
+    """Turn the folder watcher on/off (persisted in settings)."""
+    from .settings import modify_settings
+
+    def _apply(settings):
+        settings.postprocess_enabled = request.enabled
+        if request.folders is not None:
+            settings.postprocess_folders = request.folders
+
+    settings = await asyncio.to_thread(modify_settings, _apply)
+    if settings is None:
+        return {"success": False, "error": "Failed to save settings"}
+    return {"success": True, "enabled": settings.postprocess_enabled, "folders": _watch_folders(settings)}
+
+
+@router.get("/status")
+async def status():
+    """Watcher configuration and the result of the last run."""
+    from .settings import load_settings
+
+    settings = load_settings()
+    return {
+        "watcher_enabled": settings.postprocess_enabled,
+        "folders": _watch_folders(settings),
+        "only_subgen_files": settings.postprocess_only_subgen_files,
+        "last_run": await shared_state.get_value_async("postprocess_last_run"),
+    }
@@ -0,0 +1,355 @@
+"""
+Profiling router - find out why an endpoint is slow, in production
+
+Admin only: set ADMIN_TOKEN and send it as X-Admin-Token. Without
+ADMIN_TOKEN every endpoint here answers 404.
+
+CPU: a session samples the event-loop thread's stack every few
+milliseconds, either for the next N requests to a route or for a time
+window. Samples are attributed to the request being served (the same
+task-to-route mapping the loop watchdog uses), so other traffic doesn't
+pollute the profile. Results come back as a call tree and as folded
+stacks, which flamegraph.pl, speedscope and inferno read directly.
+Work handed to threads (asyncio.to_thread, the process pool) is not on
+the loop thread and doesn't show up.
+
+Memory: tracemalloc snapshots and diffs between them, for growth that
+builds up over days.
+
+Disabled costs nothing: no sampler thread exists, tracemalloc is off,
+and the middleware only checks whether a session is active.
+
+Everything here lives in the worker process that served the request:
+a session samples that worker's loop, and snapshots are that worker's
+heap. With WORKERS > 1 follow-up requests may land on another worker,
+so every response names its worker and lookups that miss say which
+worker answered. Profile with WORKERS=1, or repeat the request until
+the worker matches.
+"""
+import asyncio
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from . import shared_state
+from .loop_watchdog import _current_task, _describe_task
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_MAX_SECONDS = 300
+_MAX_DEPTH = 64
+_KEEP_SESSIONS = 5
+_KEEP_SNAPSHOTS = 5
+_TREE_MIN_FRACTION = 0.005  # Hide call tree nodes under 0.5% of samples
+
+_WORKER = shared_state.worker_id()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+class SessionRequest(BaseModel):
+    route: Optional[str] = None  # Route template ("/api/hardware/detect") or path prefix; None = everything
+    requests: Optional[int] = None  # Stop after this many matching requests...
+    seconds: float = 30.0  # ...or after this long, whichever comes first
+    interval_ms: float = 5.0
+
+
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_BACKEND_DIR):
+        filename = os.path.relpath(filename, _BACKEND_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    names = []
+    while frame is not None and len(names) < _MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+class ProfileSession:
+    _ids = itertools.count(1)
+
+    def __init__(self, request: SessionRequest, loop: asyncio.AbstractEventLoop):
+        self.id = next(self._ids)
+        self.route = request.route
+        self.max_requests = request.requests
+        self.interval = min(max(request.interval_ms, 1.0), 100.0) / 1000
+        self.started = time.time()
+        self.deadline = time.monotonic() + min(max(request.seconds, 1.0), _MAX_SECONDS)
+        self.finished: Optional[float] = None
+        self.requests_seen = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+
+    def matches(self, route: Optional[str], path: Optional[str]) -> bool:
+        if self.route is None:
+            return True
+        return route == self.route or (path or "").startswith(self.route)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if self.finished is None:
+            self.finished = time.time()
+        self._stop.set()
+
+    @property
+    def active(self) -> bool:
+        return self.finished is None
+
+    def request_done(self, route: Optional[str], path: Optional[str]):
+        if self.matches(route, path):
+            self.requests_seen += 1
+            if self.max_requests and self.requests_seen >= self.max_requests:
+                self.stop()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > self.deadline:
+                self.stop()
+                break
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            task = _current_task(self._loop)
+            if task is None:
+                if self.route is None:
+                    self.stacks[("(event loop idle or callbacks)",)] += 1
+                    self.samples += 1
+                continue
+            described = _describe_task(task)
+            if not self.matches(described["route"], described["path"]):
+                continue
+            self.stacks[(described["route"],) + _stack(frame)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def tree(self) -> Dict[str, Any]:
+        root: Dict[str, Any] = {"name": "all", "total": 0, "self": 0, "children": {}}
+        for stack, count in self.stacks.items():
+            node = root
+            node["total"] += count
+            for name in stack:
+                node = node["children"].setdefault(name, {"name": name, "total": 0, "self": 0, "children": {}})
+                node["total"] += count
+            node["self"] += count
+        return _prune(root, max(1, int(root["total"] * _TREE_MIN_FRACTION)))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "worker": _WORKER,
+            "route": self.route,
+            "active": self.active,
+            "started": self.started,
+            "finished": self.finished,
+            "interval_ms": round(self.interval * 1000, 1),
+            "requests_profiled": self.requests_seen,
+            "max_requests": self.max_requests,
+            "samples": self.samples,
+        }
+
+
+def _prune(node: Dict[str, Any], minimum: int) -> Dict[str, Any]:
+    children = sorted(node["children"].values(), key=lambda n: n["total"], reverse=True)
+    return {
+        "name": node["name"],
+        "total": node["total"],
+        "self": node["self"],
+        "children": [_prune(child, minimum) for child in children if child["total"] >= minimum],
+    }
+
+
+_sessions: Deque[ProfileSession] = deque(maxlen=_KEEP_SESSIONS)
+_active: Optional[ProfileSession] = None
+
+
+class ProfilingMiddleware:
+    """Counts finished requests for the active session; a None check otherwise."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _active is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session = _active
+            if session is not None:
+                session.request_done(getattr(scope.get("route"), "path", None), scope.get("path"))
+                if not session.active:
+                    _clear_active(session)
+
+
+def _clear_active(session: ProfileSession):
+    global _active
+    if _active is session:
+        _active = None
+
+
+def _get_session(session_id: int) -> ProfileSession:
+    for session in _sessions:
+        if session.id == session_id:
+            if not session.active and _active is session:
+                _clear_active(session)
+            return session
+    raise HTTPException(status_code=404, detail=f"No profiling session {session_id} on worker {_WORKER}")
+
+
+@router.post("/sessions")
+async def start_session(request: SessionRequest):
+    """Start sampling; only one session runs at a time."""
+    global _active
+    if _active is not None and _active.active:
+        raise HTTPException(status_code=409, detail=f"Profiling session {_active.id} is still running on worker {_WORKER}")
+    session = ProfileSession(request, asyncio.get_running_loop())
+    _sessions.append(session)
+    _active = session
+    session.start()
+    return session.summary()
+
+
+@router.get("/sessions")
+async def list_sessions():
+    return {"worker": _WORKER, "sessions": [s.summary() for s in reversed(_sessions)]}
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: int):
+    """Summary and aggregated call tree (sample counts; total includes callees)."""
+    session = _get_session(session_id)
+    return {**session.summary(), "tree": session.tree()}
+
+
+@router.get("/sessions/{session_id}/folded", response_class=PlainTextResponse)
+async def get_folded(session_id: int):
+    """Folded stacks for flamegraph.pl, speedscope or inferno."""
+    return PlainTextResponse(_get_session(session_id).folded(), headers={"X-Worker": _WORKER})
+
+
+@router.post("/sessions/{session_id}/stop")
+async def stop_session(session_id: int):
+    session = _get_session(session_id)
+    session.stop()
+    _clear_active(session)
+    return session.summary()
+
+
+# Memory: tracemalloc snapshots
+
+_snapshots: Dict[int, Tuple[float, tracemalloc.Snapshot]] = {}
+_snapshot_ids = itertools.count(1)
+
+
+def _top(stats, limit: int) -> List[Dict[str, Any]]:
+    rows = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        row = {"location": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            row.update({"size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff})
+        rows.append(row)
+    return rows
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    # Leave out tracemalloc's own bookkeeping
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+
+
+@router.post("/memory/start")
+async def start_tracemalloc(frames: int = 10):
+    """Start tracing allocations. Costs memory and some speed until stopped."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(min(max(frames, 1), 50))
+    return {"worker": _WORKER, "tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+@router.post("/memory/stop")
+async def stop_tracemalloc():
+    tracemalloc.stop()
+    _snapshots.clear()
+    return {"worker": _WORKER, "tracing": False}
+
+
+@router.post("/memory/snapshot")
+async def take_snapshot(limit: int = 25):
+    """Snapshot current allocations; returns the largest by source line."""
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=400, detail=f"tracemalloc is not running on worker {_WORKER}; POST /memory/start first")
+    snapshot = await asyncio.to_thread(_take_snapshot)
+    snapshot_id = next(_snapshot_ids)
+    _snapshots[snapshot_id] = (time.time(), snapshot)
+    for old in sorted(_snapshots)[:-_KEEP_SNAPSHOTS]:
+        del _snapshots[old]
+
+    current, peak = tracemalloc.get_traced_memory()
+    stats = await asyncio.to_thread(snapshot.statistics, "lineno")
+    return {
+        "id": snapshot_id,
+        "worker": _WORKER,
+        "traced_mb": round(current / 1e6, 2),
+        "peak_mb": round(peak / 1e6, 2),
+        "top": _top(stats, limit),
+    }
+
+
+@router.get("/memory/diff")
+async def diff_snapshots(base: int, target: Optional[int] = None, limit: int = 25):
+    """Growth between two snapshots (target defaults to a fresh one), largest first."""
+    if base not in _snapshots:
+        raise HTTPException(status_code=404, detail=f"No snapshot {base} on worker {_WORKER}; kept: {sorted(_snapshots)}")
+    if target is not None and target not in _snapshots:
+        raise HTTPException(status_code=404, detail=f"No snapshot {target} on worker {_WORKER}; kept: {sorted(_snapshots)}")
+    if target is None and not tracemalloc.is_tracing():
+        raise HTTPException(status_code=400, detail=f"tracemalloc is not running on worker {_WORKER}")
+
+    base_time, base_snapshot = _snapshots[base]
+    target_time, target_snapshot = _snapshots[target] if target else (time.time(), await asyncio.to_thread(_take_snapshot))
+    stats = await asyncio.to_thread(target_snapshot.compare_to, base_snapshot, "lineno")
+    return {
+        "worker": _WORKER,
+        "base": base,
+        "target": target,
+        "seconds_between": round(target_time - base_time, 1),
+        "growth_mb": round(sum(s.size_diff for s in stats) / 1e6, 2),
+        "top": _top(stats, limit),
+    }
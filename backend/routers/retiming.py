@@ -0,0 +1,341 @@
+"""
+Reading-speed normalizer - fix existing subtitles without re-running Whisper
+
+The tuning wizard's patience/length_penalty changes only help files
+transcribed after the change. This router retimes the subtitles already
+on disk to hit each language's reading profile:
+
+  1. split   — cues with more text than fits on two lines are split at
+               sentence/word boundaries, time shared out by length
+  2. merge   — runs of tiny back-to-back cues that flash by too fast are
+               joined into one
+  3. extend  — cues still above the target characters-per-second borrow
+               display time from the silence around them
+  4. wrap    — lines longer than the max length are re-broken into
+               balanced lines; existing breaks are kept, so two-speaker
+               "- Are you coming?" / "- No." cues stay two lines
+
+ASS/SSA cues carry styling in their raw text, so they only get step 3.
+Targets come from languages.get_reading_profile() for the language the
+subtitle text is written in — translated output of Japanese audio is
+English and gets the English profile — overridden per language by
+target_cps / max_line_length in settings.language_configs. The first time
+a file is rewritten its original is kept next to it as <name>.bak.
+"""
+import asyncio
+import os
+import re
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from .languages import get_reading_profile
+from .language_routing import subtitle_text_language
+from .subtitles import Cue, atomic_rewrite, find_subtitle_files, is_subgen_output, iter_cues, keep_original
+
+router = APIRouter()
+
+# Minimum blank time kept between consecutive cues so players don't merge them
+_MIN_GAP = 0.08
+# Cues closer than this are considered back-to-back for merging
+_MERGE_GAP = 0.3
+# A cue may appear at most this long before its speech starts
+_MAX_LEAD_IN = 0.5
+# Timestamps are written with millisecond precision; don't chase rounding
+_TIMING_TOLERANCE = 0.01
+
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?。！？…])\s+")
+# "- Line" / "– Line": one speaker's line in a two-speaker cue
+_DIALOGUE_DASH_RE = re.compile(r"^[-–—]\s*\S")
+
+
+def resolve_reading_profile(language: Optional[str], language_configs: Dict) -> Dict[str, float]:
+    """Reading profile for a language with user overrides applied."""
+    profile = get_reading_profile(language or "")
+    config = language_configs.get(language) if language else None
+    if config is not None:
+        if getattr(config, "target_cps", None):
+            profile["target_cps"] = config.target_cps
+            profile["max_cps"] = max(profile["max_cps"], config.target_cps)
+        if getattr(config, "max_line_length", None):
+            profile["max_line_length"] = config.max_line_length
+    return profile
+
+
+def _is_spaced(text: str) -> bool:
+    return " " in text.strip()
+
+
+def wrap_text(text: str, max_line: int) -> List[str]:
+    """Break text into as few, as evenly long lines as fit max_line."""
+    text = " ".join(text.split())
+    if len(text) <= max_line:
+        return [text] if text else []
+
+    if not _is_spaced(text):
+        # CJK and other unspaced scripts: break by character count
+        count = -(-len(text) // max_line)
+        size = -(-len(text) // count)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    words = text.split(" ")
+    line_count = -(-len(text) // max_line)
+    while True:
+        target = len(text) / line_count
+        lines, current = [], ""
+        for word in words:
+            candidate = f"{current} {word}".strip()
+            if current and (len(candidate) > max_line or (len(current) >= target and len(lines) < line_count - 1)):
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        lines.append(current)
+        if all(len(line) <= max_line for line in lines) or line_count >= len(words):
+            return lines
+        line_count += 1
+
+
+def wrap_lines(lines: List[str], max_line: int) -> List[str]:
+    """Keep the existing line breaks; only re-break lines longer than max_line."""
+    wrapped: List[str] = []
+    for line in lines:
+        if len(line) <= max_line:
+            wrapped.append(line)
+        else:
+            wrapped.extend(wrap_text(line, max_line))
+    return wrapped
+
+
+def _has_dialogue_dashes(cue: Cue) -> bool:
+    return len(cue.lines) > 1 and any(_DIALOGUE_DASH_RE.match(line) for line in cue.lines)
+
+
+def _split_text(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring sentence breaks."""
+    chunks: List[str] = []
+    for sentence in _SENTENCE_BREAK_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars + 1)
+            if cut <= 0:
+                cut = max_chars
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if chunks and len(chunks[-1]) + 1 + len(sentence) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {sentence}"
+        else:
+            chunks.append(sentence)
+    return chunks
+
+
+def _split_cue(cue: Cue, max_chars: int) -> List[Cue]:
+    # Splitting re-flows text across lines, which would fuse two speakers' lines
+    if cue.raw is not None or len(cue.text) <= max_chars or _has_dialogue_dashes(cue):
+        return [cue]
+    chunks = _split_text(cue.text, max_chars)
+    if len(chunks) < 2:
+        return [cue]
+    total = sum(len(c) for c in chunks)
+    parts, start = [], cue.start
+    for chunk in chunks:
+        end = start + cue.duration * len(chunk) / total
+        parts.append(Cue(start, end, [chunk]))
+        start = end
+    return parts
+
+
+def _merge_fast_cues(cues: List[Cue], profile: Dict[str, float], max_chars: int) -> List[Cue]:
+    merged: List[Cue] = []
+    for cue in cues:
+        if merged and cue.raw is None and merged[-1].raw is None:
+            previous = merged[-1]
+            combined_chars = len(previous.text) + 1 + len(cue.text)
+            too_fast = (
+                len(previous.text) / max(previous.duration, 0.01) > profile["max_cps"]
+                or len(cue.text) / max(cue.duration, 0.01) > profile["max_cps"]
+            )
+            if (
+                too_fast
+                and cue.start - previous.end <= _MERGE_GAP
+                and combined_chars <= max_chars
+                and cue.end - previous.start <= profile["max_duration"]
+            ):
+                merged[-1] = Cue(previous.start, cue.end, previous.lines + cue.lines)
+                continue
+        merged.append(cue)
+    return merged
+
+
+def _extend_durations(cues: List[Cue], profile: Dict[str, float]) -> List[Cue]:
+    """Borrow display time from surrounding gaps for cues that read too fast."""
+    result = list(cues)
+    for index, cue in enumerate(result):
+        chars = len(cue.text)
+        wanted = max(chars / profile["target_cps"], profile["min_duration"])
+        wanted = min(wanted, profile["max_duration"])
+        if cue.duration >= wanted - _TIMING_TOLERANCE:
+            continue
+
+        start, end = cue.start, cue.end
+        limit_after = result[index + 1].start - _MIN_GAP if index + 1 < len(result) else end + wanted
+        end = min(start + wanted, max(end, limit_after))
+
+        if end - start < wanted:
+            limit_before = result[index - 1].end + _MIN_GAP if index > 0 else 0.0
+            limit_before = max(limit_before, start - _MAX_LEAD_IN)
+            start = max(end - wanted, min(start, limit_before))
+
+        result[index] = cue._replace(start=start, end=end)
+    return result
+
+
+def normalize_cues(cues: List[Cue], profile: Dict[str, float]) -> Tuple[List[Cue], Dict[str, int]]:
+    """Apply split → merge → extend → wrap. Returns cues and change counts."""
+    max_line = int(profile["max_line_length"])
+    max_chars = max_line * 2
+
+    split: List[Cue] = []
+    for cue in cues:
+        split.extend(_split_cue(cue, max_chars))
+    merged = _merge_fast_cues(split, profile, max_chars)
+    extended = _extend_durations(merged, profile)
+
+    wrapped: List[Cue] = []
+    rewrapped = 0
+    for cue in extended:
+        if cue.raw is None:
+            lines = wrap_lines(cue.lines, max_line)
+            if lines != cue.lines:
+                rewrapped += 1
+                cue = cue._replace(lines=lines)
+        wrapped.append(cue)
+
+    retimed = sum(
+        1 for before, after in zip(merged, extended) if (before.start, before.end) != (after.start, after.end)
+    )
+    changes = {
+        "split": len(split) - len(cues),
+        "merged": len(split) - len(merged),
+        "retimed": retimed,
+        "rewrapped": rewrapped,
+    }
+    return wrapped, changes
+
+
+def _too_fast_share(cues: List[Cue], profile: Dict[str, float]) -> float:
+    timed = [c for c in cues if c.duration > 0 and c.lines]
+    if not timed:
+        return 0.0
+    return round(sum(1 for c in timed if len(c.text) / c.duration > profile["max_cps"]) / len(timed), 4)
+
+
+def retime_files(items: List[Tuple[str, Optional[str]]], profiles: Dict[str, Dict[str, float]], dry_run: bool,
+                 keep_backup: bool = True) -> List[Dict]:
+    """Pool worker: normalize each (path, language) file in place."""
+    results = []
+    for path, language in items:
+        profile = profiles.get(language or "", profiles[""])
+        try:
+            cues = list(iter_cues(path))
+            normalized, changes = normalize_cues(cues, profile)
+            changed = any(changes.values())
+            if changed and not dry_run:
+                if keep_backup:
+                    keep_original(path)
+                atomic_rewrite(path, normalized)
+            results.append({
+                "path": path,
+                "language": language,
+                "changed": changed,
+                "changes": changes,
+                "too_fast_before": _too_fast_share(cues, profile),
+                "too_fast_after": _too_fast_share(normalized, profile),
+            })
+        except (OSError, UnicodeError, ValueError) as e:
+            results.append({"path": path, "language": language, "changed": False, "error": str(e)})
+    return results
+
+
+class RetimeRequest(BaseModel):
+    directories: List[str]
+    languages: Optional[List[str]] = None  # Only files whose text is in these languages
+    only_subgen_files: bool = True
+    dry_run: bool = False
+    keep_backup: bool = True  # Copy each file to <name>.bak before its first rewrite
+
+
+def _collect(request: RetimeRequest, settings) -> List[Tuple[str, Optional[str]]]:
+    from .language_routing import cached_folder_languages
+
+    folder_languages = cached_folder_languages()
+    items = []
+    for directory in request.directories:
+        for path in find_subtitle_files(directory):
+            if request.only_subgen_files and not is_subgen_output(path):
+                continue
+            language = subtitle_text_language(path, folder_languages, settings)
+            if request.languages and language not in request.languages:
+                continue
+            items.append((path, language))
+    return items
+
+
+@router.post("/run")
+async def run_retiming(request: RetimeRequest):
+    """
+    Retime existing subtitles to each language's reading profile.
+    Runs across all cores; a dry run reports what would change.
+    """
+    from .settings import load_settings
+    from .workers import map_chunks
+
+    missing = [d for d in request.directories if not os.path.isdir(d)]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Directory not found: {', '.join(missing)}")
+
+    settings = load_settings()
+    items = await asyncio.to_thread(_collect, request, settings)
+    language_configs = settings.language_configs
+    profiles = {lang or "": resolve_reading_profile(lang, language_configs) for lang in {lang for _, lang in items}}
+    profiles[""] = resolve_reading_profile(None, language_configs)
+
+    chunks = await map_chunks(partial(retime_files, profiles=profiles, dry_run=request.dry_run, keep_backup=request.keep_backup), items, chunk_size=32)
+    files = [result for chunk in chunks for result in chunk]
+
+    totals = {"split": 0, "merged": 0, "retimed": 0, "rewrapped": 0}
+    per_language: Dict[str, Dict[str, float]] = {}
+    for result in files:
+        if result.get("error"):
+            continue
+        for key, value in result["changes"].items():
+            totals[key] += value
+        entry = per_language.setdefault(result["language"] or "unknown", {"files": 0, "too_fast_before": 0.0, "too_fast_after": 0.0})
+        entry["files"] += 1
+        entry["too_fast_before"] += result["too_fast_before"]
+        entry["too_fast_after"] += result["too_fast_after"]
+
+    for entry in per_language.values():
+        entry["too_fast_before"] = round(entry["too_fast_before"] / entry["files"], 4)
+        entry["too_fast_after"] = round(entry["too_fast_after"] / entry["files"], 4)
+
+    return {
+        "dry_run": request.dry_run,
+        "files_checked": len(files),
+        "files_changed": sum(1 for r in files if r["changed"]),
+        "files_failed": sum(1 for r in files if r.get("error")),
+        "changes": totals,
+        "languages": per_language,
+    }
+
+
+@router.get("/profile/{language_code}")
+async def get_profile(language_code: str):
+    """Reading targets used for a language."""
+    from .settings import load_settings
+
+    return resolve_reading_profile(language_code, load_settings().language_configs)
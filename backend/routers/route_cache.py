@@ -0,0 +1,131 @@
+"""
+Route cache - single-flight, TTL and stale-while-revalidate for GET handlers
+
+When the dashboard loads, its components fire the same handful of GETs
+at once (hardware recommendations, GitHub stars, scan status), and each
+one used to run its own subprocesses or upstream calls.
+Decorating a handler with @cached_route makes identical concurrent calls
+share one computation:
+
+  - fresh (younger than ttl): served from memory
+  - stale (within ttl + stale): served from memory while one background
+    call refreshes it
+  - expired or missing: the first caller computes; everyone arriving
+    meanwhile awaits the same result
+
+The cache key is the handler's arguments, so /scan-status is cached per
+Subgen URL. Handlers that read settings also pass `version`, which is
+added to the key: after a save, every worker misses and recomputes.
+
+Exceptions are never cached and neither are results that `cache_if`
+rejects (error payloads), so a failing upstream is retried on the next
+request. Results are shared between callers: treat them as read-only.
+Per worker, like the rest of the in-memory state.
+
+Don't stack this on data that is already cached (the hardware sampler's
+snapshot): the ages add up.
+"""
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from . import metrics
+
+cache_requests = metrics.registry.register(metrics.Counter(
+    "subbrainarr_route_cache_requests",
+    "Cached route calls by outcome: hit, stale, coalesced (joined an in-flight call) or miss",
+    ("route", "result")))
+
+_MAX_ENTRIES = 128
+
+
+class RouteCache:
+    def __init__(self, name: str, ttl: float, stale: float = 0.0,
+                 cache_if: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.ttl = ttl
+        self.stale = stale
+        self.cache_if = cache_if
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                cache_requests.inc(route=self.name, result="hit")
+                return entry[1]
+            if age < self.ttl + self.stale:
+                cache_requests.inc(route=self.name, result="stale")
+                if key not in self._inflight:
+                    self._start(key, compute).add_done_callback(self._log_refresh_error)
+                return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            cache_requests.inc(route=self.name, result="coalesced")
+        else:
+            cache_requests.inc(route=self.name, result="miss")
+            task = self._start(key, compute)
+        # Shielded: one caller disconnecting must not cancel the others' result
+        return await asyncio.shield(task)
+
+    def _start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._compute(key, compute))
+        self._inflight[key] = task
+        return task
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await compute()
+            if self.cache_if is None or self.cache_if(result):
+                self._entries[key] = (time.monotonic(), result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > _MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def _log_refresh_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background refresh of {self.name} failed: {task.exception()}")
+
+    def invalidate(self):
+        self._entries.clear()
+
+
+def _key(args: Tuple, kwargs: Dict) -> Hashable:
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        return repr(key)
+
+
+def cached_route(ttl: float, stale: float = 0.0, cache_if: Optional[Callable[[Any], bool]] = None,
+                 version: Optional[Callable[[], Hashable]] = None):
+    """
+    Decorate an async route handler (below @router.get). FastAPI still sees
+    the original signature; direct calls from other handlers share the cache.
+    The RouteCache is reachable as handler.cache, e.g. to invalidate it.
+    Entries from an older version() are never served; LRU evicts them.
+    """
+    def decorator(func):
+        cache = RouteCache(func.__name__, ttl, stale, cache_if)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = _key(args, kwargs)
+            if version is not None:
+                key = (version(), key)
+            return await cache.get(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -9,14 +9,24 @@ Subgen's batch scan API:
 
 Directory paths are inside Subgen's container (e.g. /media/library).
 Folder names with special chars (parens, apostrophes) must be URL-encoded.
+
+With a sharded deployment (settings.language_routes), folder scans are
+routed to the Subgen instance tuned for the folder's audio language.
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 from urllib.parse import quote
+import asyncio
+import os
 import httpx
 
-from .url_validation import validate_subgen_url
+from .url_validation import validate_subgen_url_async
+from .metrics import subgen_client
+from .route_cache import cached_route
+from .language_routing import detect_folder_language, resolve_route
+from .settings import load_settings
+from .storage_bench import scan_concurrency
 
 router = APIRouter()
 
@@ -29,6 +39,7 @@ class FolderScanRequest(BaseModel):
     subgen_url: str
     folder_name: str  # e.g. "Breaking Bad" or "Bob's Burgers (2011)"
     media_path: str = "/media"  # Parent media path inside Subgen container
+    route_by_language: bool = True  # Use settings.language_routes if configured
 
 class ScanResult(BaseModel):
     status: str
@@ -36,6 +47,41 @@ class ScanResult(BaseModel):
     reason: str
     message: str
     subgen_response: Optional[dict] = None
+    language: Optional[str] = None  # Detected audio language, when routed
+    routed_to: Optional[str] = None  # Subgen URL the folder was sent to
+
+class RoutedFolder(BaseModel):
+    folder: str
+    language: Optional[str] = None
+    source: str
+    routed_to: str
+    status: str
+    error: Optional[str] = None
+
+class RoutedScanResult(BaseModel):
+    status: str
+    folders: List[RoutedFolder]
+    routes_used: dict  # Subgen URL -> folder count
+
+
+async def _route_folder(directory: str, default_url: str, use_routes: bool = True, routes: Optional[dict] = None):
+    """Return (detected FolderLanguage or None, Subgen URL) for a directory.
+
+    Without configured language_routes this is a no-op that keeps the
+    caller's URL, so single-instance setups never pay for detection.
+    Callers routing many folders pass routes in to load settings once.
+    """
+    if routes is None:
+        routes = (await asyncio.to_thread(load_settings)).language_routes if use_routes else {}
+    if not routes:
+        return None, default_url
+
+    detected = await detect_folder_language(directory)
+    url = resolve_route(detected.language, routes, default_url)
+    valid, clean_url = await validate_subgen_url_async(url)
+    if not valid:
+        raise HTTPException(status_code=400, detail=f"Invalid routed Subgen URL for {detected.language}: {clean_url}")
+    return detected, clean_url
 
 
 async def _call_subgen_batch(clean_url: str, directory: str, reverse: bool = False) -> dict:
@@ -50,7 +96,7 @@ async def _call_subgen_batch(clean_url: str, directory: str, reverse: bool = Fal
     if reverse:
         batch_url += "&reverse=true"
 
-    async with httpx.AsyncClient() as client:
+    async with subgen_client() as client:
         response = await client.post(batch_url, timeout=30.0)
 
         if response.status_code == 200:
@@ -73,7 +119,7 @@ async def smart_scan(request: ScanRequest):
     Smart scan defaults to forward (A-Z) order which catches new content first.
     """
     # Validate URL to prevent SSRF
-    valid, clean_url = validate_subgen_url(request.subgen_url)
+    valid, clean_url = await validate_subgen_url_async(request.subgen_url)
     if not valid:
         raise HTTPException(status_code=400, detail=f"Invalid Subgen URL: {clean_url}")
 
@@ -127,7 +173,7 @@ async def folder_scan(request: FolderScanRequest):
     Folder name is combined with media_path to form the full directory.
     Special characters in folder names are URL-encoded automatically.
     """
-    valid, clean_url = validate_subgen_url(request.subgen_url)
+    valid, clean_url = await validate_subgen_url_async(request.subgen_url)
     if not valid:
         raise HTTPException(status_code=400, detail=f"Invalid Subgen URL: {clean_url}")
 
@@ -137,14 +183,21 @@ async def folder_scan(request: FolderScanRequest):
     # Build the full directory path inside Subgen's container
     full_path = f"{request.media_path.rstrip('/')}/{request.folder_name.strip()}"
 
+    detected, target_url = await _route_folder(full_path, clean_url, request.route_by_language)
+
     try:
-        result = await _call_subgen_batch(clean_url, full_path)
+        result = await _call_subgen_batch(target_url, full_path)
+        message = f"Folder scan triggered for '{request.folder_name}'"
+        if detected and detected.language:
+            message += f" ({detected.language} → {target_url})"
         return ScanResult(
             status="success",
             scan_type="folder",
             reason=f"User requested scan of: {request.folder_name}",
-            message=f"Folder scan triggered for '{request.folder_name}'",
-            subgen_response=result
+            message=message,
+            subgen_response=result,
+            language=detected.language if detected else None,
+            routed_to=target_url if detected else None,
         )
     except httpx.ConnectError:
         raise HTTPException(
@@ -159,18 +212,102 @@ async def folder_scan(request: FolderScanRequest):
             detail=f"Folder scan failed: {str(e)}"
         )
 
+@router.post("/routed-scan", response_model=RoutedScanResult)
+async def routed_scan(request: ScanRequest):
+    """
+    Library scan for sharded deployments — every top-level folder under
+    media_path goes to the Subgen instance tuned for its audio language.
+    Folders with no detectable language go to the request's subgen_url.
+    """
+    valid, clean_url = await validate_subgen_url_async(request.subgen_url)
+    if not valid:
+        raise HTTPException(status_code=400, detail=f"Invalid Subgen URL: {clean_url}")
+
+    base = request.media_path.rstrip("/")
+    try:
+        entries = await asyncio.to_thread(
+            lambda: sorted(e.name for e in os.scandir(base) if e.is_dir() and not e.name.startswith("."))
+        )
+    except OSError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{base}' is not visible to SubBrainArr — mount the media library at the same path as in Subgen",
+        )
+
+    if request.scan_type == "reverse":
+        entries.reverse()
+
+    # Bounded so ffprobe and Subgen aren't flooded on large libraries;
+    # slow storage (per the last benchmark) gets fewer folders at once
+    semaphore = asyncio.Semaphore(await asyncio.to_thread(scan_concurrency, base))
+    routes = (await asyncio.to_thread(load_settings)).language_routes
+
+    async def _dispatch(name: str) -> RoutedFolder:
+        directory = f"{base}/{name}"
+        detected, target_url = None, clean_url
+        status, error = "success", None
+        async with semaphore:
+            try:
+                detected, target_url = await _route_folder(directory, clean_url, routes=routes)
+                await _call_subgen_batch(target_url, directory)
+            except HTTPException as e:
+                status, error = "error", e.detail
+            except httpx.ConnectError:
+                status, error = "error", "Cannot connect to Subgen. Is it running?"
+            except Exception as e:
+                status, error = "error", str(e)
+
+        return RoutedFolder(
+            folder=directory,
+            language=detected.language if detected else None,
+            source=detected.source if detected else "unrouted",
+            routed_to=target_url,
+            status=status,
+            error=error,
+        )
+
+    folders = list(await asyncio.gather(*(_dispatch(name) for name in entries)))
+
+    routes_used: dict = {}
+    for folder in folders:
+        if folder.status == "success":
+            routes_used[folder.routed_to] = routes_used.get(folder.routed_to, 0) + 1
+
+    failed = sum(1 for f in folders if f.status != "success")
+    return RoutedScanResult(
+        status="success" if not failed else ("partial" if failed < len(folders) else "error"),
+        folders=folders,
+        routes_used=routes_used,
+    )
+
+@router.get("/route-preview")
+async def route_preview(folder: str, subgen_url: str):
+    """Show which language a folder is detected as and where it would be sent."""
+    valid, clean_url = await validate_subgen_url_async(subgen_url)
+    if not valid:
+        raise HTTPException(status_code=400, detail=f"Invalid Subgen URL: {clean_url}")
+
+    routes = (await asyncio.to_thread(load_settings)).language_routes
+    detected = await detect_folder_language(folder)
+    return {
+        "detection": detected,
+        "routed_to": resolve_route(detected.language, routes, clean_url),
+        "routing_enabled": bool(routes),
+    }
+
 @router.get("/scan-status")
+@cached_route(ttl=1, stale=4, cache_if=lambda r: not isinstance(r, dict) or r.get("status") != "error")
 async def get_scan_status(subgen_url: str):
     """
     Get current scan/processing status from Subgen.
     Subgen exposes GET /status for this.
     """
-    valid, clean_url = validate_subgen_url(subgen_url)
+    valid, clean_url = await validate_subgen_url_async(subgen_url)
     if not valid:
         return {"status": "error", "message": f"Invalid URL: {clean_url}"}
 
     try:
-        async with httpx.AsyncClient() as client:
+        async with subgen_client() as client:
             response = await client.get(
                 f"{clean_url}/status",
                 timeout=5.0
@@ -3,10 +3,13 @@ Settings router - manage Subbrainarr and Subgen configuration
 """
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict
+import asyncio
 import json
 import os
 
+from . import shared_state
+
 router = APIRouter()
 
 class PathMapping(BaseModel):
@@ -17,6 +20,8 @@ class LanguageConfig(BaseModel):
     patience: float
     length_penalty: float
     beam_size: int = 5
+    target_cps: Optional[float] = None       # Reading-speed override for retiming
+    max_line_length: Optional[int] = None    # Line-length override for retiming
 
 class SubgenSettings(BaseModel):
     subgen_url: str = "http://localhost:9000"
@@ -45,6 +50,16 @@ class SubgenSettings(BaseModel):
     custom_regroup: Optional[str] = None
     custom_env_vars: Dict[str, str] = {}
     language_configs: Dict[str, LanguageConfig] = {}
+    language_routes: Dict[str, str] = {}  # language code -> Subgen shard URL
+    hallucination_phrases: Dict[str, List[str]] = {}  # Extra phrases per language, "*" for all
+    hallucination_gap_seconds: float = 8.0  # Silence on both sides that makes a cue suspicious
+    postprocess_enabled: bool = False  # Watch folders and clean new Subgen subtitles
+    postprocess_folders: List[str] = []  # Defaults to transcribe_folders when empty
+    postprocess_only_subgen_files: bool = True  # Never touch subs Subgen didn't write
+    postprocess_max_isolated_words: int = 4
+    discovery_hosts: List[str] = []  # Extra hostnames/IPs/CIDRs to search for Subgen, e.g. "192.168.50.0/24"
+    discovery_ports: List[int] = [9000, 9007, 9919]
+    discovery_scan_local_subnets: bool = True  # Also sweep the container's own networks
 
 SETTINGS_FILE = "/app/config/settings.json"
 
@@ -60,23 +75,62 @@ def load_settings() -> SubgenSettings:
     
     return SubgenSettings()
 
+def settings_version() -> int:
+    """Changes whenever settings.json is rewritten, in every worker (its mtime in ns)."""
+    try:
+        return os.stat(SETTINGS_FILE).st_mtime_ns
+    except OSError:
+        return 0
+
 def save_settings_to_file(settings: SubgenSettings):
-    """Save settings to JSON file"""
+    """Save settings to JSON file.
+
+    Written to a temp file and renamed into place so another worker
+    process never reads a half-written settings.json.
+    """
     try:
         os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-        with open(SETTINGS_FILE, 'w') as f:
+        tmp_path = f"{SETTINGS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(settings.dict(), f, indent=2)
+        os.replace(tmp_path, SETTINGS_FILE)
         return True
     except Exception as e:
         print(f"Error saving settings: {e}")
         return False
 
-def _build_subgen_kwargs(settings: SubgenSettings) -> str:
+def modify_settings(mutate: Callable[[SubgenSettings], None]) -> Optional[SubgenSettings]:
+    """Load → mutate → save under the cross-process settings lock.
+
+    With several uvicorn workers, two concurrent read-modify-write cycles
+    on settings.json would otherwise drop one of the changes. Other
+    workers are notified through the shared event log.
+    Returns the saved settings, or None if the write failed.
+    """
+    with shared_state.exclusive():
+        settings = load_settings()
+        mutate(settings)
+        if not save_settings_to_file(settings):
+            return None
+    notify_settings_changed()
+    return settings
+
+def notify_settings_changed():
+    """Tell every worker (and their dashboards) that settings.json changed."""
+    try:
+        shared_state.publish("broadcast", {"type": "settings_changed"})
+    except Exception as e:
+        print(f"Could not publish settings change: {e}")
+
+def _build_subgen_kwargs(settings: SubgenSettings, lang_config: Optional[LanguageConfig] = None) -> str:
     """Build SUBGEN_KWARGS value as Python dict syntax.
 
     Subgen parses this with its safe literal parser, so the output MUST be
     valid Python literal syntax. repr() on a dict produces exactly that.
     We never parse or execute this ourselves — it's a string for compose output.
+
+    lang_config overrides the subtitle_language lookup — used by sharded
+    deployments where each instance serves its own language group.
     """
     kwargs: Dict = {}
 
@@ -85,9 +139,13 @@ def _build_subgen_kwargs(settings: SubgenSettings) -> str:
     kwargs["beam_size"] = settings.beam_size
 
     # If the selected subtitle language has tuning config, include it
-    lang_code = settings.subtitle_language
-    if lang_code and lang_code in settings.language_configs:
-        lc = settings.language_configs[lang_code]
+    lc = lang_config
+    if lc is None:
+        lang_code = settings.subtitle_language
+        if lang_code and lang_code in settings.language_configs:
+            lc = settings.language_configs[lang_code]
+
+    if lc is not None:
         kwargs["patience"] = lc.patience
         kwargs["length_penalty"] = lc.length_penalty
         # Per-language beam_size overrides global if explicitly different
@@ -97,26 +155,59 @@ def _build_subgen_kwargs(settings: SubgenSettings) -> str:
     return repr(kwargs)
 
 
-def generate_compose_snippet(settings: SubgenSettings) -> str:
-    """Generate docker-compose.yaml snippet for Subgen"""
-
-    snippet = f"""# Subgen Configuration
+_COMPOSE_HEADER = """# Subgen Configuration
 # Generated by SubBrainArr - Copy and adapt as needed
 # We're not your dad - take what you need and merge with your existing config
 
-services:
-  subgen:
+services:"""
+
+_COMPOSE_FOOTER = """
+# After updating, restart Subgen:
+#   docker compose down && docker compose up -d
+"""
+
+
+def _render_subgen_service(
+    settings: SubgenSettings,
+    service_name: str = "subgen",
+    kwargs_str: Optional[str] = None,
+    concurrent_transcriptions: Optional[int] = None,
+    host_port: int = 9000,
+    monitor: bool = True,
+    shard_languages: Optional[List[str]] = None,
+    gpu_index: Optional[int] = None,
+) -> str:
+    """Render one Subgen service block of a docker-compose file."""
+    if kwargs_str is None:
+        kwargs_str = _build_subgen_kwargs(settings)
+    if concurrent_transcriptions is None:
+        concurrent_transcriptions = settings.concurrent_transcriptions
+
+    snippet = f"""
+  {service_name}:
     image: mccloud/subgen:latest
-    container_name: subgen
-    environment:
+    container_name: {service_name}
+    environment:"""
+
+    if shard_languages is not None:
+        snippet += f"""
+      # Shard languages: {', '.join(shard_languages) if shard_languages else 'everything not routed elsewhere'}
+"""
+
+    snippet += f"""
       # Model & Compute
       - WHISPER_MODEL={settings.whisper_model}
       - COMPUTE_TYPE={settings.compute_type}
-      - TRANSCRIBE_DEVICE={settings.transcribe_device}
+      - TRANSCRIBE_DEVICE={settings.transcribe_device}"""
+
+    if gpu_index is not None:
+        snippet += f"\n      - CUDA_VISIBLE_DEVICES={gpu_index}"
+
+    snippet += f"""
 
       # Performance
       - WHISPER_THREADS={settings.whisper_threads}
-      - CONCURRENT_TRANSCRIPTIONS={settings.concurrent_transcriptions}
+      - CONCURRENT_TRANSCRIPTIONS={concurrent_transcriptions}
       - CLEAR_VRAM_ON_COMPLETE={'true' if settings.clear_vram_on_complete else 'false'}"""
 
     # Model cleanup delay — only meaningful when VRAM clearing is enabled
@@ -153,16 +244,17 @@ services:
         snippet += f"\n      - CUSTOM_REGROUP={settings.custom_regroup}"
 
     # Whisper tuning — SUBGEN_KWARGS is the ONLY way to deliver beam_size,
-    # patience, and length_penalty to Subgen. Uses Python dict syntax.
-    kwargs_str = _build_subgen_kwargs(settings)
+    # patience, and length_penalty to Subgen. Uses Python dict syntax, quoted
+    # so the dict's ": " isn't read as a YAML mapping.
     snippet += f"""
 
       # Whisper Tuning (SUBGEN_KWARGS is Subgen's delivery mechanism)
       # Uses Python dict syntax, not JSON
-      - SUBGEN_KWARGS={kwargs_str}"""
+      - "SUBGEN_KWARGS={kwargs_str}\""""
 
-    # Folder monitoring
-    if settings.monitor and settings.transcribe_folders:
+    # Folder monitoring — never on shards, every shard would pick up
+    # the same new files. SubBrainArr routes folders to shards instead.
+    if monitor and settings.monitor and settings.transcribe_folders:
         snippet += f"""
 
       # Folder Monitoring
@@ -187,19 +279,191 @@ services:
         snippet += """
       - /path/to/media:/media  # Update this path"""
 
-    snippet += """
+    snippet += f"""
 
     ports:
-      - "9000:9000"
+      - "{host_port}:9000"
 
     restart: unless-stopped
-
-# After updating, restart Subgen:
-#   docker compose down && docker compose up -d
 """
 
     return snippet
 
+
+def generate_compose_snippet(settings: SubgenSettings) -> str:
+    """Generate docker-compose.yaml snippet for Subgen"""
+    return _COMPOSE_HEADER + _render_subgen_service(settings) + _COMPOSE_FOOTER
+
+
+class SubgenShard(BaseModel):
+    name: str
+    url: str
+    host_port: int
+    languages: List[str]  # Empty for the default shard
+    concurrent_transcriptions: int
+    subgen_kwargs: str
+    gpu_index: Optional[int] = None  # Pinned via CUDA_VISIBLE_DEVICES
+
+class ShardPlan(BaseModel):
+    shards: List[SubgenShard]
+    routing_table: Dict[str, str]  # language code -> shard URL
+    default_url: str
+    vram_budget_gb: Optional[float] = None
+    warnings: List[str] = []
+
+
+def _group_tuned_languages(settings: SubgenSettings, max_groups: int) -> List[tuple]:
+    """Group tuned languages that share identical kwargs.
+
+    Returns (LanguageConfig, [codes]) pairs.
+
+    If there are more distinct tunings than max_groups, the smallest group
+    is folded into its nearest neighbour (by patience/length_penalty/beam
+    distance) until it fits — those languages get the neighbour's tuning.
+    """
+    groups: Dict[tuple, List[str]] = {}
+    for code, lc in sorted(settings.language_configs.items()):
+        groups.setdefault((lc.patience, lc.length_penalty, lc.beam_size), []).append(code)
+
+    merged = [[key, codes] for key, codes in groups.items()]
+    while len(merged) > max_groups and len(merged) > 1:
+        merged.sort(key=lambda g: len(g[1]))
+        (key, codes), rest = merged[0], merged[1:]
+
+        def _distance(other):
+            other_key = other[0]
+            return (
+                (key[0] - other_key[0]) ** 2
+                + (key[1] - other_key[1]) ** 2
+                + ((key[2] - other_key[2]) / 5) ** 2
+            )
+
+        nearest = min(rest, key=_distance)
+        nearest[1].extend(codes)
+        merged = rest
+
+    # Biggest groups first so shard numbering is stable and meaningful
+    merged.sort(key=lambda g: (-len(g[1]), min(g[1])))
+    return [
+        (LanguageConfig(patience=key[0], length_penalty=key[1], beam_size=key[2]), sorted(codes))
+        for key, codes in merged[:max_groups]
+    ]
+
+
+def plan_subgen_shards(
+    settings: SubgenSettings,
+    shard_count: int,
+    vram_gb: Optional[float] = None,
+    base_port: int = 9000,
+    gpus: Optional[list] = None,
+) -> ShardPlan:
+    """Split tuned languages across shard_count Subgen instances.
+
+    One shard is always kept as the default for untuned languages. Each
+    shard gets its group's SUBGEN_KWARGS and a CONCURRENT_TRANSCRIPTIONS
+    sized so all shards fit in vram_gb together.
+
+    With gpus (hardware.GpuInfo list) and no explicit vram_gb, shards are
+    spread over the cards instead — each pinned to one GPU through
+    CUDA_VISIBLE_DEVICES and sized for the share of that GPU it gets.
+    """
+    from .vram_model import max_concurrency
+
+    shard_count = max(1, shard_count)
+    warnings: List[str] = []
+
+    groups = _group_tuned_languages(settings, shard_count - 1) if shard_count > 1 else []
+
+    shards = [SubgenShard(
+        name="subgen",
+        url="http://subgen:9000",
+        host_port=base_port,
+        languages=[],
+        concurrent_transcriptions=settings.concurrent_transcriptions,
+        # Untuned languages get plain global settings, not the
+        # subtitle_language's tuning like the single-instance snippet
+        subgen_kwargs=repr({"beam_size": settings.beam_size}),
+    )]
+    routing_table: Dict[str, str] = {}
+
+    for index, (lang_config, codes) in enumerate(groups, start=1):
+        name = f"subgen-{'-'.join(codes[:3])}" if len(codes) <= 3 else f"subgen-group{index}"
+        url = f"http://{name}:9000"
+        shards.append(SubgenShard(
+            name=name,
+            url=url,
+            host_port=base_port + index,
+            languages=codes,
+            concurrent_transcriptions=settings.concurrent_transcriptions,
+            subgen_kwargs=_build_subgen_kwargs(settings, lang_config),
+        ))
+        for code in codes:
+            routing_table[code] = url
+
+    if shard_count > 1 and not groups:
+        warnings.append("No tuned languages yet — run the tuning wizard before sharding")
+
+    # shard index -> VRAM it may use
+    shard_vram: Dict[int, float] = {}
+    if vram_gb is None and gpus:
+        # Greedy: each shard goes to the GPU with the most VRAM per shard
+        placed: Dict[int, List[int]] = {gpu.index: [] for gpu in gpus}
+        by_index = {gpu.index: gpu for gpu in gpus}
+        for shard_index, shard in enumerate(shards):
+            gpu = max(gpus, key=lambda g: g.total_memory / (len(placed[g.index]) + 1))
+            placed[gpu.index].append(shard_index)
+            shard.gpu_index = gpu.index
+        for gpu_index, shard_indexes in placed.items():
+            for shard_index in shard_indexes:
+                shard_vram[shard_index] = by_index[gpu_index].total_memory / len(shard_indexes)
+        idle = [str(i) for i, s in placed.items() if not s]
+        if idle:
+            warnings.append(
+                f"GPU {', '.join(idle)} left idle — use at least {len(gpus)} shards to use every card"
+            )
+        vram_gb = sum(gpu.total_memory for gpu in gpus)
+    elif vram_gb:
+        shard_vram = {i: vram_gb / len(shards) for i in range(len(shards))}
+
+    for shard_index, per_shard in shard_vram.items():
+        concurrent = max_concurrency(per_shard, settings.whisper_model, settings.compute_type, settings.beam_size)
+        if concurrent == 0:
+            warnings.append(
+                f"{per_shard:.1f}GB for {shards[shard_index].name} is not enough for {settings.whisper_model} "
+                f"({settings.compute_type}) — use fewer shards or a smaller model"
+            )
+            concurrent = 1
+        shards[shard_index].concurrent_transcriptions = concurrent
+
+    return ShardPlan(
+        shards=shards,
+        routing_table=routing_table,
+        default_url=shards[0].url,
+        vram_budget_gb=vram_gb,
+        warnings=warnings,
+    )
+
+
+def generate_sharded_compose_snippet(settings: SubgenSettings, plan: ShardPlan) -> str:
+    """Generate a docker-compose snippet with one Subgen service per shard."""
+    snippet = _COMPOSE_HEADER
+    for shard in plan.shards:
+        snippet += _render_subgen_service(
+            settings,
+            service_name=shard.name,
+            kwargs_str=shard.subgen_kwargs,
+            concurrent_transcriptions=shard.concurrent_transcriptions,
+            host_port=shard.host_port,
+            monitor=False,
+            shard_languages=shard.languages,
+            gpu_index=shard.gpu_index,
+        )
+    snippet += """
+# Apply the routing table in SubBrainArr so folder scans reach the right shard:
+#   POST /api/settings/language-routes
+"""
+    return snippet + _COMPOSE_FOOTER
+
 @router.get("/current", response_model=SubgenSettings)
 async def get_current_settings():
     """Get current Subgen settings"""
@@ -208,12 +472,16 @@ async def get_current_settings():
 @router.put("/update", response_model=SubgenSettings)
 async def update_settings(settings: SubgenSettings):
     """Update and save Subgen settings"""
-    success = save_settings_to_file(settings)
-    
-    if not success:
+    def _apply(current_settings):
+        for name in SubgenSettings.model_fields:
+            setattr(current_settings, name, getattr(settings, name))
+
+    # Under the settings lock, so it can't interleave with another worker's update
+    saved = await asyncio.to_thread(modify_settings, _apply)
+    if saved is None:
         return {"error": "Failed to save settings"}
     
-    return settings
+    return saved
 
 @router.get("/compose-snippet")
 async def get_compose_snippet():
@@ -226,12 +494,71 @@ async def get_compose_snippet():
         "settings": settings
     }
 
+@router.get("/compose-sharded")
+async def get_sharded_compose_snippet(shards: Optional[int] = None, vram_gb: Optional[float] = None):
+    """Get a multi-instance compose snippet with one Subgen per language group.
+
+    Without vram_gb, shards are placed on the detected GPUs (one or more
+    per card); shards defaults to 2 or the GPU count if higher. The
+    returned routing_table can be applied via POST /language-routes.
+    """
+    from .hardware_sampler import sampler
+
+    settings = load_settings()
+
+    gpus = []
+    if vram_gb is None:
+        hw = await sampler.snapshot()
+        if hw.device_type == "cuda":
+            gpus = hw.gpus
+
+    plan = plan_subgen_shards(settings, shards or max(2, len(gpus)), vram_gb, gpus=gpus)
+    return {
+        "snippet": generate_sharded_compose_snippet(settings, plan),
+        "plan": plan,
+    }
+
+class LanguageRoutes(BaseModel):
+    routes: Dict[str, str]  # language code -> Subgen URL
+
+@router.post("/language-routes")
+async def set_language_routes(request: LanguageRoutes):
+    """Save which Subgen instance handles which language's folders."""
+    from .url_validation import validate_subgen_url_async
+
+    cleaned: Dict[str, str] = {}
+    for code, url in request.routes.items():
+        valid, result = await validate_subgen_url_async(url)
+        if not valid:
+            return {"success": False, "error": f"{code}: {result}"}
+        cleaned[code] = result
+
+    def _apply(current_settings):
+        current_settings.language_routes = cleaned
+
+    success = await asyncio.to_thread(modify_settings, _apply) is not None
+    return {"success": success, "routes": cleaned}
+
 @router.get("/defaults")
 async def get_default_settings():
-    """Get recommended default settings"""
+    """Get recommended default settings
+
+    Model, device and the VRAM/RAM-budgeted concurrent_transcriptions and
+    whisper_threads come from the detected hardware.
+    """
+    from .hardware import tuned_defaults
+    from .hardware_sampler import sampler
+
+    defaults = tuned_defaults(await sampler.snapshot())
+    tuning = defaults.pop("tuning")
     return {
         "message": "Default settings based on detected hardware",
-        "settings": SubgenSettings()
+        "settings": SubgenSettings(
+            **defaults,
+            concurrent_transcriptions=tuning["concurrent_transcriptions"],
+            whisper_threads=tuning["whisper_threads"],
+        ),
+        "tuning": tuning,
     }
 
 @router.post("/test-path-mapping")
@@ -0,0 +1,273 @@
+"""
+Process-safe shared state - lets SubBrainArr run with multiple uvicorn workers
+
+Anything that must look the same from every worker process lives here
+instead of in module globals. Backed by a single SQLite file next to
+settings.json, which gives us cross-process locking for free:
+
+  kv      — small JSON values with a version counter (change detection)
+  events  — append-only broadcast log; every worker tails it and relays
+            new rows to its own WebSocket clients
+  file_cache — per-file results keyed on (namespace, path) with the
+            file's mtime/size, so library-wide scans only redo changed files
+
+SQLite calls are fast (sub-millisecond on local disk) but still blocking,
+so async callers should go through the *_async wrappers.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "/app/config/state.db")
+
+# Broadcast events older than this are pruned — workers poll every
+# fraction of a second, so a few minutes of history is plenty
+_EVENT_RETENTION_SECONDS = 300
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == STATE_DB_FILE:
+        return conn
+
+    os.makedirs(os.path.dirname(STATE_DB_FILE) or ".", exist_ok=True)
+    conn = sqlite3.connect(STATE_DB_FILE, timeout=10.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS kv ("
+        " key TEXT PRIMARY KEY,"
+        " value TEXT NOT NULL,"
+        " version INTEGER NOT NULL DEFAULT 1,"
+        " updated REAL NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS events ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " channel TEXT NOT NULL,"
+        " payload TEXT NOT NULL,"
+        " created REAL NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_cache ("
+        " namespace TEXT NOT NULL,"
+        " path TEXT NOT NULL,"
+        " mtime REAL NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " result TEXT NOT NULL,"
+        " PRIMARY KEY (namespace, path))"
+    )
+    _local.conn = conn
+    _local.path = STATE_DB_FILE
+    return conn
+
+
+@contextmanager
+def exclusive() -> Iterator[sqlite3.Connection]:
+    """Hold the database write lock across processes for a read-modify-write.
+
+    BEGIN IMMEDIATE takes SQLite's reserved lock up front, so two workers
+    doing load → mutate → save on the same data serialize instead of
+    silently overwriting each other.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_value(key: str, default: Any = None) -> Any:
+    """Read a JSON value from the shared store."""
+    row = _connect().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return default
+    return json.loads(row[0])
+
+
+def get_version(key: str) -> int:
+    """Version counter for a key (0 if unset) — cheap change detection."""
+    row = _connect().execute("SELECT version FROM kv WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _write(conn: sqlite3.Connection, key: str, value: Any) -> int:
+    conn.execute(
+        "INSERT INTO kv (key, value, version, updated) VALUES (?, ?, 1, ?)"
+        " ON CONFLICT(key) DO UPDATE SET value = excluded.value,"
+        " version = kv.version + 1, updated = excluded.updated",
+        (key, json.dumps(value), time.time()),
+    )
+    return conn.execute("SELECT version FROM kv WHERE key = ?", (key,)).fetchone()[0]
+
+
+def set_value(key: str, value: Any) -> int:
+    """Write a JSON value and return its new version."""
+    with exclusive() as conn:
+        return _write(conn, key, value)
+
+
+def update_value(key: str, mutate: Callable[[Any], Any], default: Any = None) -> Any:
+    """Atomically apply mutate(old) -> new across all worker processes."""
+    with exclusive() as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        current = json.loads(row[0]) if row else default
+        new_value = mutate(current)
+        _write(conn, key, new_value)
+        return new_value
+
+
+def delete_value(key: str) -> bool:
+    with exclusive() as conn:
+        return conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount > 0
+
+
+def publish(channel: str, payload: Dict[str, Any]) -> int:
+    """Append an event to the cross-worker broadcast log. Returns its id."""
+    now = time.time()
+    with exclusive() as conn:
+        cur = conn.execute(
+            "INSERT INTO events (channel, payload, created) VALUES (?, ?, ?)",
+            (channel, json.dumps(payload), now),
+        )
+        conn.execute("DELETE FROM events WHERE created < ?", (now - _EVENT_RETENTION_SECONDS,))
+        return cur.lastrowid
+
+
+def latest_event_id() -> int:
+    row = _connect().execute("SELECT MAX(id) FROM events").fetchone()
+    return row[0] or 0
+
+
+def read_events(after_id: int, limit: int = 500) -> List[Tuple[int, str, Dict[str, Any]]]:
+    """Return (id, channel, payload) for every event newer than after_id."""
+    rows = _connect().execute(
+        "SELECT id, channel, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit),
+    ).fetchall()
+    return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+
+def get_file_cache(namespace: str, paths: Optional[List[str]] = None) -> Dict[str, Tuple[float, int, Any]]:
+    """path -> (mtime, size, result) for the given paths, or every cached file in a namespace."""
+    conn = _connect()
+    if paths is None:
+        rows = conn.execute(
+            "SELECT path, mtime, size, result FROM file_cache WHERE namespace = ?", (namespace,)
+        ).fetchall()
+    else:
+        rows = [
+            row for path in paths for row in conn.execute(
+                "SELECT path, mtime, size, result FROM file_cache WHERE namespace = ? AND path = ?",
+                (namespace, path),
+            ).fetchall()
+        ]
+    return {row[0]: (row[1], row[2], json.loads(row[3])) for row in rows}
+
+
+def put_file_cache(namespace: str, entries: List[Tuple[str, float, int, Any]]):
+    """Upsert (path, mtime, size, result) rows in one transaction."""
+    with exclusive() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO file_cache (namespace, path, mtime, size, result) VALUES (?, ?, ?, ?, ?)",
+            [(namespace, path, mtime, size, json.dumps(result)) for path, mtime, size, result in entries],
+        )
+
+
+def delete_file_cache(namespace: str, paths: Optional[List[str]] = None):
+    """Forget the given paths, or the whole namespace if paths is None."""
+    with exclusive() as conn:
+        if paths is None:
+            conn.execute("DELETE FROM file_cache WHERE namespace = ?", (namespace,))
+        else:
+            conn.executemany(
+                "DELETE FROM file_cache WHERE namespace = ? AND path = ?",
+                [(namespace, path) for path in paths],
+            )
+
+
+def try_acquire_lease(name: str, owner: str, ttl: float) -> bool:
+    """Become (or stay) the single owner of a background duty across workers.
+
+    Background loops that must only run once per deployment (folder
+    watchers, pollers) call this every iteration; the lease moves to
+    another worker if its owner stops renewing it for ttl seconds.
+    """
+    key = f"lease:{name}"
+    now = time.time()
+    with exclusive() as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row:
+            lease = json.loads(row[0])
+            if lease["owner"] != owner and lease["expires"] > now:
+                return False
+        _write(conn, key, {"owner": owner, "expires": now + ttl})
+        return True
+
+
+def release_lease(name: str, owner: str):
+    """Give up a lease early so another worker can take it immediately."""
+    key = f"lease:{name}"
+    with exclusive() as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row and json.loads(row[0])["owner"] == owner:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+
+def worker_id() -> str:
+    """Identifier for this worker process in leases."""
+    return f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+
+
+async def get_value_async(key: str, default: Any = None) -> Any:
+    return await asyncio.to_thread(get_value, key, default)
+
+
+async def set_value_async(key: str, value: Any) -> int:
+    return await asyncio.to_thread(set_value, key, value)
+
+
+async def publish_async(channel: str, payload: Dict[str, Any]) -> int:
+    return await asyncio.to_thread(publish, channel, payload)
+
+
+async def tail_events(
+    handler: Callable[[str, Dict[str, Any]], Any],
+    poll_interval: float = 0.25,
+    stop: Optional[asyncio.Event] = None,
+):
+    """Relay events published by any worker to handler(channel, payload).
+
+    Starts at the current end of the log so a freshly started worker does
+    not replay old broadcasts. Runs until `stop` is set or cancelled.
+    """
+    last_id = await asyncio.to_thread(latest_event_id)
+    while stop is None or not stop.is_set():
+        try:
+            events = await asyncio.to_thread(read_events, last_id)
+        except sqlite3.Error as e:
+            print(f"Shared state event poll failed: {e}")
+            events = []
+
+        for event_id, channel, payload in events:
+            last_id = event_id
+            try:
+                result = handler(channel, payload)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Event handler error on '{channel}': {e}")
+
+        if not events:
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,284 @@
+"""
+Media storage benchmark - how fast can Subgen read the library?
+
+The hardware sampler only reports the models disk. Subgen spends its I/O
+reading media to extract audio, and on NFS/SMB shares that is often the
+real bottleneck. This measures the mapped media path:
+
+  - sequential read throughput on a few large media files, bypassing the
+    page cache (O_DIRECT where the filesystem allows it, otherwise
+    posix_fadvise(DONTNEED) before reading)
+  - metadata latency: os.stat() lookups the client can't answer from its
+    caches. Entries the walk just listed are already in the NFS/SMB
+    attribute cache, so the probes look up unique names that don't exist
+    in a sample of the walked directories — each one is a round trip
+
+Every run is bounded in time and bytes, and only one runs at a time
+across workers. Results are kept in shared state for trend comparison,
+and the latest one sets how many folders a routed scan handles at once.
+"""
+import asyncio
+import mmap
+import os
+import random
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from . import shared_state
+from .language_routing import MEDIA_EXTENSIONS
+
+router = APIRouter()
+
+HISTORY_KEY = "storage_benchmarks"
+_HISTORY_LIMIT = 50
+_LEASE_NAME = "storage_benchmark"
+
+_BLOCK_SIZE = 1024 * 1024
+_MIN_FILE_BYTES = 64 * 1024 * 1024  # Small files mostly measure open() latency
+_WALK_ENTRY_LIMIT = 5000
+
+# Routed scans run this many folders at once when nothing has been measured
+DEFAULT_SCAN_CONCURRENCY = 4
+
+
+class BenchmarkRequest(BaseModel):
+    path: Optional[str] = None  # Defaults to the mapped media path
+    max_seconds: float = 15.0
+    max_megabytes: int = 1024
+    stat_samples: int = 500
+
+
+def media_path() -> str:
+    """The media library path as seen inside the containers."""
+    from .settings import load_settings
+
+    settings = load_settings()
+    if settings.use_path_mapping and settings.path_mapping:
+        return settings.path_mapping.container_path
+    return "/media"
+
+
+def _sample_tree(root: str, deadline: float):
+    """Walk up to _WALK_ENTRY_LIMIT entries; return (all paths, directories, large media files)."""
+    paths: List[str] = []
+    directories: List[str] = []
+    media: List[tuple] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        directories.append(dirpath)
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            paths.append(path)
+            if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS:
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    continue
+                if size >= _MIN_FILE_BYTES:
+                    media.append((path, size))
+        if len(paths) >= _WALK_ENTRY_LIMIT or time.monotonic() > deadline:
+            break
+    return paths, directories, media
+
+
+def _time_lookup(directory: str) -> Optional[float]:
+    """Milliseconds for a stat() of a fresh missing name in directory."""
+    probe = os.path.join(directory, f".subbrainarr-probe-{os.urandom(8).hex()}")
+    t = time.perf_counter()
+    try:
+        os.stat(probe)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return None
+    return (time.perf_counter() - t) * 1000
+
+
+def _open_uncached(path: str):
+    """Open for reading without the page cache. Returns (fd, method)."""
+    if hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, os.O_RDONLY | os.O_DIRECT), "direct"
+        except OSError:
+            pass  # tmpfs, some FUSE/SMB mounts
+    fd = os.open(path, os.O_RDONLY)
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            return fd, "dontneed"
+        except OSError:
+            pass
+    return fd, "cached"
+
+
+def _read_file(path: str, size: int, budget_bytes: int, deadline: float) -> Dict:
+    # Page-aligned buffer, required by O_DIRECT
+    buffer = mmap.mmap(-1, _BLOCK_SIZE)
+    fd, method = _open_uncached(path)
+    read = 0
+    # Start somewhere in the middle: the header may have been read by ffprobe
+    offset = (random.randrange(0, max(1, size - budget_bytes)) // _BLOCK_SIZE) * _BLOCK_SIZE
+    started = time.monotonic()
+    try:
+        while read < budget_bytes and time.monotonic() < deadline:
+            try:
+                n = os.preadv(fd, [buffer], offset + read)
+            except OSError:
+                if method != "direct":
+                    raise
+                # O_DIRECT accepted at open but rejected on read; retry cached-less
+                os.close(fd)
+                fd = os.open(path, os.O_RDONLY)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                method = "dontneed"
+                continue
+            if n <= 0:
+                break
+            read += n
+    finally:
+        os.close(fd)
+        buffer.close()
+    return {"path": path, "bytes": read, "seconds": time.monotonic() - started, "method": method}
+
+
+def run_benchmark(root: str, max_seconds: float, max_bytes: int, stat_samples: int) -> Dict:
+    """Blocking benchmark; call through asyncio.to_thread."""
+    started = time.monotonic()
+    deadline = started + max_seconds
+    # A third of the time for discovery and stat, the rest for reading
+    paths, directories, media = _sample_tree(root, started + max_seconds / 3)
+
+    stat_ms: List[float] = []
+    for directory in random.choices(directories, k=stat_samples) if directories else []:
+        if time.monotonic() > started + max_seconds / 3:
+            break
+        elapsed = _time_lookup(directory)
+        if elapsed is not None:
+            stat_ms.append(elapsed)
+
+    reads = []
+    media.sort(key=lambda m: m[1], reverse=True)
+    candidates = media[:3]
+    per_file = max_bytes // max(1, len(candidates))
+    for path, size in candidates:
+        if time.monotonic() >= deadline:
+            break
+        try:
+            reads.append(_read_file(path, size, per_file, deadline))
+        except OSError as e:
+            reads.append({"path": path, "bytes": 0, "seconds": 0.0, "method": "failed", "error": str(e)})
+
+    total_bytes = sum(r["bytes"] for r in reads)
+    total_seconds = sum(r["seconds"] for r in reads)
+    stat_ms.sort()
+    return {
+        "path": root,
+        "started": time.time() - (time.monotonic() - started),
+        "duration_seconds": round(time.monotonic() - started, 2),
+        "read_mb_per_s": round(total_bytes / total_seconds / 1e6, 1) if total_seconds > 0 else None,
+        "read_megabytes": round(total_bytes / 1e6, 1),
+        "read_method": reads[0]["method"] if reads else None,
+        "files_read": len([r for r in reads if r["bytes"]]),
+        "stat_p50_ms": round(statistics.median(stat_ms), 3) if stat_ms else None,
+        "stat_p95_ms": round(stat_ms[int(len(stat_ms) * 0.95) - 1], 3) if len(stat_ms) >= 20 else None,
+        "stat_samples": len(stat_ms),
+        "entries_walked": len(paths),
+        "scan_concurrency": concurrency_for(
+            total_bytes / total_seconds / 1e6 if total_seconds > 0 else None,
+            statistics.median(stat_ms) if stat_ms else None,
+        ),
+    }
+
+
+def concurrency_for(read_mb_per_s: Optional[float], stat_p50_ms: Optional[float]) -> int:
+    """Folders to process at once given measured storage speed.
+
+    Each folder means ffprobe reads and Subgen audio extraction on the
+    share, so slow or high-latency storage gets fewer at once.
+    """
+    if read_mb_per_s is None:
+        return DEFAULT_SCAN_CONCURRENCY
+    if read_mb_per_s >= 400:
+        concurrency = 8
+    elif read_mb_per_s >= 150:
+        concurrency = 4
+    elif read_mb_per_s >= 50:
+        concurrency = 2
+    else:
+        concurrency = 1
+    # Network filesystems with slow metadata choke on parallel directory walks
+    if stat_p50_ms is not None and stat_p50_ms > 20:
+        concurrency = min(concurrency, 2)
+    return concurrency
+
+
+def scan_concurrency(path: str) -> int:
+    """Concurrency for scans under path, from the latest benchmark of the
+    closest benchmarked parent directory."""
+    history = shared_state.get_value(HISTORY_KEY, []) or []
+    best = None
+    for result in history:  # Oldest first, so later runs win ties
+        root = result["path"].rstrip("/")
+        if path == root or path.startswith(root + "/"):
+            if best is None or len(root) >= len(best["path"].rstrip("/")):
+                best = result
+    return best["scan_concurrency"] if best else DEFAULT_SCAN_CONCURRENCY
+
+
+def _trend(history: List[Dict], result: Dict) -> Dict:
+    """Compare a run with the median of earlier runs on the same path."""
+    earlier = [r["read_mb_per_s"] for r in history if r["path"] == result["path"] and r.get("read_mb_per_s")]
+    if not earlier or not result.get("read_mb_per_s"):
+        return {"baseline_mb_per_s": None, "change_percent": None}
+    baseline = statistics.median(earlier)
+    return {
+        "baseline_mb_per_s": round(baseline, 1),
+        "change_percent": round((result["read_mb_per_s"] / baseline - 1) * 100, 1),
+    }
+
+
+@router.post("/benchmark")
+async def benchmark(request: BenchmarkRequest):
+    """
+    Measure read throughput and metadata latency of the media library.
+    Bounded by max_seconds/max_megabytes; one run at a time.
+    """
+    path = request.path or media_path()
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail=f"Media path not visible to SubBrainArr: {path}")
+
+    max_seconds = min(max(request.max_seconds, 2.0), 120.0)
+    owner = shared_state.worker_id()
+    acquired = await asyncio.to_thread(shared_state.try_acquire_lease, _LEASE_NAME, owner, max_seconds + 30)
+    if not acquired:
+        raise HTTPException(status_code=409, detail="A storage benchmark is already running")
+
+    try:
+        result = await asyncio.to_thread(
+            run_benchmark, path, max_seconds, request.max_megabytes * 1024 * 1024, request.stat_samples
+        )
+    finally:
+        await asyncio.to_thread(shared_state.release_lease, _LEASE_NAME, owner)
+
+    history = await shared_state.get_value_async(HISTORY_KEY, []) or []
+    result.update(_trend(history, result))
+
+    def _append(current):
+        return ((current or []) + [result])[-_HISTORY_LIMIT:]
+
+    await asyncio.to_thread(shared_state.update_value, HISTORY_KEY, _append, [])
+    return result
+
+
+@router.get("/history")
+async def get_history(path: Optional[str] = None):
+    """Past benchmark results, oldest first."""
+    history = await shared_state.get_value_async(HISTORY_KEY, []) or []
+    if path:
+        history = [r for r in history if r["path"] == path]
+    return {"results": history}
@@ -0,0 +1,214 @@
+"""
+Subtitle statistics - measure what Subgen actually produced
+
+Instead of asking users whether subs feel "too fast", we read the SRT/ASS
+files Subgen already wrote and measure reading speed (characters per
+second), cue duration, line length and inter-cue gaps. Those measured
+distributions are compared against the language's reading profile to
+derive patience / length_penalty / beam_size.
+
+Each pool worker folds its files into fixed-bin histograms, so merging
+thousands of files is a cheap element-wise sum and percentiles come
+straight from the cumulative counts.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .subtitles import iter_cues
+
+# metric -> (bin width, bin count); the last bin collects everything above
+HISTOGRAMS = {
+    "cps": (0.5, 80),          # 0–40 chars/second
+    "duration": (0.1, 150),    # 0–15 seconds
+    "line_length": (1.0, 120), # 0–120 characters
+    "gap": (0.05, 200),        # 0–10 seconds
+}
+
+_PERCENTILES = (10, 50, 75, 90, 95)
+
+# Below this many cues, the measured distributions are too noisy to trust
+MIN_CUES_FOR_CONFIDENCE = 200
+
+
+def empty_stats() -> Dict:
+    return {
+        "files": 0,
+        "cues": 0,
+        "errors": 0,
+        "hist": {metric: [0] * count for metric, (_, count) in HISTOGRAMS.items()},
+        "sums": {metric: 0.0 for metric in HISTOGRAMS},
+        "counts": {metric: 0 for metric in HISTOGRAMS},
+    }
+
+
+def _add(stats: Dict, metric: str, value: float):
+    width, count = HISTOGRAMS[metric]
+    index = int(value / width) if value > 0 else 0
+    stats["hist"][metric][min(index, count - 1)] += 1
+    stats["sums"][metric] += value
+    stats["counts"][metric] += 1
+
+
+def analyze_files(paths: List[str]) -> Dict:
+    """Pool worker: fold every cue of every file into histogram stats."""
+    stats = empty_stats()
+    for path in paths:
+        try:
+            previous_end = None
+            for cue in iter_cues(path):
+                duration = cue.duration
+                if duration <= 0 or not cue.lines:
+                    continue
+                stats["cues"] += 1
+                _add(stats, "duration", duration)
+                _add(stats, "cps", len(cue.text) / duration)
+                for line in cue.lines:
+                    _add(stats, "line_length", len(line))
+                if previous_end is not None and cue.start >= previous_end:
+                    _add(stats, "gap", cue.start - previous_end)
+                previous_end = cue.end
+            stats["files"] += 1
+        except (OSError, UnicodeError, ValueError):
+            stats["errors"] += 1
+    return stats
+
+
+def merge_stats(parts: List[Dict]) -> Dict:
+    merged = empty_stats()
+    for part in parts:
+        for key in ("files", "cues", "errors"):
+            merged[key] += part[key]
+        for metric in HISTOGRAMS:
+            merged["hist"][metric] = [a + b for a, b in zip(merged["hist"][metric], part["hist"][metric])]
+            merged["sums"][metric] += part["sums"][metric]
+            merged["counts"][metric] += part["counts"][metric]
+    return merged
+
+
+def _percentile(hist: List[int], width: float, total: int, pct: float) -> float:
+    """Percentile from a histogram, interpolating inside the bin."""
+    target = total * pct / 100
+    running = 0
+    for index, count in enumerate(hist):
+        if count and running + count >= target:
+            return (index + (target - running) / count) * width
+        running += count
+    return len(hist) * width
+
+
+def summarize(stats: Dict) -> Dict[str, Dict[str, float]]:
+    """Mean and percentiles per metric, e.g. summary["cps"]["p75"]."""
+    summary = {}
+    for metric, (width, _) in HISTOGRAMS.items():
+        total = stats["counts"][metric]
+        if not total:
+            continue
+        entry = {"mean": round(stats["sums"][metric] / total, 2), "count": total}
+        for pct in _PERCENTILES:
+            entry[f"p{pct}"] = round(_percentile(stats["hist"][metric], width, total, pct), 2)
+        summary[metric] = entry
+    return summary
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return max(low, min(high, value))
+
+
+def recommend_from_stats(
+    summary: Dict[str, Dict[str, float]],
+    profile: Dict[str, float],
+    patience: float,
+    length_penalty: float,
+    beam_size: int,
+) -> Tuple[float, float, int, List[str], List[str]]:
+    """Derive tuning from measured distributions against reading targets.
+
+    Uses the same directions as the wizard's issue presets (too fast →
+    more patience and length penalty, lines too long → less length
+    penalty), but scaled by how far the measurements are off target.
+    Returns (patience, length_penalty, beam_size, issues, explanations).
+    """
+    issues: List[str] = []
+    explanations: List[str] = []
+    severity = 0.0
+
+    cps = summary.get("cps")
+    if cps:
+        over = cps["p75"] / profile["max_cps"] - 1
+        under = 1 - cps["p50"] / profile["min_cps"]
+        if over > 0.05:
+            over = min(over, 0.5)
+            issues.append("too_fast")
+            patience += 1.5 * over
+            length_penalty += 0.6 * over
+            severity = max(severity, over)
+            explanations.append(
+                f"A quarter of cues exceed {cps['p75']:.1f} chars/s (target ≤ {profile['max_cps']:.0f}) — "
+                "more patience and length penalty for longer on-screen time"
+            )
+        elif under > 0.05:
+            under = min(under, 0.5)
+            issues.append("too_slow")
+            patience -= 0.6 * under
+            length_penalty -= 0.6 * under
+            severity = max(severity, under)
+            explanations.append(
+                f"Median reading speed is only {cps['p50']:.1f} chars/s (target ≥ {profile['min_cps']:.0f}) — "
+                "less patience for snappier timing"
+            )
+
+    lines = summary.get("line_length")
+    if lines:
+        max_line = profile["max_line_length"]
+        long = lines["p90"] / max_line - 1
+        short = 0.45 - lines["p50"] / max_line
+        if long > 0.05:
+            long = min(long, 0.5)
+            issues.append("lines_long")
+            length_penalty -= 0.8 * long
+            severity = max(severity, long)
+            explanations.append(
+                f"10% of lines are longer than {lines['p90']:.0f} characters (target ≤ {max_line}) — "
+                "lower length penalty to break text into shorter chunks"
+            )
+        elif short > 0:
+            issues.append("lines_short")
+            length_penalty += 0.5 * short / 0.45
+            severity = max(severity, short)
+            explanations.append(
+                f"Median line is only {lines['p50']:.0f} characters — "
+                "higher length penalty for fuller lines"
+            )
+
+    if issues:
+        beam_size = max(beam_size, 6) + (1 if severity > 0.25 else 0)
+    else:
+        explanations.append("Measured reading speed and line lengths are within target — keep current settings")
+
+    return (
+        round(_clamp(patience, 0.5, 3.0), 2),
+        round(_clamp(length_penalty, 0.5, 2.0), 2),
+        int(_clamp(beam_size, 1, 8)),
+        issues,
+        explanations,
+    )
+
+
+def select_language_files(paths: Iterable[str], language: str, folder_languages: Dict[str, str],
+                          limit: Optional[int] = None, only_subgen: bool = True) -> List[str]:
+    """The first `limit` subtitle files whose audio language is `language`.
+
+    Human-made and downloaded subs are skipped unless only_subgen is False:
+    their timing says nothing about Subgen's settings.
+    """
+    from .language_routing import subtitle_audio_language
+    from .subtitles import is_subgen_output
+
+    selected = []
+    for path in paths:
+        if only_subgen and not is_subgen_output(path):
+            continue
+        if subtitle_audio_language(path, folder_languages) == language:
+            selected.append(path)
+            if limit is not None and len(selected) >= limit:
+                break
+    return selected
@@ -0,0 +1,250 @@
+"""
+Subtitle file handling - streaming SRT/ASS parsing and serialization
+
+Shared by the analysis, hallucination and post-processing features. Files
+are read line by line and cues are yielded one at a time, so a 3-hour
+movie's subtitles never have to sit in memory as a whole.
+
+Times are floats in seconds. Cue text is a list of display lines with ASS
+override tags ({\\i1} etc.) stripped for analysis; the raw ASS text is kept
+in Cue.raw so rewrites preserve styling.
+"""
+import os
+import re
+import shutil
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional
+
+from .languages import normalize_language_code
+
+SUBTITLE_EXTENSIONS = {".srt", ".ass", ".ssa"}
+BACKUP_SUFFIX = ".bak"
+
+_SRT_TIME_RE = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+_ASS_TAG_RE = re.compile(r"\{[^}]*\}")
+
+
+class Cue(NamedTuple):
+    start: float
+    end: float
+    lines: List[str]
+    raw: Optional[str] = None  # Original ASS Dialogue line, None for SRT
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.lines)
+
+
+def _open_text(path: str) -> IO[str]:
+    # utf-8-sig eats the BOM Windows tools like to add
+    return open(path, "r", encoding="utf-8-sig", errors="replace")
+
+
+def _srt_seconds(h: str, m: str, s: str, ms: str) -> float:
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, "0")) / 1000
+
+
+def iter_srt_cues(fh: Iterable[str]) -> Iterator[Cue]:
+    """Yield cues from an SRT stream. Malformed blocks are skipped."""
+    timing = None
+    lines: List[str] = []
+    for raw_line in fh:
+        line = raw_line.rstrip("\r\n")
+        if timing is None:
+            match = _SRT_TIME_RE.search(line)
+            if match:
+                g = match.groups()
+                timing = (_srt_seconds(*g[:4]), _srt_seconds(*g[4:]))
+            continue
+        if line.strip():
+            lines.append(line.strip())
+            continue
+        yield Cue(timing[0], timing[1], lines)
+        timing, lines = None, []
+    if timing is not None:
+        yield Cue(timing[0], timing[1], lines)
+
+
+def _ass_seconds(value: str) -> float:
+    h, m, s = value.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def iter_ass_cues(fh: Iterable[str]) -> Iterator[Cue]:
+    """Yield Dialogue cues from an ASS/SSA stream."""
+    in_events = False
+    fields: List[str] = []
+    for raw_line in fh:
+        line = raw_line.rstrip("\r\n")
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_events = stripped.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+        if stripped.lower().startswith("format:"):
+            fields = [f.strip().lower() for f in stripped[7:].split(",")]
+            continue
+        if not stripped.lower().startswith("dialogue:") or not fields:
+            continue
+
+        values = stripped.split(":", 1)[1].split(",", len(fields) - 1)
+        if len(values) != len(fields):
+            continue
+        record = dict(zip(fields, values))
+        try:
+            start, end = _ass_seconds(record["start"]), _ass_seconds(record["end"])
+        except (KeyError, ValueError):
+            continue
+        text = _ASS_TAG_RE.sub("", record.get("text", ""))
+        display = [part.strip() for part in re.split(r"\\[Nn]", text) if part.strip()]
+        yield Cue(start, end, display, raw=line)
+
+
+def iter_cues(path: str) -> Iterator[Cue]:
+    """Stream cues from an .srt/.ass/.ssa file."""
+    ext = os.path.splitext(path)[1].lower()
+    with _open_text(path) as fh:
+        if ext in (".ass", ".ssa"):
+            yield from iter_ass_cues(fh)
+        else:
+            yield from iter_srt_cues(fh)
+
+
+def format_srt_time(seconds: float) -> str:
+    millis = max(0, int(round(seconds * 1000)))
+    h, rem = divmod(millis, 3_600_000)
+    m, rem = divmod(rem, 60_000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def format_ass_time(seconds: float) -> str:
+    centis = max(0, int(round(seconds * 100)))
+    h, rem = divmod(centis, 360_000)
+    m, rem = divmod(rem, 6000)
+    s, cs = divmod(rem, 100)
+    return f"{h:d}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def write_srt(cues: Iterable[Cue], fh: IO[str]) -> int:
+    """Serialize cues as SRT, renumbering from 1. Returns the cue count."""
+    count = 0
+    for count, cue in enumerate(cues, start=1):
+        fh.write(f"{count}\n{format_srt_time(cue.start)} --> {format_srt_time(cue.end)}\n")
+        fh.write("\n".join(cue.lines) + "\n\n")
+    return count
+
+
+def write_ass(source_path: str, cues: Iterable[Cue], fh: IO[str]) -> int:
+    """Rewrite an ASS/SSA file with a new cue list, keeping every non-Dialogue line.
+
+    Cues carrying their original raw line get only their times replaced so
+    styles and override tags survive; new cues (e.g. from a split) are
+    written with the first cue's style fields.
+    """
+    count = 0
+    cue_iter = iter(cues)
+    template = None
+    with _open_text(source_path) as src:
+        in_events = False
+        wrote_cues = False
+        for raw_line in src:
+            line = raw_line.rstrip("\r\n")
+            stripped = line.strip()
+            if stripped.startswith("["):
+                in_events = stripped.lower() == "[events]"
+            if in_events and stripped.lower().startswith("dialogue:"):
+                if template is None:
+                    template = line
+                if not wrote_cues:
+                    for cue in cue_iter:
+                        fh.write(_ass_dialogue_line(cue, template) + "\n")
+                        count += 1
+                    wrote_cues = True
+                continue
+            fh.write(line + "\n")
+    return count
+
+
+def _ass_dialogue_line(cue: Cue, template: str) -> str:
+    base = cue.raw or template
+    prefix, rest = base.split(":", 1)
+    parts = rest.split(",", 9)
+    parts[1] = format_ass_time(cue.start)
+    parts[2] = format_ass_time(cue.end)
+    if cue.raw is None and len(parts) == 10:
+        parts[9] = "\\N".join(cue.lines)
+    return f"{prefix}:{','.join(parts)}"
+
+
+def write_cues(source_path: str, cues: Iterable[Cue], fh: IO[str]) -> int:
+    """Serialize cues in the same format as source_path."""
+    if os.path.splitext(source_path)[1].lower() in (".ass", ".ssa"):
+        return write_ass(source_path, cues, fh)
+    return write_srt(cues, fh)
+
+
+def atomic_rewrite(path: str, cues: Iterable[Cue]) -> int:
+    """Replace path with the given cues via temp file + rename.
+
+    Players and Subgen never see a half-written file. The original's
+    permissions are kept.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            count = write_cues(path, cues, fh)
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        return count
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def is_subgen_output(path: str) -> bool:
+    """True for files Subgen wrote ("Movie.subgen.large-v3.eng.srt"), not human or downloaded subs."""
+    return ".subgen." in os.path.basename(path).lower()
+
+
+def keep_original(path: str) -> None:
+    """Copy path to <path>.bak unless a backup exists, so the first original survives later rewrites."""
+    backup = path + BACKUP_SUFFIX
+    if not os.path.exists(backup):
+        shutil.copy2(path, backup)
+
+
+def file_language_tag(path: str) -> Optional[str]:
+    """Language tag from a subtitle filename, including Subgen's own output.
+
+    "Show.S01E01.subgen.large-v3.jpn.srt" -> "ja", "Movie.de.forced.srt" -> "de"
+    """
+    tokens = os.path.basename(path).split(".")[1:-1]
+    for token in reversed(tokens):
+        code = normalize_language_code(token)
+        if code and len(token) in (2, 3):
+            return code
+    return None
+
+
+def find_subtitle_files(root: str, limit: Optional[int] = None) -> Iterator[str]:
+    """Walk root and yield subtitle file paths (sorted, depth-first)."""
+    found = 0
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUBTITLE_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+                found += 1
+                if limit is not None and found >= limit:
+                    return
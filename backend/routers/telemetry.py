@@ -0,0 +1,443 @@
+"""
+Telemetry router - GPU/CPU/RAM/disk time series for OOM diagnosis
+
+A single free-VRAM reading can't explain why Subgen ran out of memory an
+hour ago. One worker (the lease holder) samples every second:
+
+  - VRAM used/total and GPU utilization from a long-running
+    `nvidia-smi --loop-ms` process (no process spawn per sample)
+  - CPU %, RAM and disk read/write throughput from /proc
+  - queued/active jobs reported by each Subgen instance's /status, and
+    the concurrent_transcriptions setting in force
+
+Samples go through the shared event log so every worker keeps the same
+in-memory ring buffers, downsampled into 1 s / 1 min / 1 h tiers where
+each point keeps the mean and the max of every metric — peaks are what
+matter for OOMs. Job changes and settings changes are kept as
+annotations, so GET /peaks can show what was running at each VRAM peak.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+
+from . import shared_state
+from .metrics import subgen_client
+
+router = APIRouter()
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_INTERVAL", 1))
+
+# tier -> (bucket seconds, points kept): 1 h of seconds, 1 day of minutes, 30 days of hours
+TIERS: Dict[str, Tuple[int, int]] = {
+    "1s": (1, 3600),
+    "1m": (60, 1440),
+    "1h": (3600, 720),
+}
+
+METRICS = (
+    "vram_used_gb", "vram_total_gb", "gpu_util",
+    "cpu_percent", "ram_used_gb", "ram_total_gb",
+    "disk_read_mbps", "disk_write_mbps",
+    "jobs", "concurrent_transcriptions",
+)
+
+_LEASE_NAME = "telemetry_sampler"
+_LEASE_RENEW_SECONDS = 5
+_JOB_POLL_SECONDS = 5
+_MAX_ANNOTATIONS = 2000
+_SECTOR_BYTES = 512
+
+
+class TelemetryStore:
+    """Fixed-size ring buffers per tier; oldest points fall off the end."""
+
+    def __init__(self):
+        self.tiers: Dict[str, Deque[Dict[str, Any]]] = {
+            name: deque(maxlen=size) for name, (_, size) in TIERS.items()
+        }
+        self.annotations: Deque[Dict[str, Any]] = deque(maxlen=_MAX_ANNOTATIONS)
+        # Current jobs per Subgen instance, as of the newest sample
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # Partially filled bucket per downsampled tier: (bucket start, samples)
+        self._pending: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+
+    def add(self, sample: Dict[str, Any]):
+        for note in sample.get("annotations", []):
+            self.annotations.append(note)
+        if "instance_jobs" in sample:
+            self.jobs = sample["instance_jobs"]
+        point = {"t": sample["t"], **{m: sample.get(m) for m in METRICS}}
+        self.tiers["1s"].append(point)
+
+        for name, (seconds, _) in TIERS.items():
+            if seconds == 1:
+                continue
+            bucket = int(point["t"] // seconds) * seconds
+            start, samples = self._pending.get(name, (bucket, []))
+            if bucket != start and samples:
+                self.tiers[name].append(_aggregate(start, samples))
+                samples = []
+            samples.append(point)
+            self._pending[name] = (bucket, samples)
+
+    def range(self, tier: str, start: float, end: float) -> List[Dict[str, Any]]:
+        points = [p for p in self.tiers[tier] if start <= p["t"] <= end]
+        # Include the bucket still being filled so the newest data shows up
+        pending = self._pending.get(tier)
+        if pending and pending[1] and start <= pending[0] <= end:
+            points.append(_aggregate(*pending))
+        return points
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.tiers["1s"][-1] if self.tiers["1s"] else None
+
+
+def _aggregate(start: int, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    point: Dict[str, Any] = {"t": start, "samples": len(samples)}
+    for metric in METRICS:
+        values = [s[metric] for s in samples if s.get(metric) is not None]
+        if values:
+            point[metric] = round(sum(values) / len(values), 2)
+            point[f"{metric}_max"] = max(values)
+        else:
+            point[metric] = None
+    return point
+
+
+store = TelemetryStore()
+
+
+def peak_vram_by_jobs(hours: float = 24) -> Dict[int, float]:
+    """Highest VRAM seen per number of running transcriptions.
+
+    Subgen's queue count includes waiting jobs, so running jobs are capped
+    at the concurrent_transcriptions in force at the time.
+    """
+    end = time.time()
+    tier = _pick_tier(hours * 3600)
+    suffix = "" if tier == "1s" else "_max"
+    peaks: Dict[int, float] = {}
+    for point in store.range(tier, end - hours * 3600, end):
+        vram = point.get(f"vram_used_gb{suffix}")
+        jobs = point.get(f"jobs{suffix}")
+        limit = point.get(f"concurrent_transcriptions{suffix}")
+        if vram is None or not jobs:
+            continue
+        running = int(min(jobs, limit)) if limit else int(jobs)
+        peaks[running] = max(peaks.get(running, 0.0), vram)
+    return peaks
+
+
+def read_cpu_times() -> Optional[Tuple[int, int]]:
+    """(busy, total) jiffies from /proc/stat."""
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return sum(fields) - idle, sum(fields)
+
+
+def read_memory() -> Tuple[Optional[float], Optional[float]]:
+    """(used GB, total GB) from /proc/meminfo."""
+    values = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, rest = line.split(":", 1)
+                if key in ("MemTotal", "MemAvailable"):
+                    values[key] = int(rest.split()[0]) / (1024 * 1024)
+    except (OSError, ValueError):
+        return None, None
+    if "MemTotal" not in values or "MemAvailable" not in values:
+        return None, None
+    return round(values["MemTotal"] - values["MemAvailable"], 2), round(values["MemTotal"], 2)
+
+
+def read_disk_sectors() -> Optional[Tuple[int, int]]:
+    """(sectors read, sectors written) summed over whole block devices."""
+    read = written = 0
+    try:
+        with open("/proc/diskstats") as f:
+            for line in f:
+                fields = line.split()
+                name = fields[2]
+                # Partitions would double count; loop/ram devices aren't real I/O
+                if name.startswith(("loop", "ram")) or not os.path.exists(f"/sys/block/{name}"):
+                    continue
+                read += int(fields[5])
+                written += int(fields[9])
+    except (OSError, ValueError, IndexError):
+        return None
+    return read, written
+
+
+def jobs_from_status(data: Any) -> Tuple[Optional[int], List[str]]:
+    """Best-effort job count and file names from a Subgen /status payload."""
+    if not isinstance(data, dict):
+        return None, []
+    for key in ("queue", "jobs", "tasks", "active", "processing"):
+        value = data.get(key)
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, int):
+            return value, []
+        if isinstance(value, list):
+            names = []
+            for item in value:
+                if isinstance(item, str):
+                    names.append(item)
+                elif isinstance(item, dict):
+                    name = item.get("file") or item.get("path") or item.get("name")
+                    if name:
+                        names.append(str(name))
+            return len(value), names
+    return None, []
+
+
+class TelemetrySampler:
+    def __init__(self):
+        self.gpus: Dict[str, Tuple[float, float, float]] = {}  # index -> (used MiB, total MiB, util %)
+        self.jobs: Dict[str, Tuple[Optional[int], List[str]]] = {}  # instance URL -> (count, files)
+        self.concurrent_transcriptions: Optional[int] = None
+        self._gpu_task: Optional[asyncio.Task] = None
+        self._has_nvidia_smi = True
+        self._cpu: Optional[Tuple[int, int]] = None
+        self._disk: Optional[Tuple[int, int]] = None
+        self._disk_time = 0.0
+
+    async def _gpu_stream(self):
+        """Keep `nvidia-smi --loop-ms` running and record each line it prints."""
+        interval_ms = int(SAMPLE_INTERVAL_SECONDS * 1000)
+        while self._has_nvidia_smi:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "nvidia-smi",
+                    "--query-gpu=index,memory.used,memory.total,utilization.gpu",
+                    "--format=csv,noheader,nounits",
+                    f"--loop-ms={interval_ms}",
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            except (FileNotFoundError, PermissionError):
+                self._has_nvidia_smi = False
+                return
+            try:
+                async for raw in proc.stdout:
+                    try:
+                        index, used, total, util = [x.strip() for x in raw.decode().split(",")]
+                        self.gpus[index] = (float(used), float(total), float(util))
+                    except ValueError:
+                        continue
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                await proc.wait()
+            # nvidia-smi exited (driver reset, no GPU) - forget stale readings and retry later
+            self.gpus = {}
+            await asyncio.sleep(30)
+
+    def start_gpu_stream(self):
+        if self._has_nvidia_smi and (self._gpu_task is None or self._gpu_task.done()):
+            self._gpu_task = asyncio.create_task(self._gpu_stream())
+
+    def stop_gpu_stream(self):
+        if self._gpu_task is not None:
+            self._gpu_task.cancel()
+            self._gpu_task = None
+            self.gpus = {}
+
+    async def poll_jobs(self) -> List[Dict[str, Any]]:
+        """Refresh job counts from every Subgen instance; annotate changes."""
+        from .settings import load_settings
+        from .url_validation import validate_subgen_url_async
+
+        settings = await asyncio.to_thread(load_settings)
+        now = time.time()
+        notes: List[Dict[str, Any]] = []
+
+        if settings.concurrent_transcriptions != self.concurrent_transcriptions:
+            if self.concurrent_transcriptions is not None:
+                notes.append({
+                    "t": now, "kind": "setting", "name": "concurrent_transcriptions",
+                    "old": self.concurrent_transcriptions, "new": settings.concurrent_transcriptions,
+                })
+            self.concurrent_transcriptions = settings.concurrent_transcriptions
+
+        instances = {settings.subgen_url, *settings.language_routes.values()}
+        async with subgen_client(timeout=3.0) as client:
+            for url in instances:
+                valid, clean_url = await validate_subgen_url_async(url)
+                if not valid:
+                    continue
+                try:
+                    response = await client.get(f"{clean_url}/status")
+                    count, files = jobs_from_status(response.json()) if response.status_code == 200 else (None, [])
+                except Exception:
+                    count, files = None, []
+                previous = self.jobs.get(clean_url)
+                if (count, files) != previous and (previous is not None or count is not None):
+                    notes.append({"t": now, "kind": "jobs", "instance": clean_url, "jobs": count, "files": files})
+                self.jobs[clean_url] = (count, files)
+        return notes
+
+    def sample(self) -> Dict[str, Any]:
+        now = time.time()
+        sample: Dict[str, Any] = {"t": round(now, 3)}
+
+        if self.gpus:
+            readings = list(self.gpus.values())
+            sample["vram_used_gb"] = round(sum(r[0] for r in readings) / 1024, 2)
+            sample["vram_total_gb"] = round(sum(r[1] for r in readings) / 1024, 2)
+            sample["gpu_util"] = round(max(r[2] for r in readings), 1)
+
+        cpu = read_cpu_times()
+        if cpu and self._cpu and cpu[1] > self._cpu[1]:
+            sample["cpu_percent"] = round(100 * (cpu[0] - self._cpu[0]) / (cpu[1] - self._cpu[1]), 1)
+        self._cpu = cpu
+
+        sample["ram_used_gb"], sample["ram_total_gb"] = read_memory()
+
+        disk = read_disk_sectors()
+        if disk and self._disk and now > self._disk_time:
+            elapsed = now - self._disk_time
+            sample["disk_read_mbps"] = round((disk[0] - self._disk[0]) * _SECTOR_BYTES / elapsed / 1e6, 2)
+            sample["disk_write_mbps"] = round((disk[1] - self._disk[1]) * _SECTOR_BYTES / elapsed / 1e6, 2)
+        self._disk, self._disk_time = disk, now
+
+        counts = [count for count, _ in self.jobs.values() if count is not None]
+        sample["jobs"] = sum(counts) if counts else None
+        # Full state, not just changes: workers that didn't poll need it for /latest
+        sample["instance_jobs"] = {url: {"jobs": count, "files": files} for url, (count, files) in self.jobs.items()}
+        sample["concurrent_transcriptions"] = self.concurrent_transcriptions
+        return sample
+
+    async def run(self):
+        """Background loop started from main.py; only the lease holder samples."""
+        owner = shared_state.worker_id()
+        leader = False
+        last_lease = last_jobs = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_lease >= _LEASE_RENEW_SECONDS:
+                    leader = await asyncio.to_thread(
+                        shared_state.try_acquire_lease, _LEASE_NAME, owner, _LEASE_RENEW_SECONDS * 3
+                    )
+                    last_lease = now
+                    if leader:
+                        self.start_gpu_stream()
+                    else:
+                        self.stop_gpu_stream()
+
+                if leader:
+                    notes = []
+                    if now - last_jobs >= _JOB_POLL_SECONDS:
+                        notes = await self.poll_jobs()
+                        last_jobs = now
+                    sample = await asyncio.to_thread(self.sample)
+                    if notes:
+                        sample["annotations"] = notes
+                    await shared_state.publish_async("telemetry", sample)
+            except asyncio.CancelledError:
+                self.stop_gpu_stream()
+                raise
+            except Exception as e:
+                print(f"Telemetry sampler error: {e}")
+            await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+sampler = TelemetrySampler()
+
+
+def _pick_tier(span_seconds: float) -> str:
+    for name, (seconds, size) in TIERS.items():
+        if span_seconds <= seconds * size:
+            return name
+    return "1h"
+
+
+@router.get("/range")
+async def get_range(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    tier: Optional[str] = None,
+    metrics: Optional[str] = None,
+):
+    """
+    Time series between start and end (unix seconds; default: last 10 min).
+    tier is 1s/1m/1h, picked from the span when omitted. metrics is a
+    comma-separated subset of METRICS.
+    """
+    end = end or time.time()
+    start = start or end - 600
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    tier = tier or _pick_tier(end - start)
+    if tier not in TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown tier: {tier}")
+
+    points = store.range(tier, start, end)
+    if metrics:
+        wanted = {m.strip() for m in metrics.split(",")}
+        points = [{k: v for k, v in p.items() if k in ("t", "samples") or k.removesuffix("_max") in wanted} for p in points]
+
+    return {
+        "tier": tier,
+        "start": start,
+        "end": end,
+        "points": points,
+        "annotations": [a for a in store.annotations if start <= a["t"] <= end],
+    }
+
+
+@router.get("/latest")
+async def get_latest():
+    """Most recent sample and the current job counts per Subgen instance.
+
+    Both come from the shared sample stream, so every worker answers the
+    same — only the lease holder polls Subgen.
+    """
+    return {"sample": store.latest(), "jobs": store.jobs}
+
+
+@router.get("/peaks")
+async def get_peaks(metric: str = "vram_used_gb", hours: float = 24, limit: int = 5):
+    """
+    Highest readings of a metric with the jobs and concurrent_transcriptions
+    in force at the time — the starting point for diagnosing an OOM.
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+
+    end = time.time()
+    start = end - hours * 3600
+    tier = _pick_tier(end - start)
+    key = metric if tier == "1s" else f"{metric}_max"
+    points = [p for p in store.range(tier, start, end) if p.get(key) is not None]
+    points.sort(key=lambda p: p[key], reverse=True)
+
+    peaks = []
+    for point in points:
+        # One peak per bucket-sized window, not five readings of the same spike
+        if any(abs(point["t"] - peak["t"]) < 60 for peak in peaks):
+            continue
+        job_notes = {}
+        for note in store.annotations:
+            if note["kind"] == "jobs" and note["t"] <= point["t"] + TIERS[tier][0]:
+                job_notes[note["instance"]] = {"jobs": note["jobs"], "files": note["files"]}
+        peaks.append({
+            "t": point["t"],
+            "value": point[key],
+            "concurrent_transcriptions": point.get("concurrent_transcriptions_max", point.get("concurrent_transcriptions")),
+            "jobs": job_notes,
+        })
+        if len(peaks) >= limit:
+            break
+
+    return {"metric": metric, "tier": tier, "peaks": peaks}
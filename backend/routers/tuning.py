@@ -4,12 +4,20 @@ Language tuning wizard - help users optimize subtitle settings
 Tracks which languages have been tuned via the wizard. Tuning state is
 persisted in settings.json via language_configs — survives container restarts.
 The get_tuned_languages() helper derives the tuned set from persisted data.
+
+DEFAULT_LANGUAGES is treated as read-only presets. Tuned values only live in
+language_configs, so every uvicorn worker sees the same language cards.
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List, Set
+from typing import Dict, List, Optional, Set
+import asyncio
+import os
+from collections import Counter
 from . import languages
-from .settings import load_settings, save_settings_to_file, LanguageConfig
+from . import subtitle_analysis
+from . import shared_state
+from .settings import load_settings, modify_settings, LanguageConfig
 
 router = APIRouter()
 
@@ -49,6 +57,23 @@ class ApplySettings(BaseModel):
 class ResetRequest(BaseModel):
     language_code: str
 
+class AnalyzeRequest(BaseModel):
+    language_code: str
+    directory: str = "/media"  # Library root as SubBrainArr sees it
+    max_files: int = 20000
+    only_subgen_files: bool = True  # Human-made subs would skew the measured reading speed
+
+class AnalysisResult(BaseModel):
+    language_code: str
+    files_analyzed: int
+    files_failed: int
+    cues_analyzed: int
+    confident: bool  # False when too few cues to trust the numbers
+    subtitle_language: Optional[str] = None  # Language of the analyzed text; its reading profile is the target
+    statistics: Dict[str, Dict[str, float]]
+    detected_issues: List[str]
+    recommendation: Optional[TuningResult] = None
+
 @router.post("/recommend", response_model=TuningResult)
 async def get_tuning_recommendations(request: TuningRequest):
     """
@@ -122,32 +147,108 @@ async def get_tuning_recommendations(request: TuningRequest):
         }
     )
 
+@router.post("/analyze", response_model=AnalysisResult)
+async def analyze_subtitles(request: AnalyzeRequest):
+    """
+    Measure the subtitles Subgen already produced for a language and derive
+    tuning from the measured reading speed and line lengths, rather than
+    from the wizard's checkboxes. Files are analyzed across all CPU cores.
+    """
+    from .language_routing import cached_folder_languages, subtitle_text_language
+    from .subtitles import find_subtitle_files
+    from .workers import map_chunks
+
+    code = request.language_code
+    if code not in languages.DEFAULT_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"Unknown language: {code}")
+    if not os.path.isdir(request.directory):
+        raise HTTPException(status_code=400, detail=f"Directory not found: {request.directory}")
+
+    current_settings = load_settings()
+
+    def _collect():
+        # Filter while walking, then cap — capping first can leave a language with nothing
+        folder_languages = cached_folder_languages()
+        paths = subtitle_analysis.select_language_files(
+            find_subtitle_files(request.directory), code, folder_languages,
+            limit=request.max_files, only_subgen=request.only_subgen_files,
+        )
+        # Files of this audio language can hold translated text; judge the
+        # dominant text language against its own reading profile
+        by_text = {path: subtitle_text_language(path, folder_languages, current_settings) or code for path in paths}
+        text_language = Counter(by_text.values()).most_common(1)[0][0] if by_text else code
+        return [path for path in paths if by_text[path] == text_language], text_language
+
+    paths, text_language = await asyncio.to_thread(_collect)
+    stats = subtitle_analysis.merge_stats(await map_chunks(subtitle_analysis.analyze_files, paths))
+    summary = subtitle_analysis.summarize(stats)
+
+    # Start from whatever this language currently runs with
+    preset = languages.DEFAULT_LANGUAGES[code]
+    lc = current_settings.language_configs.get(code)
+    current = {
+        "patience": lc.patience if lc else preset["patience"],
+        "length_penalty": lc.length_penalty if lc else preset["length_penalty"],
+        "beam_size": lc.beam_size if lc else preset.get("beam_size", 5),
+    }
+
+    recommendation = None
+    issues: List[str] = []
+    if stats["cues"]:
+        patience, length_penalty, beam_size, issues, explanations = subtitle_analysis.recommend_from_stats(
+            summary, languages.get_reading_profile(text_language), **current
+        )
+        recommendation = TuningResult(
+            recommended_patience=patience,
+            recommended_length_penalty=length_penalty,
+            recommended_beam_size=beam_size,
+            explanation=" + ".join(explanations),
+            before_settings=current,
+            after_settings={
+                "patience": patience,
+                "length_penalty": length_penalty,
+                "beam_size": beam_size,
+            },
+        )
+
+    return AnalysisResult(
+        language_code=code,
+        files_analyzed=stats["files"],
+        files_failed=stats["errors"],
+        cues_analyzed=stats["cues"],
+        confident=stats["cues"] >= subtitle_analysis.MIN_CUES_FOR_CONFIDENCE,
+        subtitle_language=text_language,
+        statistics=summary,
+        detected_issues=issues,
+        recommendation=recommendation,
+    )
+
 @router.post("/apply")
 async def apply_tuning_settings(settings: ApplySettings):
     """Apply tuned settings to a language profile.
 
-    Updates DEFAULT_LANGUAGES in-memory (for current session) and persists
-    to settings.language_configs (for compose generation and restart survival).
+    Persists to settings.language_configs (for compose generation and restart
+    survival) under the cross-process settings lock, then notifies every
+    worker's dashboards so language cards refresh everywhere.
     """
+    lang_code = next(
+        (code for code, lang_data in languages.DEFAULT_LANGUAGES.items()
+         if lang_data["name"] == settings.language),
+        None,
+    )
+
     applied = False
-    for lang_code, lang_data in languages.DEFAULT_LANGUAGES.items():
-        if lang_data["name"] == settings.language:
-            # Update in-memory DEFAULT_LANGUAGES (immediate UI effect)
-            lang_data["patience"] = settings.patience
-            lang_data["length_penalty"] = settings.length_penalty
-            lang_data["beam_size"] = settings.beam_size
-
-            # Persist to settings.language_configs → settings.json
-            current_settings = load_settings()
+    if lang_code:
+        def _apply(current_settings):
             current_settings.language_configs[lang_code] = LanguageConfig(
                 patience=settings.patience,
                 length_penalty=settings.length_penalty,
                 beam_size=settings.beam_size,
             )
-            save_settings_to_file(current_settings)
 
-            applied = True
-            break
+        applied = await asyncio.to_thread(modify_settings, _apply) is not None
+        if applied:
+            await _notify_languages_changed([lang_code])
 
     return {
         "success": applied,
@@ -169,15 +270,18 @@ async def apply_default_tuning():
     to disk, so compose snippet generation picks them up and tuning state
     survives container restarts.
     """
-    current_settings = load_settings()
-    for lang_code, lang_data in languages.DEFAULT_LANGUAGES.items():
-        current_settings.language_configs[lang_code] = LanguageConfig(
-            patience=lang_data["patience"],
-            length_penalty=lang_data["length_penalty"],
-            beam_size=lang_data.get("beam_size", 5),
-        )
-    save_settings_to_file(current_settings)
-    return {"success": True, "languages_tuned": len(languages.DEFAULT_LANGUAGES)}
+    def _apply(current_settings):
+        for lang_code, lang_data in languages.DEFAULT_LANGUAGES.items():
+            current_settings.language_configs[lang_code] = LanguageConfig(
+                patience=lang_data["patience"],
+                length_penalty=lang_data["length_penalty"],
+                beam_size=lang_data.get("beam_size", 5),
+            )
+
+    success = await asyncio.to_thread(modify_settings, _apply) is not None
+    if success:
+        await _notify_languages_changed(list(languages.DEFAULT_LANGUAGES))
+    return {"success": success, "languages_tuned": len(languages.DEFAULT_LANGUAGES)}
 
 
 @router.post("/reset")
@@ -187,14 +291,28 @@ async def reset_tuning(request: ResetRequest):
     Removes the language from settings.language_configs and persists.
     The language list will then show DEFAULT_LANGUAGES preset values.
     """
-    current_settings = load_settings()
-    removed = request.language_code in current_settings.language_configs
+    removed = False
+
+    def _reset(current_settings):
+        nonlocal removed
+        removed = request.language_code in current_settings.language_configs
+        if removed:
+            del current_settings.language_configs[request.language_code]
+
+    await asyncio.to_thread(modify_settings, _reset)
     if removed:
-        del current_settings.language_configs[request.language_code]
-        save_settings_to_file(current_settings)
+        await _notify_languages_changed([request.language_code])
 
     return {
         "success": removed,
         "language_code": request.language_code,
         "message": f"Tuning reset for {request.language_code}" if removed else "Language was not tuned"
     }
+
+
+async def _notify_languages_changed(language_codes: List[str]):
+    """Push a language card refresh to dashboards on every worker."""
+    try:
+        await shared_state.publish_async("broadcast", {"type": "languages_changed", "languages": language_codes})
+    except Exception as e:
+        print(f"Could not publish language change: {e}")
@@ -2,10 +2,19 @@
 Shared URL validation for SSRF prevention.
 
 All endpoints that accept user-provided URLs and make server-side HTTP
-requests MUST validate them through validate_subgen_url() first.
+requests MUST validate them through validate_subgen_url() first (or
+validate_subgen_url_async() from async code, which resolves without
+blocking the event loop).
+
+Resolution results are cached per hostname+port so status polling every
+few seconds doesn't mean a DNS lookup every few seconds. Failed lookups
+are cached too, for a shorter time.
 """
+import asyncio
 import ipaddress
 import socket
+import time
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 
@@ -25,47 +34,129 @@ _ALLOWED_HOSTNAMES = {
     "subgen", "localhost", "host.docker.internal",
 }
 
+# Seconds to trust a resolved (or blocked) host, and an unresolvable one
+DNS_CACHE_TTL_SECONDS = 300
+DNS_NEGATIVE_TTL_SECONDS = 30
+_DNS_CACHE_LIMIT = 4096
 
-def validate_subgen_url(url: str) -> tuple[bool, str]:
+# (hostname, port) -> (expires at, error message or None when allowed)
+_dns_cache: Dict[Tuple[str, int], Tuple[float, Optional[str]]] = {}
+
+
+def _parse(url: str) -> Tuple[Optional[str], str, Optional[str], int]:
     """
-    Validate a user-provided URL is safe to make server-side requests to.
+    Checks that need no DNS.
 
-    Returns (True, cleaned_url) on success, (False, error_message) on failure.
+    Returns (error, cleaned_url, hostname needing resolution or None, port).
     """
     if not url or not url.strip():
-        return False, "URL is empty"
+        return "URL is empty", url, None, 0
 
     url = url.strip().rstrip("/")
 
     # Parse the URL
     try:
         parsed = urlparse(url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
     except Exception:
-        return False, "Invalid URL format"
+        return "Invalid URL format", url, None, 0
 
     # Check scheme
     if parsed.scheme not in _ALLOWED_SCHEMES:
-        return False, f"URL scheme must be http or https, got '{parsed.scheme}'"
+        return f"URL scheme must be http or https, got '{parsed.scheme}'", url, None, 0
 
     # Check hostname exists
     hostname = parsed.hostname
     if not hostname:
-        return False, "URL has no hostname"
+        return "URL has no hostname", url, None, 0
 
     # Allow known Docker hostnames without IP resolution
     if hostname in _ALLOWED_HOSTNAMES:
-        return True, url
+        return None, url, None, port
 
-    # Try to resolve hostname and check against blocked ranges
+    # IP literals need no lookup
     try:
-        addr_info = socket.getaddrinfo(hostname, parsed.port or 80, proto=socket.IPPROTO_TCP)
-        for family, _, _, _, sockaddr in addr_info:
-            ip = ipaddress.ip_address(sockaddr[0])
-            for blocked in _BLOCKED_RANGES:
-                if ip in blocked:
-                    return False, f"URL resolves to blocked address range"
-    except socket.gaierror:
-        # Can't resolve — allow it (might be a Docker hostname we don't know about)
-        pass
-
-    return True, url
+        return _check_addresses([hostname]), url, None, port
+    except ValueError:
+        return None, url, hostname, port
+
+
+def _check_addresses(addresses: List[str]) -> Optional[str]:
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])  # Drop IPv6 scope ids
+        for blocked in _BLOCKED_RANGES:
+            if ip in blocked:
+                return "URL resolves to blocked address range"
+    return None
+
+
+def _cached(key: Tuple[str, int]) -> Tuple[bool, Optional[str]]:
+    """(hit, error) for a hostname+port."""
+    entry = _dns_cache.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return False, None
+    return True, entry[1]
+
+
+def _store(key: Tuple[str, int], error: Optional[str], ttl: float):
+    if len(_dns_cache) >= _DNS_CACHE_LIMIT:
+        now = time.monotonic()
+        for stale in [k for k, (expires, _) in _dns_cache.items() if expires < now]:
+            del _dns_cache[stale]
+        if len(_dns_cache) >= _DNS_CACHE_LIMIT:
+            _dns_cache.clear()
+    _dns_cache[key] = (time.monotonic() + ttl, error)
+
+
+def _record(key: Tuple[str, int], addr_info) -> Optional[str]:
+    error = _check_addresses([sockaddr[0] for _, _, _, _, sockaddr in addr_info])
+    _store(key, error, DNS_CACHE_TTL_SECONDS)
+    return error
+
+
+def _record_unresolvable(key: Tuple[str, int]) -> None:
+    # Can't resolve — allow it (might be a Docker hostname we don't know about)
+    _store(key, None, DNS_NEGATIVE_TTL_SECONDS)
+
+
+def validate_subgen_url(url: str) -> tuple[bool, str]:
+    """
+    Validate a user-provided URL is safe to make server-side requests to.
+
+    Returns (True, cleaned_url) on success, (False, error_message) on failure.
+    Blocks on DNS for uncached hostnames; use validate_subgen_url_async()
+    in async code.
+    """
+    error, url, hostname, port = _parse(url)
+    if error:
+        return False, error
+    if hostname is None:
+        return True, url
+
+    key = (hostname.lower(), port)
+    hit, error = _cached(key)
+    if not hit:
+        try:
+            error = _record(key, socket.getaddrinfo(hostname, port, proto=socket.IPPROTO_TCP))
+        except socket.gaierror:
+            _record_unresolvable(key)
+    return (False, error) if error else (True, url)
+
+
+async def validate_subgen_url_async(url: str) -> tuple[bool, str]:
+    """validate_subgen_url() with the lookup done by the event loop's resolver."""
+    error, url, hostname, port = _parse(url)
+    if error:
+        return False, error
+    if hostname is None:
+        return True, url
+
+    key = (hostname.lower(), port)
+    hit, error = _cached(key)
+    if not hit:
+        try:
+            addr_info = await asyncio.get_running_loop().getaddrinfo(hostname, port, proto=socket.IPPROTO_TCP)
+            error = _record(key, addr_info)
+        except socket.gaierror:
+            _record_unresolvable(key)
+    return (False, error) if error else (True, url)
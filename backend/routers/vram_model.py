@@ -0,0 +1,221 @@
+"""
+VRAM model - how much GPU memory a Subgen instance needs
+
+Rough per-model figures for faster-whisper (CTranslate2). Each Subgen
+instance loads its own copy of the model weights, and every concurrent
+transcription adds its own working set on top of that.
+
+The table is a starting point. Once telemetry has seen Subgen run with a
+given model × compute_type × beam_size, calibrate_from_peaks() fits the
+real weights and per-job cost from observed VRAM peaks. That calibration
+is stored in shared state and takes precedence over the table.
+"""
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Approximate model weight footprint in GB at float16
+_MODEL_WEIGHTS_GB = {
+    "tiny": 0.15,
+    "base": 0.3,
+    "small": 0.9,
+    "medium": 2.1,
+    "large-v1": 3.1,
+    "large-v2": 3.1,
+    "large-v3": 3.1,
+    "large-v3-turbo": 1.7,
+    "distil-large-v3": 1.6,
+}
+
+# Per-transcription working set in GB at float16, beam_size 5
+_JOB_OVERHEAD_GB = {
+    "tiny": 0.3,
+    "base": 0.4,
+    "small": 0.7,
+    "medium": 1.2,
+    "large-v1": 1.6,
+    "large-v2": 1.6,
+    "large-v3": 1.6,
+    "large-v3-turbo": 1.1,
+    "distil-large-v3": 1.0,
+}
+
+# Weight size relative to float16
+_COMPUTE_TYPE_SCALE = {
+    "float32": 2.0,
+    "float16": 1.0,
+    "bfloat16": 1.0,
+    "int8_float16": 0.6,
+    "int8": 0.55,
+}
+
+# Headroom left free for the CUDA context, fragmentation and other tenants
+SAFETY_MARGIN = 0.15
+
+# Beam search keeps beam_size hypotheses alive; the working set grows
+# roughly linearly with it. 1.0 at the table's beam_size 5.
+_BEAM_BASE = 0.6
+_BEAM_STEP = 0.08
+
+CALIBRATION_KEY = "vram_calibration"
+
+# Threads a single transcription can keep busy before returns diminish
+_MAX_THREADS_PER_JOB = 8
+
+
+def _calibration_id(whisper_model: str, compute_type: str, beam_size: int) -> str:
+    return f"{whisper_model}|{compute_type}|{beam_size}"
+
+
+def get_calibration(whisper_model: str, compute_type: str, beam_size: int) -> Optional[Dict]:
+    """Stored calibration for this combination, if telemetry produced one."""
+    from . import shared_state
+
+    calibrations = shared_state.get_value(CALIBRATION_KEY, {}) or {}
+    return calibrations.get(_calibration_id(whisper_model, compute_type, beam_size))
+
+
+def estimate_instance_vram(
+    whisper_model: str,
+    compute_type: str,
+    beam_size: int = 5,
+    calibrated: bool = True,
+) -> Tuple[float, float]:
+    """Return (weights_gb, per_job_gb) for one Subgen instance."""
+    if calibrated:
+        calibration = get_calibration(whisper_model, compute_type, beam_size)
+        if calibration:
+            return calibration["weights_gb"], calibration["per_job_gb"]
+
+    scale = _COMPUTE_TYPE_SCALE.get(compute_type, 1.0)
+    beam_scale = _BEAM_BASE + _BEAM_STEP * max(1, beam_size)
+    weights = _MODEL_WEIGHTS_GB.get(whisper_model, _MODEL_WEIGHTS_GB["large-v3"]) * scale
+    per_job = _JOB_OVERHEAD_GB.get(whisper_model, _JOB_OVERHEAD_GB["large-v3"]) * scale * beam_scale
+    return weights, per_job
+
+
+def max_concurrency(vram_gb: float, whisper_model: str, compute_type: str, beam_size: int = 5) -> int:
+    """How many concurrent transcriptions fit in vram_gb for one instance.
+
+    Returns 0 if not even a single job fits next to the model weights.
+    """
+    weights, per_job = estimate_instance_vram(whisper_model, compute_type, beam_size)
+    usable = vram_gb * (1 - SAFETY_MARGIN) - weights
+    if usable < per_job:
+        return 0
+    return int(usable // per_job)
+
+
+def whisper_threads_for(cpu_threads: int, concurrency: int) -> int:
+    """WHISPER_THREADS per job so concurrent jobs don't oversubscribe the CPU."""
+    return max(1, min(_MAX_THREADS_PER_JOB, cpu_threads // max(1, concurrency)))
+
+
+def auto_tune(
+    device_type: str,
+    vram_gb: Optional[float],
+    ram_gb: Optional[float],
+    cpu_threads: int,
+    whisper_model: str,
+    compute_type: str,
+    beam_size: int,
+) -> Dict:
+    """Largest safe concurrent_transcriptions and matching whisper_threads.
+
+    On GPU the limit is VRAM; on CPU the model lives in RAM and every job
+    needs its own cores, so both bound concurrency.
+    """
+    weights, per_job = estimate_instance_vram(whisper_model, compute_type, beam_size)
+    notes: List[str] = []
+
+    if device_type == "cuda" and vram_gb:
+        concurrency = max_concurrency(vram_gb, whisper_model, compute_type, beam_size)
+        budget, limit = vram_gb, "vram"
+        if concurrency == 0:
+            notes.append(f"{whisper_model} ({compute_type}) does not fit in {vram_gb}GB VRAM with headroom")
+            concurrency = 1
+    else:
+        by_cores = max(1, cpu_threads // 4)
+        by_ram = max_concurrency(ram_gb, whisper_model, compute_type, beam_size) if ram_gb else by_cores
+        concurrency = max(1, min(by_cores, by_ram))
+        budget, limit = ram_gb, "ram" if by_ram < by_cores else "cpu"
+
+    calibration = get_calibration(whisper_model, compute_type, beam_size)
+    notes.append(
+        f"Calibrated from {calibration['observations']} telemetry observations"
+        if calibration else "Estimated from model tables — calibrate from telemetry for a tighter fit"
+    )
+
+    return {
+        "concurrent_transcriptions": concurrency,
+        "whisper_threads": whisper_threads_for(cpu_threads, concurrency),
+        "limited_by": limit,
+        "budget_gb": budget,
+        "weights_gb": round(weights, 2),
+        "per_job_gb": round(per_job, 2),
+        "safety_margin": SAFETY_MARGIN,
+        "calibrated": calibration is not None,
+        "notes": notes,
+    }
+
+
+def calibrate_from_peaks(
+    observations: Dict[int, float],
+    whisper_model: str,
+    compute_type: str,
+    beam_size: int,
+) -> Optional[Dict]:
+    """Fit (weights, per_job) from peak VRAM per number of running jobs.
+
+    observations maps running-job count -> highest VRAM seen with that many
+    jobs. Two or more distinct counts give a least-squares line
+    (intercept = weights + CUDA context, slope = per job). A single count
+    keeps the table's weights and solves for the per-job cost. Returns
+    None when the data can't support a fit.
+    """
+    points = sorted((n, peak) for n, peak in observations.items() if n >= 1)
+    if not points:
+        return None
+
+    table_weights, table_per_job = estimate_instance_vram(whisper_model, compute_type, beam_size, calibrated=False)
+    weights, per_job = table_weights, None
+
+    if len(points) >= 2:
+        mean_n = sum(n for n, _ in points) / len(points)
+        mean_v = sum(v for _, v in points) / len(points)
+        var = sum((n - mean_n) ** 2 for n, _ in points)
+        slope = sum((n - mean_n) * (v - mean_v) for n, v in points) / var
+        intercept = mean_v - slope * mean_n
+        # A negative or tiny intercept means the peaks are noise, not a line
+        if slope > 0 and intercept >= table_weights * 0.5:
+            per_job = slope
+            weights = intercept
+
+    if per_job is None:
+        n, peak = points[-1]
+        per_job = (peak - weights) / n
+    if per_job <= 0:
+        return None
+
+    # Don't let one odd reading swing estimates wildly
+    per_job = max(table_per_job * 0.5, min(per_job, table_per_job * 3))
+
+    return {
+        "weights_gb": round(weights, 3),
+        "per_job_gb": round(per_job, 3),
+        "observations": len(points),
+        "table_per_job_gb": round(table_per_job, 3),
+        "updated": time.time(),
+    }
+
+
+def save_calibration(whisper_model: str, compute_type: str, beam_size: int, calibration: Dict):
+    from . import shared_state
+
+    key = _calibration_id(whisper_model, compute_type, beam_size)
+
+    def _apply(current):
+        current = current or {}
+        current[key] = calibration
+        return current
+
+    shared_state.update_value(CALIBRATION_KEY, _apply, {})
@@ -0,0 +1,90 @@
+"""
+Worker pool - CPU-bound batch work off the event loop
+
+Subtitle analysis, hallucination scanning and post-processing parse
+thousands of files. That is pure-Python CPU work, so it runs in a shared
+process pool rather than threads (the GIL would serialize threads).
+Work is submitted in chunks of paths to keep pickling overhead low.
+
+Workers are spawned, not forked: forking this process copies the state of
+its to_thread workers and open SQLite connections mid-use, which can
+deadlock the child (and Python 3.12+ warns about it).
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def pool_size() -> int:
+    """Number of worker processes (WORKER_PROCESSES overrides the CPU count).
+
+    Defaults to the CPUs the container may actually use (cgroup quota and
+    cpuset), not the host's count.
+    """
+    from .cgroups import effective_cpu_count
+
+    configured = os.getenv("WORKER_PROCESSES")
+    if configured:
+        return max(1, int(configured))
+    return effective_cpu_count()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=pool_size(), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def chunked(items: Iterable[T], size: int) -> Iterable[List[T]]:
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def map_chunks(func: Callable[[List[T]], R], items: Iterable[T], chunk_size: int = 64) -> List[R]:
+    """Run func over chunks of items in the process pool.
+
+    func must be a module-level function (picklable) that takes a list of
+    items. Results come back in chunk order.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    futures = [loop.run_in_executor(pool, func, chunk) for chunk in chunked(items, chunk_size)]
+    return list(await asyncio.gather(*futures))
+
+
+async def iter_chunk_results(func: Callable[[List[T]], R], items: Iterable[T], chunk_size: int = 64) -> AsyncIterator[R]:
+    """Like map_chunks, but yield each chunk's result as soon as it finishes.
+
+    Lets long library-wide jobs report progress and persist partial results.
+    Chunks not yet started are cancelled if the caller stops iterating.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    futures = [loop.run_in_executor(pool, func, chunk) for chunk in chunked(items, chunk_size)]
+    try:
+        for future in asyncio.as_completed(futures):
+            yield await future
+    finally:
+        for future in futures:
+            future.cancel()
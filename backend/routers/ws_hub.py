@@ -0,0 +1,168 @@
+"""
+WebSocket hub - fan out live updates to many dashboards
+
+Awaiting send_json on each socket in turn meant one slow dashboard (a
+phone on bad Wi-Fi, a backgrounded tab) delayed every other client, and
+sockets that died without a close frame were never removed.
+
+Each client gets a bounded send queue drained by its own writer task, so
+broadcasting only ever enqueues. Messages are serialized once and the
+same text is queued for every client. When a client falls behind:
+
+  - lossy messages (periodic samples where the next one supersedes the
+    last, like telemetry) are skipped for it once its queue is half full
+  - when the queue is full, the oldest queued message makes room
+  - a client whose writer hasn't completed a send for SEND_TIMEOUT_SECONDS
+    is evicted; dashboards reconnect and reload their state
+
+Clients subscribe to topic keys (see ws_topics); publish() only reaches
+subscribers, while broadcast_local() still reaches everyone.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from . import shared_state
+
+QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", 256))
+SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT", 10))
+
+
+def serialize(message: Dict[str, Any]) -> str:
+    # Same encoding Starlette's send_json uses
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class Client:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.sent = 0
+        self.skipped = 0
+        self.closed = False
+        self.full_since: Optional[float] = None
+        self.writer: Optional[asyncio.Task] = None
+        self.subscriptions: Dict[str, Dict[str, Any]] = {}  # topic key -> params
+
+    def offer(self, text: str, lossy: bool = False) -> bool:
+        """Queue text for sending. False means the client can't keep up."""
+        if lossy and self.queue.qsize() >= QUEUE_SIZE // 2:
+            self.skipped += 1
+            return True
+        if self.queue.full():
+            now = time.monotonic()
+            if self.full_since is None:
+                self.full_since = now
+            elif now - self.full_since > SEND_TIMEOUT_SECONDS:
+                return False
+            self.queue.get_nowait()
+            self.skipped += 1
+        self.queue.put_nowait(text)
+        return True
+
+    async def _write(self, hub: "WebSocketHub"):
+        try:
+            while True:
+                text = await self.queue.get()
+                # Not wait_for: on 3.11 it can swallow the cancel from disconnect()
+                # once a send has completed, leaving the writer running forever
+                async with asyncio.timeout(SEND_TIMEOUT_SECONDS):
+                    await self.websocket.send_text(text)
+                self.sent += 1
+                self.full_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Timed out or the socket is gone
+            await hub.evict(self)
+
+
+class WebSocketHub:
+    def __init__(self):
+        self.clients: List[Client] = []
+        self.evicted = 0
+        # Called with a topic key when its last subscriber goes away
+        self.on_idle: Optional[Callable[[str], None]] = None
+
+    async def connect(self, websocket: WebSocket) -> Client:
+        await websocket.accept()
+        client = Client(websocket)
+        client.writer = asyncio.create_task(client._write(self))
+        self.clients.append(client)
+        return client
+
+    def disconnect(self, client: Client):
+        """Forget a client whose socket already closed."""
+        client.closed = True
+        if client in self.clients:
+            self.clients.remove(client)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        for key in list(client.subscriptions):
+            self.unsubscribe(client, key)
+
+    def subscribe(self, client: Client, key: str, params: Dict[str, Any]):
+        client.subscriptions[key] = params
+
+    def unsubscribe(self, client: Client, key: str):
+        if client.subscriptions.pop(key, None) is not None and not self.subscribers(key):
+            if self.on_idle is not None:
+                self.on_idle(key)
+
+    def subscribers(self, key: str) -> List[Client]:
+        return [c for c in self.clients if key in c.subscriptions]
+
+    async def evict(self, client: Client):
+        """Drop a client that can't keep up and close its socket."""
+        if client.closed:
+            return
+        self.evicted += 1
+        self.disconnect(client)
+        try:
+            await asyncio.wait_for(client.websocket.close(code=1013), 1.0)  # Try again later
+        except Exception:
+            pass
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Send to dashboards connected to any worker."""
+        await shared_state.publish_async("broadcast", message)
+
+    def broadcast_local(self, message: Dict[str, Any], lossy: bool = False):
+        """Queue for dashboards connected to this worker; never waits on a socket."""
+        self.send_many(self.clients, message, lossy)
+
+    def publish(self, key: str, message: Dict[str, Any], lossy: bool = False):
+        """Queue for this worker's clients subscribed to a topic key."""
+        self.send_many(self.subscribers(key), message, lossy)
+
+    def send_many(self, clients: List[Client], message: Dict[str, Any], lossy: bool = False):
+        if not clients:
+            return
+        text = serialize(message)
+        for client in list(clients):
+            if not client.offer(text, lossy):
+                asyncio.create_task(self.evict(client))
+
+    def send(self, client: Client, message: Dict[str, Any]):
+        """Queue a reply for one client."""
+        if not client.offer(serialize(message)):
+            asyncio.create_task(self.evict(client))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "evicted": self.evicted,
+            "queued": sum(c.queue.qsize() for c in self.clients),
+            "skipped": sum(c.skipped for c in self.clients),
+            "topics": {
+                key: len(self.subscribers(key))
+                for key in sorted({k for c in self.clients for k in c.subscriptions})
+            },
+        }
+
+
+hub = WebSocketHub()
@@ -0,0 +1,203 @@
+"""
+WebSocket topics - clients only receive what they subscribed to
+
+Clients send JSON over /ws:
+
+  {"action": "subscribe", "topic": "logs", "params": {"container": "subgen", "level": "ERROR"}}
+  {"action": "unsubscribe", "topic": "logs", "params": {"container": "subgen"}}
+  {"action": "subscriptions"}
+
+Topics:
+
+  scan_status  params.instance (Subgen URL) - /status whenever it changes
+  logs         params.container ("subgen" or "local"), optional params.level
+  telemetry    hardware samples from the telemetry sampler
+  health       Subgen health probes and up/down/restart/degraded events
+  jobs         changes in the jobs each Subgen instance reports
+
+scan_status and logs have upstream producers (a /status poller, a Docker
+log follower) that run on this worker only while at least one of its
+clients is subscribed. Telemetry and health keep sampling regardless
+since their history backs the REST endpoints; only delivery is filtered.
+Anything that isn't a recognised action still gets the old "pong".
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from .ws_hub import Client, hub
+
+TOPICS = ("scan_status", "logs", "telemetry", "health", "jobs")
+
+SCAN_STATUS_INTERVAL_SECONDS = float(os.getenv("WS_SCAN_STATUS_INTERVAL", 3))
+
+_LOG_BATCH_SECONDS = 0.25
+_LOG_CONTAINERS = ("subgen", "local")
+
+# topic key -> running producer
+_producers: Dict[str, asyncio.Task] = {}
+
+
+async def topic_key(topic: str, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Validate a subscription; returns (topic key, normalised params)."""
+    if topic not in TOPICS:
+        raise ValueError(f"Unknown topic: {topic}")
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+
+    if topic == "scan_status":
+        from .url_validation import validate_subgen_url_async
+
+        valid, result = await validate_subgen_url_async(str(params.get("instance") or ""))
+        if not valid:
+            raise ValueError(result)
+        return f"scan_status:{result}", {"instance": result}
+
+    if topic == "logs":
+        container = params.get("container") or "subgen"
+        if container not in _LOG_CONTAINERS:
+            raise ValueError(f"container must be one of {', '.join(_LOG_CONTAINERS)}")
+        level = (params.get("level") or "").upper() or None
+        return f"logs:{container}", {"container": container, "level": level}
+
+    return topic, {}
+
+
+def _start_producer(key: str, params: Dict[str, Any]):
+    task = _producers.get(key)
+    if task is not None and not task.done():
+        return
+    if key.startswith("scan_status:"):
+        _producers[key] = asyncio.create_task(_scan_status_producer(key, params["instance"]))
+    elif key.startswith("logs:"):
+        _producers[key] = asyncio.create_task(_log_producer(key, params["container"]))
+
+
+def _stop_producer(key: str):
+    task = _producers.pop(key, None)
+    if task is not None:
+        task.cancel()
+
+
+hub.on_idle = _stop_producer
+
+
+async def _scan_status_producer(key: str, url: str):
+    from .scanning import get_scan_status
+
+    last = None
+    while True:
+        try:
+            status = await get_scan_status(url)
+            if status != last:
+                hub.publish(key, {"type": "scan_status", "instance": url, "status": status}, lossy=True)
+                last = status
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Scan status producer error for {url}: {e}")
+        await asyncio.sleep(SCAN_STATUS_INTERVAL_SECONDS)
+
+
+def _follow_logs(container_names: List[str], loop: asyncio.AbstractEventLoop, lines: asyncio.Queue, state: Dict[str, Any]):
+    """Blocking Docker log follower; runs in its own thread."""
+    from .logs import _get_docker_client
+
+    client = _get_docker_client()
+    container = None
+    for name in container_names if client else []:
+        try:
+            container = client.containers.get(name)
+            break
+        except Exception:
+            continue
+    if container is None:
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+        return
+
+    stream = container.logs(stream=True, follow=True, timestamps=True, since=int(time.time()))
+    state["stream"] = stream
+    partial = ""
+    try:
+        for chunk in stream:
+            if state.get("stopped"):
+                break
+            partial += chunk.decode("utf-8", errors="replace")
+            *complete, partial = partial.split("\n")
+            for line in complete:
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+    except Exception:
+        pass  # Stream closed by _log_producer or the container went away
+    finally:
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+
+
+async def _log_producer(key: str, container: str):
+    from .logs import _SELF_CONTAINER_NAMES, _SUBGEN_CONTAINER_NAMES
+
+    names = _SUBGEN_CONTAINER_NAMES if container == "subgen" else _SELF_CONTAINER_NAMES
+    lines: asyncio.Queue = asyncio.Queue()
+    state: Dict[str, Any] = {}
+    threading.Thread(
+        target=_follow_logs, args=(names, asyncio.get_running_loop(), lines, state), daemon=True
+    ).start()
+
+    try:
+        while True:
+            batch = [await lines.get()]
+            await asyncio.sleep(_LOG_BATCH_SECONDS)
+            while not lines.empty():
+                batch.append(lines.get_nowait())
+            ended = None in batch
+            batch = [line for line in batch if line is not None]
+
+            # One message per distinct level filter, serialized once each
+            by_level: Dict[Any, List[Client]] = {}
+            for client in hub.subscribers(key):
+                by_level.setdefault(client.subscriptions[key].get("level"), []).append(client)
+            for level, clients in by_level.items():
+                selected = [line for line in batch if not level or level in line.upper()]
+                if selected:
+                    hub.send_many(clients, {"type": "log", "container": container, "lines": selected})
+
+            if ended:
+                hub.publish(key, {"type": "log_ended", "container": container})
+                return
+    finally:
+        state["stopped"] = True
+        stream = state.get("stream")
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+async def handle_message(client: Client, text: str) -> Dict[str, Any]:
+    """Apply a subscription request from a client; returns the reply."""
+    try:
+        message = json.loads(text)
+        action = message.get("action")
+    except (ValueError, AttributeError):
+        action = None
+    if action not in ("subscribe", "unsubscribe", "subscriptions"):
+        return {"type": "pong", "message": "Brain is listening"}
+
+    if action == "subscriptions":
+        return {"type": "subscriptions", "topics": client.subscriptions}
+
+    try:
+        key, params = await topic_key(message.get("topic"), message.get("params") or {})
+    except ValueError as e:
+        return {"type": "error", "action": action, "message": str(e)}
+
+    if action == "subscribe":
+        hub.subscribe(client, key, params)
+        _start_producer(key, params)
+        return {"type": "subscribed", "topic": key, "params": params}
+
+    hub.unsubscribe(client, key)
+    return {"type": "unsubscribed", "topic": key}
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the shared SQLite store out of /app/config when modules touch it
+os.environ.setdefault("STATE_DB_FILE", os.path.join(tempfile.mkdtemp(), "state.db"))
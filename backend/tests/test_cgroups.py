@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from routers import cgroups
+from routers.cgroups import limits_from_docker, own_limits, parse_cpuset
+
+
+@pytest.fixture
+def fake_host(tmp_path, monkeypatch):
+    """A 16-CPU host whose cgroup files live under tmp_path."""
+    monkeypatch.setattr(cgroups, "_CGROUP_ROOT", str(tmp_path))
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    return tmp_path
+
+
+def _write(root, relative, content):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content + "\n")
+
+
+def test_parse_cpuset():
+    assert parse_cpuset("0-3,8,10-11") == 7
+    assert parse_cpuset("5") == 1
+    assert parse_cpuset("") is None
+    assert parse_cpuset("0-x") is None
+
+
+def test_v2_namespaced(fake_host, monkeypatch):
+    monkeypatch.setattr(cgroups, "_own_cgroup_paths", lambda: {"": "/"})
+    _write(fake_host, "cgroup.controllers", "cpuset cpu memory")
+    _write(fake_host, "cpu.max", "250000 100000")
+    _write(fake_host, "cpuset.cpus.effective", "0-7")
+    _write(fake_host, "memory.max", str(4 * 1024 ** 3))
+    _write(fake_host, "memory.current", str(1024 ** 3))
+
+    limits = own_limits()
+    assert limits.source == "cgroup v2"
+    assert (limits.cpu_quota, limits.cpuset_cpus, limits.effective_cpus) == (2.5, 8, 2.5)
+    assert (limits.memory_limit_gb, limits.memory_usage_gb) == (4.0, 1.0)
+
+
+def test_v2_unlimited_in_nested_cgroup(fake_host, monkeypatch):
+    # No cgroup namespace: the limits sit under the process's own path
+    monkeypatch.setattr(cgroups, "_own_cgroup_paths", lambda: {"": "/system.slice/docker-abc.scope"})
+    _write(fake_host, "cgroup.controllers", "cpu memory")
+    _write(fake_host, "system.slice/docker-abc.scope/cpu.max", "max 100000")
+    _write(fake_host, "system.slice/docker-abc.scope/memory.max", "max")
+
+    limits = own_limits()
+    assert limits.cpu_quota is None
+    assert limits.memory_limit_gb is None
+    assert limits.effective_cpus == 16
+
+
+def test_v1(fake_host, monkeypatch):
+    monkeypatch.setattr(cgroups, "_own_cgroup_paths", lambda: {"cpu": "/", "cpuset": "/", "memory": "/"})
+    _write(fake_host, "cpu,cpuacct/cpu.cfs_quota_us", "300000")
+    _write(fake_host, "cpu,cpuacct/cpu.cfs_period_us", "100000")
+    _write(fake_host, "cpuset/cpuset.cpus", "0-1")
+    _write(fake_host, "memory/memory.limit_in_bytes", str(2 * 1024 ** 3))
+    _write(fake_host, "memory/memory.usage_in_bytes", str(512 * 1024 ** 2))
+
+    limits = own_limits()
+    assert limits.source == "cgroup v1"
+    assert (limits.cpu_quota, limits.cpuset_cpus, limits.effective_cpus) == (3.0, 2, 2.0)
+    assert (limits.memory_limit_gb, limits.memory_usage_gb) == (2.0, 0.5)
+
+
+def test_v1_unlimited(fake_host, monkeypatch):
+    monkeypatch.setattr(cgroups, "_own_cgroup_paths", lambda: {"cpu": "/", "memory": "/"})
+    _write(fake_host, "cpu/cpu.cfs_quota_us", "-1")
+    _write(fake_host, "cpu/cpu.cfs_period_us", "100000")
+    _write(fake_host, "memory/memory.limit_in_bytes", "9223372036854771712")
+
+    limits = own_limits()
+    assert limits.cpu_quota is None
+    assert limits.memory_limit_gb is None
+    assert limits.effective_cpus == 16
+
+
+def test_no_cgroups_is_the_host(fake_host, monkeypatch):
+    monkeypatch.setattr(cgroups, "_own_cgroup_paths", lambda: {})
+    limits = own_limits()
+    assert limits.source == "host"
+    assert limits.effective_cpus == 16
+
+
+def test_docker_limits():
+    nano = limits_from_docker({"HostConfig": {"NanoCpus": 1_500_000_000, "Memory": 8 * 1024 ** 3}}, host_cpus=32)
+    assert (nano.cpu_quota, nano.effective_cpus, nano.memory_limit_gb) == (1.5, 1.5, 8.0)
+
+    cfs = limits_from_docker({"HostConfig": {"CpuQuota": 400000, "CpuPeriod": 100000, "CpusetCpus": "0-5"}}, host_cpus=32)
+    assert (cfs.cpu_quota, cfs.cpuset_cpus, cfs.effective_cpus) == (4.0, 6, 4.0)
+
+    unlimited = limits_from_docker({"HostConfig": {"CpuQuota": -1, "Memory": 0}}, host_cpus=32)
+    assert (unlimited.cpu_quota, unlimited.effective_cpus, unlimited.memory_limit_gb) == (None, 32, None)
@@ -0,0 +1,56 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from routers.compression import CompressionMiddleware, accepted_encodings, choose_encoding
+
+LARGE = "subtitle line\n" * 200
+
+
+def _client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("short")
+
+    @app.get("/large")
+    async def large():
+        return PlainTextResponse(LARGE, headers={"Vary": "Origin"})
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([LARGE, LARGE]), media_type="text/plain")
+
+    @app.get("/precompressed")
+    async def precompressed():
+        return PlainTextResponse(LARGE, headers={"Content-Encoding": "identity"})
+
+    return TestClient(app)
+
+
+def test_negotiation():
+    assert accepted_encodings("gzip;q=0, br;q=0.5, deflate") == {"br", "deflate"}
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip, br;q=0") == "gzip"
+    assert choose_encoding("deflate") is None
+    assert choose_encoding("gzip, br", offered=["gzip"]) == "gzip"
+
+
+def test_only_complete_responses_above_the_threshold_are_compressed():
+    client = _client()
+
+    response = client.get("/large", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Origin, Accept-Encoding"
+    assert response.text == LARGE  # httpx decodes br
+    assert int(response.headers["content-length"]) < len(LARGE)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+    for path in ("/small", "/stream", "/precompressed"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip, br"})
+        assert response.headers.get("content-encoding") in (None, "identity"), path
+
@@ -0,0 +1,38 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import frontend
+
+
+def _client(tmp_path, monkeypatch):
+    (tmp_path / "index.html").write_text("<html>dashboard</html>", encoding="utf-8")
+    (tmp_path / "index.html.gz").write_bytes(b"gzip bytes")
+    (tmp_path / "index.html.br").write_bytes(b"br bytes")
+    monkeypatch.setattr(frontend, "DIST_DIR", str(tmp_path))
+    app = FastAPI()
+    app.include_router(frontend.router)
+    return TestClient(app)
+
+
+def test_precompressed_variant_follows_accept_encoding(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+
+    def fetch(accept):
+        # Headers only: the test bodies aren't real gzip/brotli
+        with client.stream("GET", "/", headers={"Accept-Encoding": accept}) as response:
+            return response.headers.get("content-encoding"), response.headers["content-type"]
+
+    assert fetch("gzip, br") == ("br", "text/html; charset=utf-8")
+    assert fetch("gzip, br;q=0") == ("gzip", "text/html; charset=utf-8")
+    assert fetch("identity") == (None, "text/html; charset=utf-8")
+
+
+def test_index_revalidates_per_variant(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    def status(accept, etag=""):
+        with client.stream("GET", "/", headers={"Accept-Encoding": accept, "If-None-Match": etag}) as response:
+            return response.status_code, response.headers["etag"]
+
+    _, etag = status("gzip")
+    assert status("gzip", etag) == (304, etag)
+    assert status("br", etag)[0] == 200
@@ -0,0 +1,30 @@
+import asyncio
+
+from routers import shared_state, workers
+from routers.hallucinations import CACHE_NAMESPACE, _LEASE_NAME, _list_files, run_scan
+from routers.settings import SubgenSettings
+
+
+def test_human_subtitles_are_not_scanned(tmp_path):
+    for name in ("Movie.en.srt", "Movie.subgen.large-v3.eng.srt"):
+        (tmp_path / name).write_text("1\n00:00:01,000 --> 00:00:02,000\nHello.\n\n", encoding="utf-8")
+
+    items = _list_files(str(tmp_path), {}, SubgenSettings())
+    assert [path for path, *_ in items] == [str(tmp_path / "Movie.subgen.large-v3.eng.srt")]
+    assert len(_list_files(str(tmp_path), {}, SubgenSettings(), only_subgen=False)) == 2
+
+
+def test_scan_stops_when_the_lease_is_taken_over(tmp_path):
+    (tmp_path / "Movie.subgen.large-v3.eng.srt").write_text(
+        "1\n00:00:01,000 --> 00:00:02,000\nThanks for watching!\n\n", encoding="utf-8"
+    )
+    shared_state.set_value("hallucination_report", {"directory": "previous"})
+    shared_state.release_lease(_LEASE_NAME, shared_state.worker_id())
+    assert shared_state.try_acquire_lease(_LEASE_NAME, "other-worker", 600)
+    try:
+        assert asyncio.run(run_scan(str(tmp_path), force=True)) is None
+        assert shared_state.get_value("hallucination_report") == {"directory": "previous"}
+        assert str(tmp_path / "Movie.subgen.large-v3.eng.srt") not in shared_state.get_file_cache(CACHE_NAMESPACE)
+    finally:
+        shared_state.release_lease(_LEASE_NAME, "other-worker")
+        workers.shutdown_process_pool()
@@ -0,0 +1,50 @@
+from routers.hardware import GpuInfo, parse_gpu_output, plan_gpu_placement
+
+
+def test_single_gpu():
+    info = parse_gpu_output("0, NVIDIA GeForce RTX 3090, 24576, 20480, 7\n")
+    assert info["device_type"] == "cuda"
+    assert info["device_name"] == "NVIDIA GeForce RTX 3090"
+    assert (info["total_memory"], info["available_memory"]) == (24.0, 20.0)
+    assert info["gpus"] == [GpuInfo(index=0, name="NVIDIA GeForce RTX 3090", total_memory=24.0, available_memory=20.0, utilization=7.0)]
+
+
+def test_identical_gpus_are_counted():
+    info = parse_gpu_output("0, Tesla T4, 15360, 15000, 0\n1, Tesla T4, 15360, 9000, 55\n")
+    assert info["device_name"] == "2x Tesla T4"
+    assert [g.index for g in info["gpus"]] == [0, 1]
+
+
+def test_mixed_gpus_report_the_largest_card():
+    stdout = (
+        "0, NVIDIA GeForce RTX 3060, 12288, 11000, 3\n"
+        "1, NVIDIA GeForce RTX 4090, 24564, 2048, 98\n"
+    )
+    info = parse_gpu_output(stdout)
+    assert info["device_name"] == "NVIDIA GeForce RTX 3060 + NVIDIA GeForce RTX 4090"
+    # A model can't span cards, so memory is the largest card's, not the sum
+    assert (info["total_memory"], info["available_memory"]) == (24.0, 2.0)
+    assert info["recommendation"].startswith("🦑")
+
+
+def test_unavailable_utilization_and_bad_lines():
+    stdout = (
+        "0, Quadro P2000, 5120, 4096, [N/A]\n"
+        "nvidia-smi has failed because it couldn't communicate with the driver\n"
+        "1, broken\n"
+    )
+    info = parse_gpu_output(stdout)
+    assert len(info["gpus"]) == 1
+    assert info["gpus"][0].utilization is None
+
+
+def test_no_gpus():
+    assert parse_gpu_output("") is None
+    assert parse_gpu_output("No devices were found\n") is None
+
+
+def test_placement_pins_one_instance_per_gpu():
+    gpus = parse_gpu_output("0, A, 24576, 24576, 0\n1, B, 8192, 8192, 0\n")["gpus"]
+    plan = plan_gpu_placement(gpus, "large-v3", "float16")
+    assert [p["cuda_visible_devices"] for p in plan] == ["0", "1"]
+    assert plan[0]["concurrent_transcriptions"] > plan[1]["concurrent_transcriptions"]
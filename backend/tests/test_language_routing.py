@@ -0,0 +1,23 @@
+import asyncio
+
+from routers import language_routing
+
+
+def test_concurrent_detections_are_all_remembered(tmp_path):
+    folders = []
+    for index, tag in enumerate(["ja", "de", "fr", "ko"] * 5):
+        folder = tmp_path / f"Show {index}"
+        folder.mkdir()
+        (folder / f"Ep01.{tag}.srt").write_text("", encoding="utf-8")
+        folders.append((str(folder), tag))
+
+    async def detect_all():
+        return await asyncio.gather(
+            *(language_routing.detect_folder_language(folder, use_logs=False) for folder, _ in folders)
+        )
+
+    assert [r.source for r in asyncio.run(detect_all())] == ["sidecar"] * len(folders)
+
+    remembered = language_routing.cached_folder_languages()
+    assert all(remembered[folder] == tag for folder, tag in folders)
+    assert {r.source for r in asyncio.run(detect_all())} == {"history"}
@@ -0,0 +1,92 @@
+import asyncio
+
+from routers import metrics, shared_state
+
+
+def test_only_the_lease_holder_writes_the_textfile(tmp_path, monkeypatch):
+    path = tmp_path / "subbrainarr.prom"
+    monkeypatch.setattr(metrics, "TEXTFILE_PATH", str(path))
+    monkeypatch.setattr(metrics, "TEXTFILE_INTERVAL_SECONDS", 0.05)
+
+    async def run_loop_briefly():
+        task = asyncio.create_task(metrics.textfile_loop())
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    assert shared_state.try_acquire_lease(metrics._TEXTFILE_LEASE_NAME, "other-worker", 60)
+    asyncio.run(run_loop_briefly())
+    assert not path.exists()
+
+    shared_state.release_lease(metrics._TEXTFILE_LEASE_NAME, "other-worker")
+    asyncio.run(run_loop_briefly())
+    assert "subbrainarr_http_requests" in path.read_text()
+    shared_state.release_lease(metrics._TEXTFILE_LEASE_NAME, shared_state.worker_id())
+
+
+def _sample_registry() -> metrics.Registry:
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("app_requests", "Requests", ("route",)))
+    depth = registry.register(metrics.Gauge("app_queue_depth", "Queued jobs"))
+    latency = registry.register(metrics.Histogram("app_latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    requests.inc(route='/a"b\\c\n')
+    requests.inc(2, route="/x")
+    depth.set(3)
+    for value in (0.05, 0.1, 0.5, 4.25):
+        latency.observe(value)
+    return registry
+
+
+def test_openmetrics_exposition():
+    assert _sample_registry().render(openmetrics=True) == "\n".join([
+        "# HELP app_requests Requests",
+        "# TYPE app_requests counter",
+        'app_requests_total{route="/a\\"b\\\\c\\n"} 1',
+        'app_requests_total{route="/x"} 2',
+        "# HELP app_queue_depth Queued jobs",
+        "# TYPE app_queue_depth gauge",
+        "app_queue_depth 3",
+        "# HELP app_latency_seconds Latency",
+        "# TYPE app_latency_seconds histogram",
+        'app_latency_seconds_bucket{le="0.1"} 2',
+        'app_latency_seconds_bucket{le="1.0"} 3',
+        'app_latency_seconds_bucket{le="+Inf"} 4',
+        "app_latency_seconds_count 4",
+        "app_latency_seconds_sum 4.9",
+        "# EOF",
+    ]) + "\n"
+
+
+def test_prometheus_exposition_types_the_counter_sample():
+    text = _sample_registry().render(openmetrics=False)
+    assert "# TYPE app_requests_total counter\n" in text
+    assert "# HELP app_requests_total Requests\n" in text
+    assert "# EOF" not in text
+    assert text.endswith("app_latency_seconds_sum 4.9\n")
+
+
+def test_label_values_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "_MAX_LABEL_VALUES", 2)
+    counter = metrics.Counter("app_paths", "Paths", ("route",))
+    for route in ("/a", "/b", "/c", "/d", "/a"):
+        counter.inc(route=route)
+    assert counter.values == {("/a",): 2.0, ("/b",): 1.0, ("other",): 2.0}
+
+
+def test_endpoint_negotiates_the_format(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from routers import settings as settings_module
+
+    monkeypatch.setattr(settings_module, "SETTINGS_FILE", str(tmp_path / "settings.json"))
+    app = FastAPI()
+    app.include_router(metrics.router)
+    client = TestClient(app)
+
+    classic = client.get("/metrics")
+    assert classic.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    assert "# EOF" not in classic.text
+
+    openmetrics = client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+    assert openmetrics.headers["content-type"] == metrics.OPENMETRICS_TYPE
+    assert openmetrics.text.endswith("# EOF\n")
@@ -0,0 +1,49 @@
+from routers.postprocess import CleanOptions, clean_cues, process_file
+from routers.subtitles import Cue
+
+
+def _cue(start, end, text):
+    return Cue(start, end, [text])
+
+
+def test_phrase_inside_dialogue_is_kept():
+    cues = [
+        _cue(1.0, 3.0, "ただいま。"),
+        _cue(30.0, 32.0, "じゃあ、おやすみなさい、お母さん。"),
+    ]
+    cleaned, removed = clean_cues(cues, "ja", CleanOptions())
+    assert [c.text for c in cleaned] == ["ただいま。", "じゃあ、おやすみなさい、お母さん。"]
+    assert removed["phrase"] == 0
+
+
+def test_whole_phrase_cue_needs_silence_or_repeat():
+    dialogue = [_cue(1.0, 3.0, "Where were you?"), _cue(3.5, 5.0, "Out.")]
+    in_dialogue = dialogue + [_cue(5.5, 7.0, "Thanks for watching!"), _cue(7.5, 9.0, "Sure.")]
+    cleaned, removed = clean_cues(in_dialogue, "en", CleanOptions(drop_isolated=False))
+    assert removed["phrase"] == 0
+
+    after_silence = dialogue + [_cue(40.0, 42.0, "Thank you for watching!")]
+    cleaned, removed = clean_cues(after_silence, "en", CleanOptions())
+    assert removed["phrase"] == 1
+    assert [c.text for c in cleaned] == ["Where were you?", "Out."]
+
+
+def test_ordinary_speech_is_not_a_default_phrase():
+    cues = [_cue(1.0, 3.0, "Hm."), _cue(30.0, 32.0, "おやすみなさい。"), _cue(60.0, 62.0, "おやすみなさい。")]
+    cleaned, removed = clean_cues(cues, "ja", CleanOptions(collapse_repeats=False, drop_isolated=False))
+    assert removed["phrase"] == 0
+
+
+def test_rewrite_keeps_a_backup(tmp_path):
+    path = tmp_path / "Movie.subgen.medium.eng.srt"
+    original = (
+        "1\n00:00:01,000 --> 00:00:03,000\nWhere were you?\n\n"
+        "2\n00:00:40,000 --> 00:00:42,000\nThank you for watching!\n\n"
+    )
+    path.write_text(original, encoding="utf-8")
+
+    summary = process_file(str(path), "en", CleanOptions())
+
+    assert summary["changed"]
+    assert "watching" not in path.read_text(encoding="utf-8")
+    assert (tmp_path / "Movie.subgen.medium.eng.srt.bak").read_text(encoding="utf-8") == original
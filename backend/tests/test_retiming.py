@@ -0,0 +1,76 @@
+from routers import language_routing, shared_state
+from routers.retiming import RetimeRequest, _collect, normalize_cues, resolve_reading_profile, retime_files
+from routers.settings import SubgenSettings
+from routers.subtitles import Cue
+
+ENGLISH_SRT = (
+    "1\n00:00:05,000 --> 00:00:08,000\nI can't believe you actually came back.\n\n"
+    "2\n00:00:09,000 --> 00:00:12,000\nWhere else would I go?\n\n"
+)
+
+
+def _japanese_folder(tmp_path):
+    folder = tmp_path / "Anime"
+    folder.mkdir()
+    shared_state.put_file_cache("folder_languages", [(str(folder), 0.0, 0, {"language": "ja", "mtime": 0})])
+    return folder
+
+
+def test_translated_subtitle_uses_its_text_language(tmp_path):
+    folder = _japanese_folder(tmp_path)
+    path = folder / "Ep01.subgen.large-v3.eng.srt"
+    path.write_text(ENGLISH_SRT, encoding="utf-8")
+    settings = SubgenSettings(whisper_task="translate", subtitle_language="en")
+
+    items = _collect(RetimeRequest(directories=[str(tmp_path)]), settings)
+    assert items == [(str(path), "en")]
+
+    profiles = {"en": resolve_reading_profile("en", {}), "": resolve_reading_profile(None, {})}
+    [result] = retime_files(items, profiles, dry_run=False)
+
+    assert result["language"] == "en"
+    assert not result["changed"]
+    assert path.read_text(encoding="utf-8") == ENGLISH_SRT
+
+
+def test_untagged_output_follows_the_whisper_task(tmp_path):
+    folder = _japanese_folder(tmp_path)
+    path = str(folder / "Ep01.subgen.srt")
+    folder_languages = language_routing.cached_folder_languages()
+
+    translated = SubgenSettings(whisper_task="translate", subtitle_language="en")
+    transcribed = SubgenSettings(whisper_task="transcribe")
+    assert language_routing.subtitle_text_language(path, folder_languages, translated) == "en"
+    assert language_routing.subtitle_text_language(path, folder_languages, transcribed) == "ja"
+
+
+def test_dialogue_dash_lines_are_kept_apart():
+    cue = Cue(1.0, 4.0, ["- Are you coming?", "- No."])
+    [result], changes = normalize_cues([cue], resolve_reading_profile("en", {}))
+
+    assert result.lines == ["- Are you coming?", "- No."]
+    assert not any(changes.values())
+
+
+def test_only_overlong_lines_are_rewrapped():
+    long_line = "This line is far too long to fit on one line of a subtitle"
+    cue = Cue(1.0, 6.0, ["Short.", long_line])
+    [result], changes = normalize_cues([cue], resolve_reading_profile("en", {}))
+
+    assert result.lines[0] == "Short."
+    assert " ".join(result.lines[1:]) == long_line
+    assert all(len(line) <= 42 for line in result.lines)
+    assert changes["rewrapped"] == 1
+
+
+def test_rewrite_keeps_the_original(tmp_path):
+    path = tmp_path / "Movie.subgen.en.srt"
+    original = "1\n00:00:01,000 --> 00:00:01,200\nThat was a very long sentence to read.\n\n"
+    path.write_text(original, encoding="utf-8")
+    profiles = {"en": resolve_reading_profile("en", {}), "": resolve_reading_profile(None, {})}
+
+    [result] = retime_files([(str(path), "en")], profiles, dry_run=False)
+
+    assert result["changed"]
+    assert (tmp_path / "Movie.subgen.en.srt.bak").read_text(encoding="utf-8") == original
+    assert path.read_text(encoding="utf-8") != original
@@ -0,0 +1,24 @@
+import asyncio
+
+from routers import settings as settings_module
+from routers.route_cache import cached_route
+from routers.settings import modify_settings, settings_version
+
+
+def test_settings_save_misses_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings_module, "SETTINGS_FILE", str(tmp_path / "settings.json"))
+    calls = []
+
+    @cached_route(ttl=60, stale=60, version=settings_version)
+    async def handler():
+        calls.append(1)
+        return settings_module.load_settings().whisper_model
+
+    async def scenario():
+        first = await handler()
+        again = await handler()
+        modify_settings(lambda s: setattr(s, "whisper_model", "medium"))
+        return first, again, await handler()
+
+    assert asyncio.run(scenario()) == ("large-v3", "large-v3", "medium")
+    assert len(calls) == 2
@@ -0,0 +1,92 @@
+import yaml
+
+from routers.hardware import GpuInfo
+from routers.settings import (
+    LanguageConfig,
+    SubgenSettings,
+    _group_tuned_languages,
+    generate_sharded_compose_snippet,
+    plan_subgen_shards,
+)
+from routers.vram_model import max_concurrency
+
+ASIAN = LanguageConfig(patience=2.0, length_penalty=1.2, beam_size=7)
+EUROPEAN = LanguageConfig(patience=1.0, length_penalty=1.0, beam_size=5)
+NEAR_EUROPEAN = LanguageConfig(patience=1.1, length_penalty=1.0, beam_size=5)
+
+
+def _settings(**configs):
+    return SubgenSettings(language_configs=configs)
+
+
+def test_identical_tunings_share_a_group():
+    settings = _settings(ja=ASIAN, ko=ASIAN, zh=ASIAN, de=EUROPEAN, fr=EUROPEAN)
+
+    groups = _group_tuned_languages(settings, max_groups=4)
+    assert [(config, codes) for config, codes in groups] == [(ASIAN, ["ja", "ko", "zh"]), (EUROPEAN, ["de", "fr"])]
+
+
+def test_surplus_tunings_fold_into_the_nearest_group():
+    settings = _settings(ja=ASIAN, ko=ASIAN, de=EUROPEAN, fr=EUROPEAN, es=NEAR_EUROPEAN)
+
+    groups = _group_tuned_languages(settings, max_groups=2)
+    # es is the smallest group and closest to the European tuning, so it takes that tuning
+    assert groups == [(EUROPEAN, ["de", "es", "fr"]), (ASIAN, ["ja", "ko"])]
+
+
+def test_plan_routes_every_tuned_language_and_keeps_a_default():
+    settings = _settings(ja=ASIAN, ko=ASIAN, de=EUROPEAN)
+
+    plan = plan_subgen_shards(settings, shard_count=3)
+    assert [shard.name for shard in plan.shards] == ["subgen", "subgen-ja-ko", "subgen-de"]
+    assert [shard.host_port for shard in plan.shards] == [9000, 9001, 9002]
+    assert plan.routing_table == {"ja": "http://subgen-ja-ko:9000", "ko": "http://subgen-ja-ko:9000",
+                                  "de": "http://subgen-de:9000"}
+    assert plan.default_url == "http://subgen:9000"
+    assert plan.shards[0].subgen_kwargs == repr({"beam_size": 5})
+    assert "'patience': 2.0" in plan.shards[1].subgen_kwargs
+
+
+def test_single_shard_warns_nothing_without_tunings():
+    assert plan_subgen_shards(_settings(), shard_count=1).warnings == []
+    assert plan_subgen_shards(_settings(), shard_count=2).warnings
+
+
+def test_shards_are_spread_over_gpus_by_vram_share():
+    settings = _settings(ja=ASIAN, de=EUROPEAN, fr=NEAR_EUROPEAN)
+    gpus = [
+        GpuInfo(index=0, name="RTX 4090", total_memory=24.0, available_memory=24.0),
+        GpuInfo(index=1, name="RTX 3060", total_memory=12.0, available_memory=12.0),
+    ]
+
+    plan = plan_subgen_shards(settings, shard_count=3, gpus=gpus)
+    placement = [shard.gpu_index for shard in plan.shards]
+    # The 24 GB card takes two shards (12 GB each), the 12 GB card one
+    assert sorted(placement) == [0, 0, 1]
+    assert plan.vram_budget_gb == 36.0
+    for shard in plan.shards:
+        assert shard.concurrent_transcriptions == max(1, max_concurrency(12.0, "large-v3", "float16", 5))
+    assert not any("idle" in warning for warning in plan.warnings)
+
+    plan = plan_subgen_shards(settings, shard_count=1, gpus=gpus)
+    assert any("GPU 1 left idle" in warning for warning in plan.warnings)
+
+
+def test_sharded_compose_is_valid_yaml_with_one_service_per_shard():
+    settings = _settings(ja=ASIAN, de=EUROPEAN)
+    settings.monitor = True
+    settings.transcribe_folders = ["/media/anime"]
+    gpus = [GpuInfo(index=i, name="GPU", total_memory=16.0, available_memory=16.0) for i in range(3)]
+    plan = plan_subgen_shards(settings, shard_count=3, gpus=gpus)
+
+    services = yaml.safe_load(generate_sharded_compose_snippet(settings, plan))["services"]
+    assert list(services) == ["subgen", "subgen-de", "subgen-ja"]
+    for shard in plan.shards:
+        service = services[shard.name]
+        env = dict(item.split("=", 1) for item in service["environment"])
+        assert service["ports"] == [f"{shard.host_port}:9000"]
+        assert env["CUDA_VISIBLE_DEVICES"] == str(shard.gpu_index)
+        assert env["SUBGEN_KWARGS"] == shard.subgen_kwargs
+        assert env["CONCURRENT_TRANSCRIPTIONS"] == str(shard.concurrent_transcriptions)
+        # Shards never monitor folders: SubBrainArr routes them instead
+        assert "MONITOR" not in env
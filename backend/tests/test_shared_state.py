@@ -0,0 +1,71 @@
+import asyncio
+import multiprocessing
+import time
+
+from routers import settings as settings_module
+from routers import shared_state
+
+WORKERS = 4
+UPDATES_PER_WORKER = 10
+
+
+def _append_hosts(settings_file, worker):
+    # Runs in a spawned process, like a second uvicorn worker
+    settings_module.SETTINGS_FILE = settings_file
+    for index in range(UPDATES_PER_WORKER):
+        settings_module.modify_settings(lambda s: s.discovery_hosts.append(f"{worker}-{index}"))
+
+
+def test_concurrent_modify_settings_loses_no_update(tmp_path, monkeypatch):
+    settings_file = str(tmp_path / "settings.json")
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_append_hosts, args=(settings_file, worker)) for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    monkeypatch.setattr(settings_module, "SETTINGS_FILE", settings_file)
+    hosts = settings_module.load_settings().discovery_hosts
+    assert sorted(hosts) == sorted(f"{w}-{i}" for w in range(WORKERS) for i in range(UPDATES_PER_WORKER))
+
+
+def test_lease_moves_only_after_it_lapses():
+    name = "test_lease"
+    assert shared_state.try_acquire_lease(name, "worker-a", 0.2)
+    assert not shared_state.try_acquire_lease(name, "worker-b", 0.2)
+    assert shared_state.try_acquire_lease(name, "worker-a", 0.2)  # Renewal
+
+    time.sleep(0.3)
+    assert shared_state.try_acquire_lease(name, "worker-b", 60)
+    assert not shared_state.try_acquire_lease(name, "worker-a", 60)
+
+    shared_state.release_lease(name, "worker-a")  # Not the owner: no effect
+    assert not shared_state.try_acquire_lease(name, "worker-a", 60)
+    shared_state.release_lease(name, "worker-b")
+    assert shared_state.try_acquire_lease(name, "worker-a", 60)
+    shared_state.release_lease(name, "worker-a")
+
+
+def test_relay_delivers_new_events_in_order():
+    shared_state.publish("broadcast", {"type": "before_start"})
+    received = []
+    stop = asyncio.Event()
+
+    def handler(channel, payload):
+        if payload.get("type") == "boom":
+            raise RuntimeError("handler failure must not stop the relay")
+        received.append((channel, payload))
+        if payload.get("type") == "last":
+            stop.set()
+
+    async def scenario():
+        relay = asyncio.create_task(shared_state.tail_events(handler, poll_interval=0.01, stop=stop))
+        await asyncio.sleep(0.05)
+        for payload in ({"type": "first"}, {"type": "boom"}, {"type": "last"}):
+            await shared_state.publish_async("broadcast", payload)
+        await asyncio.wait_for(relay, 5)
+
+    asyncio.run(scenario())
+    assert received == [("broadcast", {"type": "first"}), ("broadcast", {"type": "last"})]
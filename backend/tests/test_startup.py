@@ -0,0 +1,51 @@
+"""Cold-start budget: the Docker healthcheck starts probing 5 s after launch."""
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 3000))
+
+_SCRIPT = """
+import json, sys
+import main
+from fastapi.testclient import TestClient
+from routers import diagnostics
+
+docker_at_import = "docker" in sys.modules
+with TestClient(main.app) as client:
+    client.get("/health")
+    client.get("/api/hardware/detect")  # Forces the first hardware sample
+    docker_after_first_sample = "docker" in sys.modules
+report = diagnostics.startup_report()
+report["docker_at_import"] = docker_at_import
+report["docker_after_first_sample"] = docker_after_first_sample
+print(json.dumps(report))
+"""
+
+
+def _startup_report(tmp_path):
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR, "STATE_DB_FILE": str(tmp_path / "state.db")}
+    result = subprocess.run(
+        [sys.executable, "-c", _SCRIPT], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_startup_within_budget(tmp_path):
+    report = _startup_report(tmp_path)
+
+    assert report["imports_done_ms"] is not None
+    assert report["startup_complete_ms"] is not None
+    assert report["first_request_path"] == "/health"
+    assert report["imports_done_ms"] <= report["startup_complete_ms"] <= report["first_request_ms"]
+    assert report["startup_complete_ms"] < BUDGET_MS, report["router_imports_ms"]
+
+
+def test_docker_sdk_stays_out_of_startup_and_first_sample(tmp_path):
+    report = _startup_report(tmp_path)
+
+    assert not report["docker_at_import"]
+    assert not report["docker_after_first_sample"]
@@ -0,0 +1,14 @@
+from routers.subtitle_analysis import select_language_files
+
+
+def test_only_subgen_output_is_measured():
+    folder_languages = {"/media/Anime": "ja"}
+    paths = [
+        "/media/Anime/Ep01.ja.srt",
+        "/media/Anime/Ep01.subgen.large-v3.jpn.srt",
+        "/media/Anime/Ep02.subgen.large-v3.jpn.srt",
+    ]
+
+    assert select_language_files(paths, "ja", folder_languages) == paths[1:]
+    assert select_language_files(paths, "ja", folder_languages, limit=1) == paths[1:2]
+    assert select_language_files(paths, "ja", folder_languages, only_subgen=False) == paths
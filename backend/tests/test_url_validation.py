@@ -0,0 +1,100 @@
+import asyncio
+import socket
+import types
+
+import pytest
+
+from routers import url_validation
+from routers.url_validation import (
+    DNS_CACHE_TTL_SECONDS,
+    DNS_NEGATIVE_TTL_SECONDS,
+    validate_subgen_url,
+    validate_subgen_url_async,
+)
+
+
+class FakeResolver:
+    """getaddrinfo stand-in that counts lookups; answers map host -> IP or None (NXDOMAIN)."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.lookups = 0
+
+    def __call__(self, host, port, proto=0):
+        self.lookups += 1
+        address = self.answers[host]
+        if address is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, proto, "", (address, port))]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(url_validation, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(url_validation, "_dns_cache", {})
+    return now
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    fake = FakeResolver({"subgen.lan": "192.168.1.20", "metadata.evil": "169.254.169.254", "gone.lan": None})
+    monkeypatch.setattr(socket, "getaddrinfo", fake)
+    return fake
+
+
+def test_resolved_host_is_cached_until_ttl(clock, resolver):
+    assert validate_subgen_url("http://subgen.lan:9000/") == (True, "http://subgen.lan:9000")
+    clock[0] += DNS_CACHE_TTL_SECONDS - 1
+    validate_subgen_url("http://subgen.lan:9000")
+    assert resolver.lookups == 1
+
+    clock[0] += 2
+    validate_subgen_url("http://subgen.lan:9000")
+    assert resolver.lookups == 2
+
+
+def test_cache_is_per_port(clock, resolver):
+    validate_subgen_url("http://subgen.lan:9000")
+    validate_subgen_url("http://subgen.lan:9001")
+    assert resolver.lookups == 2
+
+
+def test_blocked_host_stays_blocked_from_cache(clock, resolver):
+    assert validate_subgen_url("http://metadata.evil") == (False, "URL resolves to blocked address range")
+    assert validate_subgen_url("http://metadata.evil") == (False, "URL resolves to blocked address range")
+    assert resolver.lookups == 1
+
+
+def test_unresolvable_host_expires_sooner(clock, resolver):
+    assert validate_subgen_url("http://gone.lan")[0]
+    clock[0] += DNS_NEGATIVE_TTL_SECONDS - 1
+    validate_subgen_url("http://gone.lan")
+    assert resolver.lookups == 1
+
+    # Fixed DNS is picked up after the negative TTL, long before the positive one
+    resolver.answers["gone.lan"] = "169.254.0.1"
+    clock[0] += 2
+    assert validate_subgen_url("http://gone.lan") == (False, "URL resolves to blocked address range")
+    assert resolver.lookups == 2
+
+
+def test_ip_literals_and_docker_names_skip_dns(clock, resolver):
+    assert validate_subgen_url("http://10.0.0.5:9000")[0]
+    assert not validate_subgen_url("http://127.0.0.1:9000")[0]
+    assert validate_subgen_url("http://subgen:9000")[0]
+    assert resolver.lookups == 0
+
+
+def test_async_shares_the_cache(clock, resolver, monkeypatch):
+    async def loop_getaddrinfo(self, host, port, proto=0):
+        return resolver(host, port, proto)
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", loop_getaddrinfo)
+    assert asyncio.run(validate_subgen_url_async("http://subgen.lan:9000")) == (True, "http://subgen.lan:9000")
+    validate_subgen_url("http://subgen.lan:9000")
+    assert resolver.lookups == 1
+
+    clock[0] += DNS_CACHE_TTL_SECONDS + 1
+    asyncio.run(validate_subgen_url_async("http://subgen.lan:9000"))
+    assert resolver.lookups == 2
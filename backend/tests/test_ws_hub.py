@@ -0,0 +1,174 @@
+import asyncio
+import json
+
+from routers import ws_hub, ws_topics
+from routers.ws_hub import WebSocketHub, hub
+
+
+class FakeSocket:
+    def __init__(self, stuck: bool = False):
+        self.stuck = stuck
+        self.sent = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.stuck:
+            await asyncio.sleep(3600)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_broadcast_reaches_everyone_publish_only_subscribers():
+    async def scenario():
+        local = WebSocketHub()
+        a, b = FakeSocket(), FakeSocket()
+        client_a = await local.connect(a)
+        await local.connect(b)
+        local.subscribe(client_a, "telemetry", {})
+
+        local.broadcast_local({"type": "hello"})
+        local.publish("telemetry", {"type": "telemetry"})
+        local.publish("health", {"type": "health"})
+        await _settle()
+        return a.sent, b.sent
+
+    a_sent, b_sent = asyncio.run(scenario())
+    assert a_sent == [{"type": "hello"}, {"type": "telemetry"}]
+    assert b_sent == [{"type": "hello"}]
+
+
+def test_disconnect_stops_the_writer_after_sends():
+    async def scenario():
+        local = WebSocketHub()
+        client = await local.connect(FakeSocket())
+        local.broadcast_local({"n": 1})
+        local.broadcast_local({"n": 2})
+        await _settle()
+        local.disconnect(client)
+        await _settle()
+        # Checked inside the loop: asyncio.run cancels leftover tasks again on exit
+        return client.writer.cancelled()
+
+    assert asyncio.run(scenario())
+
+
+def test_lagging_client_skips_lossy_then_drops_oldest(monkeypatch):
+    monkeypatch.setattr(ws_hub, "QUEUE_SIZE", 4)
+
+    async def scenario():
+        local = WebSocketHub()
+        client = await local.connect(FakeSocket(stuck=True))
+        for n in range(2):
+            local.broadcast_local({"n": n})
+        local.broadcast_local({"n": "sample"}, lossy=True)  # half full: skipped
+        for n in range(2, 7):
+            local.broadcast_local({"n": n})
+        queued = [json.loads(client.queue.get_nowait()) for _ in range(client.queue.qsize())]
+        local.disconnect(client)
+        return queued, client.skipped
+
+    queued, skipped = asyncio.run(scenario())
+    # The writer never got a turn: one sample skipped, then 0-2 made room
+    assert queued == [{"n": 3}, {"n": 4}, {"n": 5}, {"n": 6}]
+    assert skipped == 4
+
+
+def test_stuck_client_is_evicted_without_delaying_others(monkeypatch):
+    monkeypatch.setattr(ws_hub, "SEND_TIMEOUT_SECONDS", 0.05)
+
+    async def scenario():
+        local = WebSocketHub()
+        stuck, healthy = FakeSocket(stuck=True), FakeSocket()
+        stuck_client = await local.connect(stuck)
+        await local.connect(healthy)
+        local.subscribe(stuck_client, "logs:subgen", {"container": "subgen"})
+        idle = []
+        local.on_idle = idle.append
+
+        local.broadcast_local({"type": "hello"})
+        await _settle()
+        delivered_at_once = list(healthy.sent)
+        await asyncio.sleep(0.2)
+        return local, stuck, delivered_at_once, idle
+
+    local, stuck, delivered_at_once, idle = asyncio.run(scenario())
+    assert delivered_at_once == [{"type": "hello"}]
+    assert len(local.clients) == 1
+    assert local.evicted == 1
+    assert stuck.close_code == 1013
+    # Its subscriptions went with it, so the producer can stop
+    assert idle == ["logs:subgen"]
+
+
+def test_topic_routing(monkeypatch):
+    def fake_follow_logs(container_names, loop, lines, state):
+        for line in ("INFO: started", "ERROR: CUDA out of memory", "INFO: done"):
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    monkeypatch.setattr(ws_topics, "_follow_logs", fake_follow_logs)
+    monkeypatch.setattr(ws_topics, "_LOG_BATCH_SECONDS", 0.01)
+
+    async def scenario():
+        everything, errors, other = FakeSocket(), FakeSocket(), FakeSocket()
+        clients = [await hub.connect(s) for s in (everything, errors, other)]
+        try:
+            replies = [
+                await ws_topics.handle_message(clients[0], json.dumps({"action": "subscribe", "topic": "logs"})),
+                await ws_topics.handle_message(clients[1], json.dumps(
+                    {"action": "subscribe", "topic": "logs", "params": {"container": "subgen", "level": "error"}}
+                )),
+                await ws_topics.handle_message(clients[2], json.dumps({"action": "subscribe", "topic": "health"})),
+            ]
+            for _ in range(500):
+                if errors.sent and errors.sent[-1]["type"] == "log_ended":
+                    break
+                await asyncio.sleep(0.01)
+            return replies, everything.sent, errors.sent, other.sent
+        finally:
+            for client in clients:
+                hub.disconnect(client)
+
+    replies, everything, errors, other = asyncio.run(scenario())
+    assert replies[0] == {"type": "subscribed", "topic": "logs:subgen", "params": {"container": "subgen", "level": None}}
+    assert replies[1]["params"]["level"] == "ERROR"
+    assert replies[2] == {"type": "subscribed", "topic": "health", "params": {}}
+
+    assert everything[0]["lines"] == ["INFO: started", "ERROR: CUDA out of memory", "INFO: done"]
+    assert errors[0]["lines"] == ["ERROR: CUDA out of memory"]
+    assert everything[-1] == errors[-1] == {"type": "log_ended", "container": "subgen"}
+    assert other == []
+
+
+def test_invalid_messages():
+    async def scenario():
+        client = await hub.connect(FakeSocket())
+        try:
+            return [
+                await ws_topics.handle_message(client, "ping"),
+                await ws_topics.handle_message(client, json.dumps({"action": "subscribe", "topic": "nope"})),
+                await ws_topics.handle_message(client, json.dumps({"action": "subscribe", "topic": "logs", "params": [1]})),
+                await ws_topics.handle_message(client, json.dumps(
+                    {"action": "subscribe", "topic": "logs", "params": {"container": "postgres"}}
+                )),
+                await ws_topics.handle_message(client, json.dumps({"action": "subscriptions"})),
+            ]
+        finally:
+            hub.disconnect(client)
+
+    pong, unknown, not_object, bad_container, subscriptions = asyncio.run(scenario())
+    assert pong["type"] == "pong"
+    assert unknown == {"type": "error", "action": "subscribe", "message": "Unknown topic: nope"}
+    assert not_object["message"] == "params must be an object"
+    assert bad_container["type"] == "error"
+    assert subscriptions == {"type": "subscriptions", "topics": {}}